@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+check_dependencies.py の性能測定
+テスト用ローカルサーバー（fixture_server.py）を別プロセスで起動し、
+50・500・5000パッケージの環境を想定したレポート作成の所要時間、
+1パッケージあたりのリクエスト数、ピークメモリ（tracemalloc）を測定します。
+
+ホストごとの送信間隔の制限は既定では無効にし、チェック処理そのものを測定します
+（--rate で本番と同じような制限をかけた場合も測定できます）。
+
+    python benchmark_check_dependencies.py
+    python benchmark_check_dependencies.py --sizes 50 500 --latency 0.02 --error-rate 0.01
+"""
+
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import tracemalloc
+import subprocess
+from pathlib import Path
+
+import requests
+
+import check_dependencies
+from vuln_index import VulnerabilityIndex
+from report_writer import ReportWriter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = (50, 500, 5000)
+PACKAGE_NAME = "bench-pkg-{:05d}"
+ROUTES = ("pypi", "project", "pypistats", "safety_db")
+
+
+def start_server(count, latency=0.0, jitter=0.0, error_rate=0.0):
+    """テスト用サーバーを別プロセスで起動し、(プロセス, ベースURL) を返す
+
+    パッケージ名は並べずに数と書式で渡します（5000件の名前はWindowsのコマンドラインの上限を超えるため）。
+    """
+    command = [sys.executable, str(Path(__file__).parent / "fixture_server.py"), "--port", "0",
+               "--latency", str(latency), "--jitter", str(jitter), "--error-rate", str(error_rate),
+               "--count", str(count), "--name-pattern", PACKAGE_NAME]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True, encoding="utf-8")
+    line = process.stdout.readline()
+    if "http://" not in line:
+        process.kill()
+        raise RuntimeError(f"テスト用サーバーを起動できませんでした: {line}")
+    return process, line[line.index("http://"):].strip()
+
+
+def server_stats(base_url):
+    """サーバーが受け付けたリクエスト数"""
+    return requests.get(base_url + "/__stats", timeout=10).json()
+
+
+def scan(size, workers, directory):
+    """Safety DBの取得からレポートの書き込みまでを1回実行"""
+    packages = {PACKAGE_NAME.format(i): "1.0.0" for i in range(size)}
+    safety_db = check_dependencies.get_safety_db()
+    vuln_index = VulnerabilityIndex.build(safety_db)
+    writer = ReportWriter(str(Path(directory) / f"report_{size}.json"), str(Path(directory) / f"report_{size}.html"))
+    return check_dependencies.generate_report(packages, {}, vuln_index, max_workers=workers, writer=writer)
+
+
+def run_scan(size, base_url, workers, directory, measure_memory=True):
+    """1回分のレポート作成を測定
+
+    tracemallocは処理を大きく遅くするため、所要時間とピークメモリは別々の実行で測定します。
+    """
+    before = server_stats(base_url)
+    start = time.perf_counter()
+    report = scan(size, workers, directory)
+    elapsed = time.perf_counter() - start
+    after = server_stats(base_url)
+
+    peak = None
+    if measure_memory:
+        tracemalloc.start()
+        scan(size, workers, directory)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    requests_made = sum(after[route] - before[route] for route in ROUTES)
+    return {
+        "packages": size,
+        "wall_time": round(elapsed, 3),
+        "requests": requests_made,
+        "requests_per_package": round(requests_made / size, 2),
+        "errors": after["errors"] - before["errors"],
+        "peak_memory_mb": round(peak / (1024 * 1024), 2) if peak is not None else None,
+        "vulnerable_packages": report["summary"]["vulnerable_count"],
+    }
+
+
+def main(argv=None):
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description="check_dependencies.py の性能を測定します")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="パッケージ数")
+    parser.add_argument("--workers", type=int, default=check_dependencies.MAX_WORKERS, help="並列数")
+    parser.add_argument("--latency", type=float, default=0.0, help="サーバーの応答遅延（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="応答遅延のばらつき（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="サーバーが503を返す割合")
+    parser.add_argument("--rate", type=float, default=0.0,
+                        help="1秒あたりの最大リクエスト数（0は制限なし）")
+    parser.add_argument("--no-memory", action="store_true", help="ピークメモリを測定しない（実行が1回で済む）")
+    parser.add_argument("--output", help="結果をJSONで保存するファイル")
+    args = parser.parse_args(argv)
+
+    # 1パッケージごとのログは測定の妨げになるため警告以上のみ出力する
+    logging.getLogger().setLevel(logging.WARNING)
+
+    process, base_url = start_server(max(args.sizes), args.latency, args.jitter, args.error_rate)
+    try:
+        check_dependencies.configure_endpoints(base_url, base_url, base_url + "/safety-db/insecure_full.json")
+        check_dependencies.configure_cache(None)
+        check_dependencies.configure_rate_limiter({}, default_rate=args.rate if args.rate > 0 else float("inf"))
+
+        results = []
+        with tempfile.TemporaryDirectory() as directory:
+            for size in args.sizes:
+                result = run_scan(size, base_url, args.workers, directory, not args.no_memory)
+                results.append(result)
+                memory = f"{result['peak_memory_mb']:>7.2f}MB" if result["peak_memory_mb"] is not None else "-"
+                print(f"{result['packages']:>6}パッケージ: {result['wall_time']:>8.2f}秒  "
+                      f"{result['requests_per_package']:>5.2f}リクエスト/パッケージ  "
+                      f"ピークメモリ {memory}  エラー {result['errors']}件", flush=True)
+    finally:
+        process.terminate()
+        process.wait()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
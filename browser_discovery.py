@@ -0,0 +1,387 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Chrome/Chromiumの検出
+PATHと既知のインストール先（Google Chrome・Chromium・Flatpak・snap など）からブラウザを探し、
+バージョンはブラウザを起動せずにディスク上の情報から読み取ります。
+
+- Windows: Application フォルダ内のバージョン名のフォルダ（なければレジストリのBLBeacon）
+- macOS: アプリケーションバンドルの Info.plist
+- Linux: snapの meta/snap.yaml、Flatpakの appdata、dpkgのパッケージ情報
+
+結果は実行ファイルのパス・サイズ・更新日時をキーにしてキャッシュし、
+セットアップ（environment_probe.py）とアプリの起動時で共有します。
+ブラウザが更新されると更新日時が変わるため、自動的に読み直されます。
+
+    python browser_discovery.py          # 見つかったブラウザを表示
+    python browser_discovery.py --all    # 候補をすべて表示
+"""
+
+import os
+import re
+import sys
+import json
+import shutil
+import logging
+import argparse
+import platform
+import threading
+import subprocess
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = Path(__file__).parent / ".browser_cache.json"
+VERSION_PATTERN = re.compile(r"^\d+(\.\d+){1,3}$")
+
+# PATHから探すコマンド名
+PATH_COMMANDS = {
+    "Windows": (("Google Chrome", "chrome"), ("Chromium", "chromium")),
+    "Darwin": (("Google Chrome", "google-chrome"), ("Chromium", "chromium")),
+    "Linux": (
+        ("Google Chrome", "google-chrome"),
+        ("Google Chrome", "google-chrome-stable"),
+        ("Google Chrome", "google-chrome-beta"),
+        ("Chromium", "chromium"),
+        ("Chromium", "chromium-browser"),
+        ("Google Chrome", "chrome"),
+    ),
+}
+
+# インストール先とdpkgのパッケージ名（Linux）
+DPKG_PACKAGES = (
+    ("/opt/google/chrome-beta/", ("google-chrome-beta",)),
+    ("/opt/google/chrome-unstable/", ("google-chrome-unstable",)),
+    ("/opt/google/chrome/", ("google-chrome-stable",)),
+    ("chromium", ("chromium", "chromium-browser")),
+)
+
+
+def _windows_candidates():
+    roots = [os.environ.get("PROGRAMFILES", "C:\\Program Files"),
+             os.environ.get("PROGRAMFILES(X86)", "C:\\Program Files (x86)"),
+             os.environ.get("LOCALAPPDATA", "")]
+    for root in roots:
+        if not root:
+            continue
+        yield "Google Chrome", os.path.join(root, "Google\\Chrome\\Application\\chrome.exe")
+        yield "Google Chrome Beta", os.path.join(root, "Google\\Chrome Beta\\Application\\chrome.exe")
+        yield "Chromium", os.path.join(root, "Chromium\\Application\\chrome.exe")
+    path = _windows_app_path()
+    if path:
+        yield "Google Chrome", path
+
+
+def _windows_app_path():
+    """レジストリの App Paths に登録された chrome.exe"""
+    try:
+        import winreg
+    except ImportError:
+        return None
+    for hive in (winreg.HKEY_CURRENT_USER, winreg.HKEY_LOCAL_MACHINE):
+        try:
+            with winreg.OpenKey(hive, r"SOFTWARE\Microsoft\Windows\CurrentVersion\App Paths\chrome.exe") as key:
+                return winreg.QueryValueEx(key, "")[0]
+        except OSError:
+            continue
+    return None
+
+
+def _mac_candidates():
+    for root in ("/Applications", os.path.expanduser("~/Applications")):
+        yield "Google Chrome", os.path.join(root, "Google Chrome.app/Contents/MacOS/Google Chrome")
+        yield "Google Chrome Beta", os.path.join(root, "Google Chrome Beta.app/Contents/MacOS/Google Chrome Beta")
+        yield "Chromium", os.path.join(root, "Chromium.app/Contents/MacOS/Chromium")
+
+
+def _linux_candidates():
+    yield "Google Chrome", "/opt/google/chrome/chrome"
+    yield "Google Chrome Beta", "/opt/google/chrome-beta/chrome"
+    yield "Chromium", "/usr/lib/chromium/chromium"
+    yield "Chromium", "/usr/lib/chromium-browser/chromium-browser"
+    yield "Chromium", "/usr/lib64/chromium-browser/chromium-browser"
+    yield "Chromium", "/snap/bin/chromium"
+    for root in ("/var/lib/flatpak", os.path.expanduser("~/.local/share/flatpak")):
+        yield "Google Chrome", os.path.join(root, "exports/bin/com.google.Chrome")
+        yield "Chromium", os.path.join(root, "exports/bin/org.chromium.Chromium")
+
+
+def candidates(system=None):
+    """(ブラウザ名, 実行ファイルのパス) の候補を優先順に返す（重複は除く）"""
+    system = system or platform.system()
+    seen = set()
+    found = []
+
+    def add(name, path):
+        if path and path not in seen:
+            seen.add(path)
+            found.append((name, path))
+
+    for name, command in PATH_COMMANDS.get(system, PATH_COMMANDS["Linux"]):
+        add(name, shutil.which(command))
+    generator = {"Windows": _windows_candidates, "Darwin": _mac_candidates}.get(system, _linux_candidates)
+    for name, path in generator():
+        add(name, path)
+    return found
+
+
+def _stat_key(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def fingerprint(system=None):
+    """候補のパスと更新日時（ブラウザのインストール・更新の検出用）"""
+    return {path: _stat_key(path) for _, path in candidates(system)}
+
+
+def _version_from_windows_directory(path):
+    """Application フォルダ内のバージョン名のフォルダ（更新前のバージョンが残っている場合は新しい方）"""
+    directory = os.path.dirname(path)
+    try:
+        names = [name for name in os.listdir(directory) if VERSION_PATTERN.match(name)
+                 and os.path.isdir(os.path.join(directory, name))]
+    except OSError:
+        return None
+    if not names:
+        return None
+    return max(names, key=lambda name: tuple(int(part) for part in name.split(".")))
+
+
+def _version_from_windows_registry():
+    try:
+        import winreg
+        with winreg.OpenKey(winreg.HKEY_CURRENT_USER, r"Software\Google\Chrome\BLBeacon") as key:
+            return winreg.QueryValueEx(key, "version")[0]
+    except (ImportError, OSError):
+        return None
+
+
+def _version_from_plist(path):
+    """macOSのアプリケーションバンドルの Info.plist"""
+    import plistlib
+    marker = ".app/Contents/MacOS/"
+    if marker not in path:
+        return None
+    info = path[:path.index(marker)] + ".app/Contents/Info.plist"
+    try:
+        with open(info, "rb") as f:
+            return plistlib.load(f).get("CFBundleShortVersionString")
+    except (OSError, ValueError):
+        return None
+
+
+def _version_from_snap(path):
+    """snapの meta/snap.yaml"""
+    if not path.startswith("/snap/"):
+        return None
+    name = os.path.basename(path)
+    try:
+        with open(f"/snap/{name}/current/meta/snap.yaml", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("version:"):
+                    return line.split(":", 1)[1].strip().strip("'\"")
+    except OSError:
+        return None
+    return None
+
+
+def _version_from_flatpak(path):
+    """Flatpakの appdata（metainfo）の最新リリース"""
+    if "/flatpak/exports/bin/" not in path:
+        return None
+    app_id = os.path.basename(path)
+    root = path[:path.index("/exports/bin/")]
+    for directory in ("metainfo", "appdata"):
+        info = os.path.join(root, "app", app_id, "current", "active", "files", "share", directory,
+                            f"{app_id}.metainfo.xml" if directory == "metainfo" else f"{app_id}.appdata.xml")
+        try:
+            with open(info, "r", encoding="utf-8") as f:
+                match = re.search(r'<release[^>]*\sversion="([^"]+)"', f.read())
+        except OSError:
+            continue
+        if match:
+            return match.group(1)
+    return None
+
+
+def _version_from_dpkg(path, status_path="/var/lib/dpkg/status"):
+    """dpkgのパッケージ情報（実行ファイルのパスに対応するパッケージのバージョン）"""
+    real = os.path.realpath(path)
+    wanted = next((packages for marker, packages in DPKG_PACKAGES if marker in real), None)
+    if not wanted:
+        return None
+    try:
+        with open(status_path, "r", encoding="utf-8", errors="replace") as f:
+            package = None
+            for line in f:
+                if line.startswith("Package: "):
+                    package = line[9:].strip()
+                elif line.startswith("Version: ") and package in wanted:
+                    # 例: 120.0.6099.109-1、chromium の場合は 120.0.6099.109-1~deb12u1
+                    return re.split(r"[-~]", line[9:].strip().split(":")[-1], 1)[0]
+    except OSError:
+        return None
+    return None
+
+
+def _version_from_launch(path):
+    """ブラウザを起動してバージョンを取得（ディスク上の情報で取得できない場合のみ）"""
+    try:
+        result = subprocess.run([path, "--version"], check=True, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, text=True, timeout=30)
+        return result.stdout.strip().split()[-1]
+    except Exception as e:
+        logger.warning(f"Chromeバージョンの取得に失敗しました: {e}")
+        return None
+
+
+def read_version(path, system=None, allow_launch=False):
+    """(バージョン, 取得方法) を返す"""
+    system = system or platform.system()
+    if system == "Windows":
+        readers = (("directory", _version_from_windows_directory),
+                   ("registry", lambda _: _version_from_windows_registry()))
+    elif system == "Darwin":
+        readers = (("plist", _version_from_plist),)
+    else:
+        readers = (("snap", _version_from_snap), ("flatpak", _version_from_flatpak), ("dpkg", _version_from_dpkg))
+    for source, reader in readers:
+        try:
+            version = reader(path)
+        except Exception as e:
+            logger.debug(f"{source}からバージョンを取得できませんでした: {e}")
+            version = None
+        if version:
+            return version, source
+    if allow_launch:
+        version = _version_from_launch(path)
+        if version:
+            return version, "launch"
+    return None, None
+
+
+def major_version(version):
+    """メジャーバージョン（ChromeDriverの選択用）"""
+    try:
+        return int(str(version).split(".", 1)[0])
+    except (TypeError, ValueError):
+        return None
+
+
+class BrowserCache:
+    """実行ファイルのパスごとのバージョン（version_key が変わったら読み直す）"""
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self._entries = {}
+        self._lock = threading.Lock()
+        if path:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+
+    def get(self, path, key):
+        entry = self._entries.get(path)
+        if entry and entry["key"] == key:
+            return entry
+        return None
+
+    def put(self, path, key, version, source):
+        with self._lock:
+            self._entries[path] = {"key": key, "version": version, "source": source}
+            if not self.path:
+                return
+            temp_path = f"{self.path}.tmp"
+            try:
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump(self._entries, f, ensure_ascii=False, indent=2)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                logger.warning(f"ブラウザの情報を保存できませんでした: {e}")
+
+
+def version_key(path):
+    """バージョンが変わると変わる値（実行ファイルの実体と、snapの場合は現在のリビジョンの更新日時）"""
+    key = [os.path.realpath(path), _stat_key(os.path.realpath(path))]
+    if path.startswith("/snap/"):
+        revision = os.path.realpath(f"/snap/{os.path.basename(path)}/current")
+        key += [revision, _stat_key(revision)]
+    return key
+
+
+def describe(name, path, cache=None, allow_launch=False):
+    """1つの候補の情報（存在しない場合はNone）"""
+    if _stat_key(path) is None:
+        return None
+    key = version_key(path)
+    entry = cache.get(path, key) if cache else None
+    if entry is None or (entry["version"] is None and allow_launch):
+        version, source = read_version(path, allow_launch=allow_launch)
+        if cache:
+            cache.put(path, key, version, source)
+    else:
+        version, source = entry["version"], entry["source"]
+    return {"name": name, "path": path, "version": version, "version_source": source}
+
+
+def find_browsers(cache_path=CACHE_PATH, allow_launch=False):
+    """見つかったブラウザをすべて返す"""
+    cache = BrowserCache(cache_path)
+    browsers = []
+    for name, path in candidates():
+        browser = describe(name, path, cache, allow_launch)
+        if browser:
+            browsers.append(browser)
+    return browsers
+
+
+def find_browser(cache_path=CACHE_PATH, allow_launch=False):
+    """最も優先度の高いブラウザ（見つからない場合はNone）
+
+    allow_launch を指定すると、ディスク上の情報でバージョンがわからない場合に
+    ブラウザを --version で起動して取得します。
+    """
+    cache = BrowserCache(cache_path)
+    for name, path in candidates():
+        browser = describe(name, path, cache, allow_launch)
+        if browser:
+            return browser
+    return None
+
+
+def main(argv=None):
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description="Chrome/Chromiumを探し、バージョンを表示します")
+    parser.add_argument("--all", action="store_true", help="見つかったブラウザをすべて表示する")
+    parser.add_argument("--launch", action="store_true",
+                        help="ディスク上の情報でバージョンがわからない場合はブラウザを起動して取得する")
+    parser.add_argument("--no-cache", action="store_true", help="キャッシュを使わない")
+    parser.add_argument("--json", action="store_true", help="JSONで出力する")
+    args = parser.parse_args(argv)
+
+    cache_path = None if args.no_cache else CACHE_PATH
+    if args.all:
+        browsers = find_browsers(cache_path, args.launch)
+    else:
+        browser = find_browser(cache_path, args.launch)
+        browsers = [browser] if browser else []
+    if args.json:
+        print(json.dumps(browsers if args.all else (browsers[0] if browsers else None), ensure_ascii=False, indent=2))
+    elif not browsers:
+        print("Chrome/Chromiumが見つかりませんでした")
+    else:
+        for browser in browsers:
+            print(f"{browser['name']}: {browser['path']}  バージョン {browser['version'] or '不明'}"
+                  f"（{browser['version_source'] or '-'}）")
+    return bool(browsers)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(0 if main() else 1)
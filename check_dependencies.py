@@ -7,14 +7,31 @@ Web打刻ツールで使用しているライブラリの安全性を確認し
 
 import os
 import sys
-import json
-import subprocess
 import platform
 import logging
 import requests
 import time
+import argparse
+import threading
 from pathlib import Path
 from datetime import datetime
+from urllib.parse import urlparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+from http_cache import HttpCache
+from vuln_index import load_or_build
+from osv_offline import open_index
+from package_inventory import collect_inventory, versions_of
+from typosquat import TyposquatDetector
+from scan_state import (advisory_sources, package_fingerprint, load_previous_report,
+                        previous_results, diff_reports, save_diff, print_diff, SCAN_STATE_VERSION)
+from report_writer import ReportWriter
+from dependency_graph import DependencyGraph, path_to
+from sbom import SbomWriter, FORMATS as SBOM_FORMATS
+import record_integrity
+from packaging.utils import canonicalize_name
 
 # ロガーの設定
 logging.basicConfig(
@@ -28,30 +45,123 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-# 安全性チェックに使用するAPIのURL
-PYPI_URL = "https://pypi.org/pypi/{package}/json"
+# 安全性チェックに使用するAPIのURL（configure_endpoints で差し替え可能）
+PYPI_BASE_URL = "https://pypi.org"
+PYPISTATS_BASE_URL = "https://pypistats.org"
+PYPI_URL = PYPI_BASE_URL + "/pypi/{package}/json"
 SAFETY_DB_URL = "https://raw.githubusercontent.com/pyupio/safety-db/master/data/insecure_full.json"
 SNYK_API_URL = "https://snyk.io/api/v1/vuln/pip/{package}"
+VULN_INDEX_PATH = "safety_db_index.json"
+PYPI_PROJECT_URL = PYPI_BASE_URL + "/project/{package}/{version}/"
+PYPISTATS_URL = PYPISTATS_BASE_URL + "/api/packages/{package}/recent"
+
+# 並列取得の設定
+MAX_WORKERS = 16
+# ホストごとの1秒あたりの最大リクエスト数
+HOST_RATE_LIMITS = {
+    "pypi.org": 10.0,
+    "pypistats.org": 5.0,
+    "raw.githubusercontent.com": 5.0,
+}
+DEFAULT_RATE_LIMIT = 5.0
+
+# キャッシュの設定（URLの先頭部分ごとの有効期限（秒））
+CACHE_DIR = ".http_cache"
+CACHE_MAX_BYTES = 200 * 1024 * 1024
+CACHE_TTLS = {
+    SAFETY_DB_URL: 24 * 3600,
+    "https://pypi.org/pypi/": 6 * 3600,
+    "https://pypi.org/project/": 24 * 3600,
+    "https://pypistats.org/": 24 * 3600,
+}
+
+
+class HostRateLimiter:
+    """ホストごとのリクエスト間隔を制御するレートリミッタ
+
+    スレッドごとに次の送信時刻の枠を予約し、ロックの外で待機するため、
+    複数スレッドから呼び出しても同じホストへの送信は一定間隔に揃います。
+    """
+
+    def __init__(self, rates=None, default_rate=DEFAULT_RATE_LIMIT):
+        self.rates = rates or {}
+        self.default_rate = default_rate
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        """URLのホストに送信してよい時刻まで待機"""
+        host = urlparse(url).hostname or ""
+        interval = 1.0 / self.rates.get(host, self.default_rate)
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def create_session(pool_size=MAX_WORKERS):
+    """keep-aliveで接続を使い回すHTTPセッションを作成"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["User-Agent"] = "web-dakoku-tool-security-check"
+    return session
+
+
+_session = create_session()
+_rate_limiter = HostRateLimiter(HOST_RATE_LIMITS)
+_cache = None
+
 
-def get_installed_packages():
+def configure_cache(directory=CACHE_DIR, ttls=None, max_bytes=CACHE_MAX_BYTES):
+    """HTTPキャッシュを有効にする（directoryにNoneを指定すると無効）"""
+    global _cache
+    if directory is None:
+        _cache = None
+        return None
+    _cache = HttpCache(directory, ttls=ttls if ttls is not None else CACHE_TTLS, max_bytes=max_bytes)
+    return _cache
+
+
+def configure_endpoints(pypi_base_url=None, pypistats_base_url=None, safety_db_url=None):
+    """問い合わせ先のURLを差し替える（ローカルのテスト用サーバーやミラーを使う場合）"""
+    global PYPI_URL, PYPI_PROJECT_URL, PYPISTATS_URL, SAFETY_DB_URL
+    if pypi_base_url:
+        PYPI_URL = pypi_base_url.rstrip("/") + "/pypi/{package}/json"
+        PYPI_PROJECT_URL = pypi_base_url.rstrip("/") + "/project/{package}/{version}/"
+    if pypistats_base_url:
+        PYPISTATS_URL = pypistats_base_url.rstrip("/") + "/api/packages/{package}/recent"
+    if safety_db_url:
+        SAFETY_DB_URL = safety_db_url
+
+def configure_rate_limiter(rates=None, default_rate=DEFAULT_RATE_LIMIT):
+    """ホストごとの送信間隔の制限を設定し直す"""
+    global _rate_limiter
+    _rate_limiter = HostRateLimiter(rates if rates is not None else HOST_RATE_LIMITS, default_rate)
+    return _rate_limiter
+
+def http_get(url, timeout=10):
+    """共有セッションとレートリミッタを通してGETリクエストを送信"""
+    if _cache is not None:
+        # キャッシュが有効期限内の場合はレートリミッタも通らない
+        return _cache.get(_session, url, timeout=timeout, rate_limiter=_rate_limiter)
+    _rate_limiter.wait(url)
+    return _session.get(url, timeout=timeout)
+
+def get_installed_packages(inventory=None):
     """インストール済みのパッケージとそのバージョンを取得"""
     try:
-        result = subprocess.run(
-            [sys.executable, "-m", "pip", "freeze"],
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        packages = {}
-        for line in result.stdout.strip().split('\n'):
-            if '==' in line:
-                name, version = line.split('==', 1)
-                packages[name.lower()] = version
+        if inventory is None:
+            inventory = collect_inventory()
+        packages = versions_of(inventory)
         
-        logger.info(f"{len(packages)}個のパッケージがインストールされています")
+        editable = sum(1 for item in inventory.values() if item["editable"] or item["vcs"])
+        logger.info(f"{len(packages)}個のパッケージがインストールされています（編集可能/VCS: {editable}個）")
         return packages
-    except subprocess.SubprocessError as e:
+    except Exception as e:
         logger.error(f"パッケージ情報の取得に失敗しました: {e}")
         return {}
 
@@ -75,10 +185,10 @@ def get_project_dependencies():
             # バージョン指定がある場合
             if '==' in line:
                 name, version = line.split('==', 1)
-                dependencies[name.lower()] = version
+                dependencies[canonicalize_name(name.strip())] = version.strip()
             else:
                 # バージョン指定がない場合は空文字列を設定
-                dependencies[line.lower()] = ""
+                dependencies[canonicalize_name(line)] = ""
                 
         logger.info(f"{len(dependencies)}個の依存パッケージが定義されています")
         return dependencies
@@ -90,7 +200,7 @@ def check_package_info(package_name, version):
     """PyPIからパッケージ情報を取得"""
     try:
         url = PYPI_URL.format(package=package_name)
-        response = requests.get(url, timeout=10)
+        response = http_get(url)
         if response.status_code == 200:
             data = response.json()
             
@@ -135,7 +245,7 @@ def check_package_info(package_name, version):
 def get_safety_db():
     """Safety DBから脆弱性情報を取得"""
     try:
-        response = requests.get(SAFETY_DB_URL, timeout=10)
+        response = http_get(SAFETY_DB_URL)
         if response.status_code == 200:
             return response.json()
         else:
@@ -145,38 +255,36 @@ def get_safety_db():
         logger.error(f"Safety DBの取得中にエラーが発生しました: {e}")
         return {}
 
-def check_package_vulnerabilities(package_name, version, safety_db):
+def check_package_vulnerabilities(package_name, version, vuln_index, osv_index=None, offline=False):
     """パッケージの脆弱性をチェック"""
     vulnerabilities = []
     
-    # Safety DBでのチェック
-    if package_name in safety_db:
-        for vuln in safety_db[package_name]:
-            affected_versions = vuln.get('specs', [])
-            # バージョンチェック（簡易的な実装）
-            is_vulnerable = False
-            for spec in affected_versions:
-                if spec[0] == '==' and spec[1] == version:
-                    is_vulnerable = True
-                    break
-                elif spec[0] == '>=' and version >= spec[1]:
-                    is_vulnerable = True
-                    break
-                elif spec[0] == '<=' and version <= spec[1]:
-                    is_vulnerable = True
-                    break
-                    
-            if is_vulnerable:
-                vulnerabilities.append({
-                    "source": "Safety DB",
-                    "id": vuln.get('id', 'Unknown'),
-                    "description": vuln.get('advisory', 'No description available')
-                })
+    # Safety DBでのチェック（索引を二分探索し、候補をSpecifierSetで判定）
+    if vuln_index is not None:
+        for vuln in vuln_index.affected(package_name, version):
+            vulnerabilities.append({
+                "source": "Safety DB",
+                "id": vuln.get('id', 'Unknown'),
+                "description": vuln.get('advisory', 'No description available')
+            })
+    
+    # ローカルのOSVアドバイザリでのチェック
+    if osv_index is not None:
+        for vuln in osv_index.affected(package_name, version):
+            vulnerabilities.append({
+                "source": "OSV",
+                "id": vuln['id'],
+                "description": vuln['summary']
+            })
+    
+    # オフラインの場合はPyPIのページを確認しない
+    if offline:
+        return vulnerabilities
     
     # PyPI Advisoryでのチェック（簡易的な実装）
     try:
-        url = f"https://pypi.org/project/{package_name}/{version}/"
-        response = requests.get(url, timeout=10)
+        url = PYPI_PROJECT_URL.format(package=package_name, version=version)
+        response = http_get(url)
         if response.status_code == 200:
             content = response.text.lower()
             if 'security' in content and ('vulnerability' in content or 'advisory' in content):
@@ -193,8 +301,8 @@ def check_package_vulnerabilities(package_name, version, safety_db):
 def check_package_popularity(package_name):
     """パッケージの人気度をチェック"""
     try:
-        url = f"https://pypistats.org/api/packages/{package_name}/recent"
-        response = requests.get(url, timeout=10)
+        url = PYPISTATS_URL.format(package=package_name)
+        response = http_get(url)
         if response.status_code == 200:
             data = response.json()
             downloads = data.get('data', {}).get('last_month', 0)
@@ -204,7 +312,17 @@ def check_package_popularity(package_name):
     except Exception:
         return None
 
-def check_suspicious_packages(packages):
+def ordered_map(executor, func, items, window):
+    """executor.mapと同じく入力順に結果を返す（実行中・未取得の件数を window 件までに抑える）"""
+    pending = deque()
+    for item in items:
+        if len(pending) >= window:
+            yield pending.popleft().result()
+        pending.append(executor.submit(func, item))
+    while pending:
+        yield pending.popleft().result()
+
+def check_suspicious_packages(packages, detector=None):
     """怪しいパッケージをチェック"""
     suspicious = []
     
@@ -236,6 +354,10 @@ def check_suspicious_packages(packages):
         "pillow-1",  # typosquatting (pillow)
     ]
     
+    known_malicious = {name.lower() for name in known_malicious}
+    if detector is None:
+        detector = TyposquatDetector()
+
     for package in packages:
         # 既知の悪意のあるパッケージかチェック
         if package.lower() in known_malicious:
@@ -245,37 +367,62 @@ def check_suspicious_packages(packages):
             })
             continue
             
-        # typosquattingの可能性をチェック
-        common_packages = [
-            "requests", "urllib3", "numpy", "pandas", "matplotlib", 
-            "django", "flask", "tensorflow", "torch", "scikit-learn",
-            "selenium", "beautifulsoup4", "cryptography", "pillow", "pyside6"
-        ]
-        
-        for common in common_packages:
-            # 編集距離が1または2の場合（簡易的な実装）
-            if package.lower() != common.lower() and (
-                package.lower().replace('-', '') == common.lower().replace('-', '') or
-                package.lower().replace('_', '') == common.lower().replace('_', '') or
-                package.lower() + '1' == common.lower() or
-                package.lower() + '-1' == common.lower() or
-                package.lower() + '_1' == common.lower()
-            ):
-                suspicious.append({
-                    "name": package,
-                    "reason": f"人気のパッケージ '{common}' に似た名前です (typosquatting)"
-                })
-                break
+        # typosquattingの可能性をチェック（人気のパッケージ上位5000件との編集距離）
+        result = detector.check(package)
+        if result:
+            suspicious.append({
+                "name": package,
+                "reason": result["reason"]
+            })
     
     return suspicious
 
-def generate_report(packages, project_deps, safety_db):
-    """セキュリティレポートを生成"""
+def check_package(name, version, project_deps, vuln_index, osv_index=None, offline=False):
+    """1つのパッケージの情報・脆弱性・人気度を取得（オフラインの場合はローカルの情報のみ）"""
+    # パッケージ情報の取得
+    info = None if offline else check_package_info(name, version)
+    if not info:
+        info = {
+            "name": name,
+            "version": version,
+            "author": "Unknown",
+            "author_email": "Unknown",
+            "home_page": "Unknown",
+            "project_url": "Unknown",
+            "download_count": "Unknown",
+            "last_updated": "Unknown"
+        }
+        
+    # 脆弱性のチェック
+    vulnerabilities = check_package_vulnerabilities(name, version, vuln_index, osv_index, offline)
+        
+    # 人気度のチェック
+    popularity = None if offline else check_package_popularity(name)
+    info["low_popularity"] = popularity is not None and popularity < 1000
+        
+    # プロジェクトの依存関係かどうか
+    info["is_project_dependency"] = name in project_deps
+    
+    return info, vulnerabilities
+
+def generate_report(packages, project_deps, vuln_index, max_workers=MAX_WORKERS,
+                    osv_index=None, offline=False, previous=None, writer=None, dependency_parents=None,
+                    sbom=None):
+    """セキュリティレポートを生成
+
+    パッケージごとの結果は得られた順に writer（JSONとHTMLのレポート）へ書き込み、
+    戻り値には含めません（脆弱性のあるパッケージ・怪しいパッケージ・サマリーのみ）。
+    previous に前回のレポートを渡すと、フィンガープリント（バージョンと該当する
+    アドバイザリ）が変わっていないパッケージは前回の結果を再利用します。
+    dependency_parents（DependencyGraph.shortest_paths の結果）を渡すと、各パッケージに
+    requirements.txt から到達できるかと、脆弱性のあるパッケージへの最短経路を記録します。
+    sbom（SbomWriter）を渡すと、同じ結果からSBOMも逐次書き込みます。
+    """
+    writer = writer or ReportWriter()
     report = {
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "python_version": platform.python_version(),
         "os": platform.system(),
-        "packages": [],
         "suspicious_packages": [],
         "vulnerable_packages": [],
         "summary": {
@@ -283,6 +430,10 @@ def generate_report(packages, project_deps, safety_db):
             "suspicious_count": 0,
             "vulnerable_count": 0,
             "low_popularity_count": 0
+        },
+        "scan_state": {
+            "version": SCAN_STATE_VERSION,
+            "advisory_sources": advisory_sources(vuln_index, osv_index)
         }
     }
     
@@ -291,348 +442,111 @@ def generate_report(packages, project_deps, safety_db):
     report["suspicious_packages"] = suspicious
     report["summary"]["suspicious_count"] = len(suspicious)
     
-    # 各パッケージの詳細情報を取得
-    for i, (name, version) in enumerate(packages.items()):
-        logger.info(f"パッケージをチェック中 ({i+1}/{len(packages)}): {name}=={version}")
-        
-        # パッケージ情報の取得
-        info = check_package_info(name, version)
-        if not info:
-            info = {
-                "name": name,
-                "version": version,
-                "author": "Unknown",
-                "author_email": "Unknown",
-                "home_page": "Unknown",
-                "project_url": "Unknown",
-                "download_count": "Unknown",
-                "last_updated": "Unknown"
-            }
-            
-        # 脆弱性のチェック
-        vulnerabilities = check_package_vulnerabilities(name, version, safety_db)
-        if vulnerabilities:
-            report["vulnerable_packages"].append({
-                "name": name,
-                "version": version,
-                "vulnerabilities": vulnerabilities
-            })
-            report["summary"]["vulnerable_count"] += 1
-            
-        # 人気度のチェック
-        popularity = check_package_popularity(name)
-        if popularity is not None and popularity < 1000:
-            info["low_popularity"] = True
-            report["summary"]["low_popularity_count"] += 1
-        else:
-            info["low_popularity"] = False
-            
-        # プロジェクトの依存関係かどうか
-        info["is_project_dependency"] = name in project_deps
-        
-        report["packages"].append(info)
-        
-        # APIレート制限を避けるための遅延
-        time.sleep(0.5)
-        
-    return report
+    # 前回からフィンガープリントが変わっていないパッケージは前回の結果を使う
+    reusable = previous_results(previous)
+    total = len(packages)
+    progress = {"done": 0, "reused": 0}
+    progress_lock = threading.Lock()
 
-def save_report(report, filename="security_report.json"):
-    """レポートをJSONファイルとして保存"""
-    try:
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(report, f, ensure_ascii=False, indent=2)
-        logger.info(f"レポートを保存しました: {filename}")
-        return True
-    except Exception as e:
-        logger.error(f"レポートの保存に失敗しました: {e}")
-        return False
+    def check(item):
+        name, version = item
+        fingerprint = package_fingerprint(name, version, vuln_index, osv_index, offline)
+        cached = reusable.get(name)
+        if cached and cached[0] == fingerprint:
+            info, vulnerabilities = dict(cached[1]), cached[2]
+            info["is_project_dependency"] = name in project_deps
+            with progress_lock:
+                progress["done"] += 1
+                progress["reused"] += 1
+        else:
+            info, vulnerabilities = check_package(name, version, project_deps, vuln_index, osv_index, offline)
+            with progress_lock:
+                progress["done"] += 1
+                logger.info(f"パッケージをチェックしました ({progress['done']}/{total}): {name}=={version}")
+        info["fingerprint"] = fingerprint
+        if dependency_parents is not None:
+            info["reachable"] = name in dependency_parents
+        return info, vulnerabilities
 
-def generate_html_report(report, filename="security_report.html"):
-    """HTMLレポートを生成"""
+    header = {key: report[key] for key in ("timestamp", "python_version", "os", "scan_state")}
+    writer.begin(header, suspicious)
+    if sbom:
+        sbom.begin()
     try:
-        html = f"""<!DOCTYPE html>
-<html lang="ja">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Web打刻ツール - セキュリティレポート</title>
-    <style>
-        body {{
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-            line-height: 1.6;
-            color: #333;
-            max-width: 1200px;
-            margin: 0 auto;
-            padding: 20px;
-        }}
-        h1, h2, h3 {{
-            color: #2c3e50;
-        }}
-        .summary {{
-            background-color: #f8f9fa;
-            border-radius: 5px;
-            padding: 15px;
-            margin-bottom: 20px;
-        }}
-        .warning {{
-            background-color: #fff3cd;
-            color: #856404;
-            padding: 10px;
-            border-radius: 5px;
-            margin-bottom: 10px;
-        }}
-        .danger {{
-            background-color: #f8d7da;
-            color: #721c24;
-            padding: 10px;
-            border-radius: 5px;
-            margin-bottom: 10px;
-        }}
-        .info {{
-            background-color: #d1ecf1;
-            color: #0c5460;
-            padding: 10px;
-            border-radius: 5px;
-            margin-bottom: 10px;
-        }}
-        table {{
-            width: 100%;
-            border-collapse: collapse;
-            margin-bottom: 20px;
-        }}
-        th, td {{
-            padding: 12px 15px;
-            text-align: left;
-            border-bottom: 1px solid #ddd;
-        }}
-        th {{
-            background-color: #f2f2f2;
-        }}
-        tr:hover {{
-            background-color: #f5f5f5;
-        }}
-        .badge {{
-            display: inline-block;
-            padding: 3px 7px;
-            font-size: 12px;
-            font-weight: 700;
-            line-height: 1;
-            text-align: center;
-            white-space: nowrap;
-            vertical-align: baseline;
-            border-radius: 10px;
-            margin-right: 5px;
-        }}
-        .badge-warning {{
-            background-color: #ffc107;
-            color: #212529;
-        }}
-        .badge-danger {{
-            background-color: #dc3545;
-            color: white;
-        }}
-        .badge-info {{
-            background-color: #17a2b8;
-            color: white;
-        }}
-        .badge-success {{
-            background-color: #28a745;
-            color: white;
-        }}
-    </style>
-</head>
-<body>
-    <h1>Web打刻ツール - セキュリティレポート</h1>
-    <p>生成日時: {report['timestamp']}</p>
-    <p>Python バージョン: {report['python_version']}</p>
-    <p>OS: {report['os']}</p>
-    
-    <div class="summary">
-        <h2>サマリー</h2>
-        <p>合計パッケージ数: {report['summary']['total_packages']}</p>
-        <p>怪しいパッケージ: {report['summary']['suspicious_count']}</p>
-        <p>脆弱性のあるパッケージ: {report['summary']['vulnerable_count']}</p>
-        <p>人気度の低いパッケージ: {report['summary']['low_popularity_count']}</p>
-    </div>
-"""
-
-        # 怪しいパッケージがある場合
-        if report['suspicious_packages']:
-            html += """
-    <h2>怪しいパッケージ</h2>
-    <div class="danger">
-        <p>以下のパッケージは悪意のあるパッケージである可能性があります。慎重に確認してください。</p>
-    </div>
-    <table>
-        <tr>
-            <th>パッケージ名</th>
-            <th>理由</th>
-        </tr>
-"""
-            for package in report['suspicious_packages']:
-                html += f"""
-        <tr>
-            <td>{package['name']}</td>
-            <td>{package['reason']}</td>
-        </tr>
-"""
-            html += """
-    </table>
-"""
-
-        # 脆弱性のあるパッケージがある場合
-        if report['vulnerable_packages']:
-            html += """
-    <h2>脆弱性のあるパッケージ</h2>
-    <div class="warning">
-        <p>以下のパッケージには既知の脆弱性があります。アップデートを検討してください。</p>
-    </div>
-    <table>
-        <tr>
-            <th>パッケージ名</th>
-            <th>バージョン</th>
-            <th>脆弱性</th>
-        </tr>
-"""
-            for package in report['vulnerable_packages']:
-                vulns = "<br>".join([f"{v['source']}: {v['description']}" for v in package['vulnerabilities']])
-                html += f"""
-        <tr>
-            <td>{package['name']}</td>
-            <td>{package['version']}</td>
-            <td>{vulns}</td>
-        </tr>
-"""
-            html += """
-    </table>
-"""
-
-        # すべてのパッケージ
-        html += """
-    <h2>すべてのパッケージ</h2>
-    <table>
-        <tr>
-            <th>パッケージ名</th>
-            <th>バージョン</th>
-            <th>作者</th>
-            <th>最終更新日</th>
-            <th>ステータス</th>
-        </tr>
-"""
-        for package in report['packages']:
-            badges = ""
-            if package.get('is_project_dependency', False):
-                badges += '<span class="badge badge-info">プロジェクト依存</span>'
-            if package.get('low_popularity', False):
-                badges += '<span class="badge badge-warning">低人気度</span>'
-                
-            # 脆弱性があるかチェック
-            has_vulnerability = False
-            for vuln_package in report['vulnerable_packages']:
-                if vuln_package['name'] == package['name']:
-                    has_vulnerability = True
-                    badges += '<span class="badge badge-danger">脆弱性あり</span>'
-                    break
-                    
-            # 怪しいパッケージかチェック
-            is_suspicious = False
-            for susp_package in report['suspicious_packages']:
-                if susp_package['name'] == package['name']:
-                    is_suspicious = True
-                    badges += '<span class="badge badge-danger">怪しい</span>'
-                    break
-                    
-            if not has_vulnerability and not is_suspicious and not package.get('low_popularity', False):
-                badges += '<span class="badge badge-success">問題なし</span>'
-                
-            html += f"""
-        <tr>
-            <td>{package['name']}</td>
-            <td>{package['version']}</td>
-            <td>{package['author']}</td>
-            <td>{package['last_updated']}</td>
-            <td>{badges}</td>
-        </tr>
-"""
-        html += """
-    </table>
-    
-    <h2>推奨事項</h2>
-"""
-
-        # 推奨事項
-        if report['suspicious_packages']:
-            html += """
-    <div class="danger">
-        <h3>怪しいパッケージの対応</h3>
-        <p>怪しいパッケージが検出されました。以下の対応を検討してください：</p>
-        <ul>
-            <li>パッケージの公式サイトやGitHubリポジトリを確認し、正規のパッケージであることを確認する</li>
-            <li>正規のパッケージに置き換える</li>
-            <li>必要ない場合はアンインストールする</li>
-        </ul>
-    </div>
-"""
-
-        if report['vulnerable_packages']:
-            html += """
-    <div class="warning">
-        <h3>脆弱性のあるパッケージの対応</h3>
-        <p>脆弱性のあるパッケージが検出されました。以下の対応を検討してください：</p>
-        <ul>
-            <li>最新バージョンにアップデートする</li>
-            <li>脆弱性が修正されたバージョンに指定する</li>
-            <li>代替パッケージを使用する</li>
-        </ul>
-    </div>
-"""
-
-        if report['summary']['low_popularity_count'] > 0:
-            html += """
-    <div class="info">
-        <h3>人気度の低いパッケージの対応</h3>
-        <p>人気度の低いパッケージが検出されました。以下の対応を検討してください：</p>
-        <ul>
-            <li>パッケージの信頼性を確認する</li>
-            <li>より人気のある代替パッケージを検討する</li>
-            <li>必要性を再検討する</li>
-        </ul>
-    </div>
-"""
-
-        html += """
-    <div class="info">
-        <h3>一般的な推奨事項</h3>
-        <ul>
-            <li>定期的にパッケージをアップデートする</li>
-            <li>requirements.txtでバージョンを固定する</li>
-            <li>仮想環境を使用して依存関係を分離する</li>
-            <li>信頼できるソースからのみパッケージをインストールする</li>
-        </ul>
-    </div>
+        # 各パッケージの詳細情報を並列に取得（送信間隔はホストごとのレートリミッタで制御）
+        # 結果は入力順に得られるため、そのままレポートへ書き込む
+        # （取得済みで書き込み待ちの結果が溜まらないよう、同時に投入する件数を制限する）
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for info, vulnerabilities in ordered_map(executor, check, packages.items(), max_workers * 4):
+                if vulnerabilities:
+                    report["vulnerable_packages"].append({
+                        "name": info["name"],
+                        "version": info["version"],
+                        "vulnerabilities": vulnerabilities,
+                        "dependency_path": (path_to(dependency_parents, info["name"])
+                                            if dependency_parents is not None else None)
+                    })
+                    report["summary"]["vulnerable_count"] += 1
+                if info["low_popularity"]:
+                    report["summary"]["low_popularity_count"] += 1
+                writer.add_package(info, vulnerabilities)
+                if sbom:
+                    sbom.add_package(info, vulnerabilities)
+        writer.finish(report["vulnerable_packages"], report["summary"])
+        if sbom:
+            sbom.finish()
+    finally:
+        # 中断した場合も書き込み済みの結果は .partial として残る
+        writer.close()
+        if sbom:
+            sbom.close()
     
-    <footer>
-        <p>このレポートは自動生成されたものです。詳細な分析には専門家の判断が必要です。</p>
-    </footer>
-</body>
-</html>
-"""
+    if previous:
+        logger.info(f"前回から変わっていない{progress['reused']}個のパッケージは前回の結果を使用しました")
+        
+    return report
 
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(html)
-        logger.info(f"HTMLレポートを保存しました: {filename}")
-        return True
-    except Exception as e:
-        logger.error(f"HTMLレポートの生成に失敗しました: {e}")
-        return False
+def parse_args(argv=None):
+    """コマンドライン引数の解析"""
+    parser = argparse.ArgumentParser(description="依存ライブラリの安全性をチェックします")
+    parser.add_argument("--offline", action="store_true",
+                        help="インターネットに接続せず、ローカルの情報だけでチェックする")
+    parser.add_argument("--osv", metavar="PATH", help="OSV形式のアドバイザリ（zipまたはJSONのディレクトリ）")
+    parser.add_argument("--osv-index", metavar="PATH", help="OSVアドバイザリの索引ファイルの保存先")
+    parser.add_argument("--full", action="store_true",
+                        help="前回の結果を使わず、すべてのパッケージをチェックする（改ざんチェックもすべてのファイルを計算する）")
+    parser.add_argument("--integrity", action="store_true",
+                        help="インストール済みファイルをRECORDのハッシュと照合する（改ざんチェック）")
+    parser.add_argument("--sbom", choices=SBOM_FORMATS, help="SBOM（CycloneDXまたはSPDXのJSON）も出力する")
+    parser.add_argument("--sbom-output", metavar="PATH", help="SBOMの保存先（既定: sbom.cdx.json / sbom.spdx.json）")
+    parser.add_argument("--pypi-url", metavar="URL", help="PyPIのURL（既定: https://pypi.org）")
+    parser.add_argument("--pypistats-url", metavar="URL", help="pypistatsのURL（既定: https://pypistats.org）")
+    parser.add_argument("--safety-db-url", metavar="URL", help="Safety DB（insecure_full.json）のURL")
+    parser.add_argument("--no-cache", action="store_true", help="HTTPキャッシュを使用しない")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="HTTPキャッシュの保存先")
+    parser.add_argument("--cache-max-mb", type=int, default=CACHE_MAX_BYTES // (1024 * 1024),
+                        help="HTTPキャッシュの容量上限（MB）")
+    parser.add_argument("--cache-ttl", action="append", default=[], metavar="URL_PREFIX=SECONDS",
+                        help="URLの先頭部分ごとのキャッシュ有効期限（複数指定可）")
+    return parser.parse_args(argv)
 
-def main():
+def main(argv=None):
     """メイン処理"""
+    args = parse_args(argv)
     logger.info("依存ライブラリの安全性チェックを開始します")
+    configure_endpoints(args.pypi_url, args.pypistats_url, args.safety_db_url)
     
-    # インストール済みのパッケージを取得
-    packages = get_installed_packages()
+    # HTTPキャッシュの設定
+    if not args.no_cache:
+        ttls = dict(CACHE_TTLS)
+        for item in args.cache_ttl:
+            prefix, _, seconds = item.rpartition("=")
+            ttls[prefix] = int(seconds)
+        configure_cache(args.cache_dir, ttls, args.cache_max_mb * 1024 * 1024)
+    
+    # インストール済みのパッケージを取得（インベントリは後続の処理でも使用する）
+    inventory = collect_inventory()
+    packages = get_installed_packages(inventory)
     if not packages:
         logger.error("インストール済みのパッケージを取得できませんでした")
         return False
@@ -641,18 +555,62 @@ def main():
     project_deps = get_project_dependencies()
     
     # Safety DBを取得
-    logger.info("脆弱性データベースを取得しています...")
-    safety_db = get_safety_db()
+    vuln_index = None
+    if args.offline:
+        logger.info("オフラインモードのため、Safety DB・PyPI・pypistatsへの問い合わせを行いません")
+    else:
+        logger.info("脆弱性データベースを取得しています...")
+        safety_db = get_safety_db()
+        vuln_index = load_or_build(safety_db, VULN_INDEX_PATH) if safety_db else None
+    
+    # ローカルのOSVアドバイザリの索引を開く
+    osv_index = None
+    if args.osv:
+        logger.info(f"OSVアドバイザリの索引を準備しています: {args.osv}")
+        osv_index = open_index(args.osv, args.osv_index)
+    elif args.offline:
+        logger.warning("--osv が指定されていないため、脆弱性のチェックは行われません")
+    
+    # 依存関係グラフを作成し、requirements.txt のパッケージから到達できる範囲を求める
+    dependency_parents = None
+    graph = DependencyGraph.from_inventory(inventory) if project_deps or args.sbom else None
+    if project_deps:
+        dependency_parents = graph.shortest_paths(project_deps)
+        logger.info(f"requirements.txt から{len(dependency_parents)}個のパッケージに到達できます")
     
-    # レポートを生成
+    # SBOMはインベントリと依存関係グラフ、レポートと同じチェック結果から作成する
+    sbom = None
+    if args.sbom:
+        sbom = SbomWriter.create(args.sbom, inventory, graph.direct_dependencies(), args.sbom_output)
+    
+    # 前回のレポート（差分スキャン用）
+    previous = None if args.full else load_previous_report()
+    
+    # レポートを生成（JSONとHTMLのレポートへ逐次書き込む）
     logger.info("セキュリティレポートを生成しています...")
-    report = generate_report(packages, project_deps, safety_db)
+    report = generate_report(packages, project_deps, vuln_index,
+                             osv_index=osv_index, offline=args.offline, previous=previous,
+                             dependency_parents=dependency_parents, sbom=sbom)
+    
+    # 前回との差分（前回が中断していた場合は比較しない）
+    diff = diff_reports(previous, report, packages) if previous and not previous.get("partial") else None
+    if diff:
+        save_diff(diff)
     
-    # レポートを保存
-    save_report(report)
+    # インストール済みファイルの改ざんチェック
+    integrity = None
+    if args.integrity:
+        logger.info("インストール済みファイルをRECORDと照合しています...")
+        integrity = record_integrity.verify_environment(
+            cache_path=None if args.full else record_integrity.CACHE_PATH)
+        record_integrity.save_result(integrity)
     
-    # HTMLレポートを生成
-    generate_html_report(report)
+    # キャッシュの利用状況と容量の整理
+    if _cache is not None:
+        stats = _cache.stats
+        logger.info(f"HTTPキャッシュ: 有効期限内 {stats['fresh']}件 / 更新なし {stats['revalidated']}件 / "
+                    f"ダウンロード {stats['downloaded']}件 / 期限切れを使用 {stats['stale']}件")
+        _cache.prune()
     
     # 結果を表示
     print("\nセキュリティチェックが完了しました！")
@@ -663,6 +621,15 @@ def main():
     print("\nレポートは以下のファイルに保存されました:")
     print("- security_report.json")
     print("- security_report.html")
+    if sbom:
+        print(f"- {sbom.path}")
+    if integrity:
+        print(f"- {record_integrity.REPORT_PATH}")
+    if diff:
+        print("- security_report_diff.json")
+        print_diff(diff)
+    if integrity:
+        record_integrity.print_result(integrity)
     
     # 怪しいパッケージがある場合
     if report['suspicious_packages']:
@@ -675,6 +642,10 @@ def main():
         print("\n警告: 脆弱性のあるパッケージが検出されました！")
         for package in report['vulnerable_packages']:
             print(f"- {package['name']} {package['version']}")
+            if package['dependency_path']:
+                print(f"  依存経路: {' -> '.join(package['dependency_path'])}")
+            elif dependency_parents is not None:
+                print("  依存経路: requirements.txt のパッケージからは使用されていません")
             for vuln in package['vulnerabilities']:
                 print(f"  - {vuln['source']}: {vuln['description']}")
                 
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+スリープ・時刻の変更の検出
+ノートPCのスリープ中はタイマーが止まり、復帰後に遅れて動きます。また時刻を変更すると、
+タイマーで待っていた時刻と実際の時刻がずれます。ここではそれを次の2つの方法で検出します。
+
+- 時計の比較: 前回からの経過時間を、時刻（time.time）と単調増加の時計（time.monotonic）で比べます。
+  時刻の変更や、スリープ中に止まる単調増加の時計（Linux）では両者に差が出ます。スリープ中も進む
+  単調増加の時計（Windows・macOS）では、予定より大きく遅れて動いたことで検出します。
+- OSの通知: Windows は WM_POWERBROADCAST（スリープからの復帰）と WM_TIMECHANGE（時刻の変更）、
+  Linux は systemd-logind の PrepareForSleep シグナルで、復帰したときにすぐ呼び出します。
+  Windows のこれらのメッセージはトップレベルウィンドウにだけ送られるため、タスクトレイだけの
+  アプリでも受け取れるように、表示しないトップレベルウィンドウを作って
+  RegisterSuspendResumeNotification で登録します。
+
+OSの通知を受け取れる場合は時計の比較は不要です（定期的に起きる必要がありません）。
+"""
+
+import sys
+import time
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# これ以上ずれていたら時刻の変更・スリープとみなす（秒）
+CLOCK_TOLERANCE = 30.0
+
+WM_TIMECHANGE = 0x001E
+WM_POWERBROADCAST = 0x0218
+PBT_APMRESUMESUSPEND = 0x0007
+PBT_APMRESUMEAUTOMATIC = 0x0012
+DEVICE_NOTIFY_WINDOW_HANDLE = 0x00000000
+
+
+class ClockWatch:
+    """時刻と単調増加の時計のずれの検出"""
+
+    def __init__(self, tolerance=CLOCK_TOLERANCE):
+        self.tolerance = tolerance
+        self.mark()
+
+    def mark(self):
+        """今の時刻を基準にする"""
+        self.wall = time.time()
+        self.mono = time.monotonic()
+
+    def check(self, expected=None):
+        """前回から時刻の変更・スリープがあったか（なければNone）
+
+        expected は前回から今回までの予定の間隔（秒）で、それより大きく遅れた場合も検出します。
+        検出した場合は {"kind", "since", "now", "wall_delta", "mono_delta"} を返します。
+        kind は "clock_back"（時刻が戻った）・"clock_forward"（時刻が進んだ、またはスリープ）・
+        "late"（予定より遅れた、スリープ中も進む時計でのスリープ）です。
+        """
+        wall, mono = time.time(), time.monotonic()
+        wall_delta = wall - self.wall
+        mono_delta = mono - self.mono
+        since = self.wall
+        self.wall, self.mono = wall, mono
+
+        drift = wall_delta - mono_delta
+        if drift < -self.tolerance:
+            kind = "clock_back"
+        elif drift > self.tolerance:
+            kind = "clock_forward"
+        elif expected is not None and mono_delta > expected + self.tolerance:
+            kind = "late"
+        else:
+            return None
+        return {
+            "kind": kind,
+            "since": datetime.fromtimestamp(since),
+            "now": datetime.fromtimestamp(wall),
+            "wall_delta": wall_delta,
+            "mono_delta": mono_delta,
+        }
+
+
+def describe(info):
+    """検出したずれの説明"""
+    labels = {"clock_back": "時刻が戻りました", "clock_forward": "時刻が進みました（スリープまたは時刻の変更）",
+              "late": "スリープなどで処理が遅れました"}
+    return (f"{labels[info['kind']]}: {info['since']:%Y-%m-%d %H:%M:%S} → {info['now']:%Y-%m-%d %H:%M:%S}"
+            f"（時刻 {info['wall_delta']:+.0f}秒・経過 {info['mono_delta']:.0f}秒）")
+
+
+def _windows_listener(app, callback):
+    import ctypes
+    from ctypes import wintypes
+    from PySide6.QtCore import QAbstractNativeEventFilter
+    from PySide6.QtWidgets import QWidget
+
+    class PowerEventFilter(QAbstractNativeEventFilter):
+        def __init__(self):
+            super().__init__()
+            # 表示しないトップレベルウィンドウ（winId でウィンドウハンドルを作らせる）。
+            # 他のウィンドウに届いた同じブロードキャストで何度も呼ばないよう、このウィンドウ宛てだけを見る
+            self.window = QWidget()
+            self.hwnd = int(self.window.winId())
+            self.notification = None
+            try:
+                register = ctypes.windll.user32.RegisterSuspendResumeNotification
+                register.restype = wintypes.HANDLE
+                register.argtypes = (wintypes.HANDLE, wintypes.DWORD)
+                self.notification = register(self.hwnd, DEVICE_NOTIFY_WINDOW_HANDLE)
+            except AttributeError:
+                # Windows 8 より前はトップレベルウィンドウへのブロードキャストだけで受け取る
+                pass
+
+        def nativeEventFilter(self, event_type, message):
+            if bytes(event_type) == b"windows_generic_MSG":
+                msg = wintypes.MSG.from_address(int(message))
+                if msg.hWnd == self.hwnd and (msg.message == WM_TIMECHANGE or (
+                        msg.message == WM_POWERBROADCAST and
+                        msg.wParam in (PBT_APMRESUMESUSPEND, PBT_APMRESUMEAUTOMATIC))):
+                    callback()
+            return False, 0
+
+    listener = PowerEventFilter()
+    app.installNativeEventFilter(listener)
+    return listener
+
+
+def _logind_listener(app, callback):
+    from PySide6.QtCore import QObject, Slot, SLOT
+    from PySide6.QtDBus import QDBusConnection
+
+    class SleepListener(QObject):
+        @Slot(bool)
+        def prepare_for_sleep(self, sleeping):
+            # スリープの直前にTrue、復帰したときにFalseで呼ばれる
+            if not sleeping:
+                callback()
+
+    bus = QDBusConnection.systemBus()
+    if not bus.isConnected():
+        return None
+    listener = SleepListener(app)
+    if not bus.connect("org.freedesktop.login1", "/org/freedesktop/login1", "org.freedesktop.login1.Manager",
+                       "PrepareForSleep", listener, SLOT("prepare_for_sleep(bool)")):
+        return None
+    return listener
+
+
+def install_resume_listener(app, callback):
+    """スリープからの復帰（Windowsは時刻の変更も）の通知を受け取る
+
+    受け取れない環境（macOSなど）ではNoneを返します。その場合だけ ClockWatch.check を
+    定期的に呼び出して検出してください。callback はGUIスレッドで呼び出されます。
+    Linux（logind）ではスリープからの復帰だけを通知します。
+    """
+    try:
+        if sys.platform == "win32":
+            return _windows_listener(app, callback)
+        if sys.platform.startswith("linux"):
+            return _logind_listener(app, callback)
+    except Exception as e:
+        logger.info(f"スリープからの復帰の通知を受け取れません: {e}")
+    return None
@@ -147,6 +147,12 @@ class ConfigManager:
             logging.error(f"設定ファイルのリセットに失敗しました: {e}")
             return False
 
+    def get_installation_id(self, config=None):
+        """このPC・ユーザーに固有のID（自動打刻の時刻の分散に使用）"""
+        if config is None:
+            config = self.load_config()
+        return f"{self._get_machine_id()}:{config.get('user_id', '')}"
+
     def is_configured(self):
         """設定が完了しているかどうかを確認"""
         if not self.config_file.exists():
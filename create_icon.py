@@ -1,66 +1,230 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+"""
+トレイアイコンの作成
+打刻の状態（未出勤・出勤中・退勤済み・打刻処理中・エラー）ごとのアイコンを、
+高DPIのディスプレイに対応できるよう 16/24/32/64/128px で一度に描画します。
+打刻処理中のアニメーション用に、分針を少しずつ回したコマも合わせて描画します。
+
+描画結果は描画パラメータのハッシュごとのフォルダ（icons/cache/<ハッシュ>）に保存し、
+アプリはそのPNGから作った QIcon をメモリに持っておきます。パラメータを変えない限り
+描画し直さないため、アプリの実行中にPILを使うことはありません。
+"""
 
-from PIL import Image, ImageDraw, ImageFont
 import os
+import sys
+import json
+import shutil
+import hashlib
+import logging
 from pathlib import Path
 
-def create_clock_icon(output_path, size=(64, 64), bg_color=(52, 152, 219), fg_color=(255, 255, 255)):
-    """時計アイコンを作成する"""
-    # 画像の作成
-    img = Image.new('RGBA', size, color=(0, 0, 0, 0))
+logger = logging.getLogger(__name__)
+
+ICON_DIR = Path(__file__).parent / "icons"
+SIZES = (16, 24, 32, 64, 128)
+# 描画方法を変えたら上げる（キャッシュが作り直される）
+RENDER_VERSION = 1
+# 縮小して滑らかにするため、この倍率で描画してから縮小する
+SUPERSAMPLE = 4
+
+# 状態ごとの色とバッジ
+STATE_STYLES = {
+    "idle": {"label": "未出勤", "bg": (149, 165, 166), "fg": (255, 255, 255), "badge": None},
+    "clocked_in": {"label": "出勤中", "bg": (39, 174, 96), "fg": (255, 255, 255), "badge": None},
+    "clocked_out": {"label": "退勤済み", "bg": (52, 152, 219), "fg": (255, 255, 255), "badge": "check"},
+    "busy": {"label": "打刻処理中", "bg": (243, 156, 18), "fg": (255, 255, 255), "badge": "dots"},
+    "error": {"label": "エラー", "bg": (231, 76, 60), "fg": (255, 255, 255), "badge": "exclamation"},
+}
+STATES = tuple(STATE_STYLES)
+# バッジを描く最小のサイズ（小さいアイコンでは色だけで区別する）
+BADGE_MIN_SIZE = 24
+# アニメーションのコマ数（分針が1周する）
+ANIMATION_FRAMES = {"busy": 8}
+
+
+def render_params(sizes=SIZES):
+    """描画結果を決めるパラメータ"""
+    return {"version": RENDER_VERSION, "supersample": SUPERSAMPLE, "sizes": list(sizes),
+            "styles": STATE_STYLES, "badge_min_size": BADGE_MIN_SIZE, "animation_frames": ANIMATION_FRAMES}
+
+
+def render_hash(sizes=SIZES):
+    """描画パラメータのハッシュ（キャッシュのフォルダ名）"""
+    data = json.dumps(render_params(sizes), sort_keys=True).encode("utf-8")
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def _draw_badge(draw, badge, scale, fg_color, bg_color):
+    """右下のバッジ"""
+    radius = 7 * scale
+    cx, cy = 24 * scale, 24 * scale
+    draw.ellipse([(cx - radius, cy - radius), (cx + radius, cy + radius)], fill=fg_color)
+    width = max(1, round(2.2 * scale))
+    if badge == "check":
+        draw.line([(cx - 3.5 * scale, cy), (cx - 1 * scale, cy + 3 * scale), (cx + 4 * scale, cy - 3 * scale)],
+                  fill=bg_color, width=width, joint="curve")
+    elif badge == "exclamation":
+        draw.line([(cx, cy - 4 * scale), (cx, cy + 1 * scale)], fill=bg_color, width=width)
+        dot = 1.3 * scale
+        draw.ellipse([(cx - dot, cy + 3.2 * scale - dot), (cx + dot, cy + 3.2 * scale + dot)], fill=bg_color)
+    elif badge == "dots":
+        dot = 1.3 * scale
+        for offset in (-3.5, 0, 3.5):
+            x = cx + offset * scale
+            draw.ellipse([(x - dot, cy - dot), (x + dot, cy + dot)], fill=bg_color)
+
+
+def render_clock(size, bg_color, fg_color, badge=None, minute_angle=135.0):
+    """時計アイコンを描画したPILの画像
+
+    座標は 32x32 を基準に指定し、SUPERSAMPLE 倍で描画してから縮小します。
+    minute_angle は分針の角度（12時の方向を0度とした時計回り）です。
+    """
+    import math
+    from PIL import Image, ImageDraw
+
+    canvas = size * SUPERSAMPLE
+    scale = canvas / 32
+    img = Image.new('RGBA', (canvas, canvas), color=(0, 0, 0, 0))
     draw = ImageDraw.Draw(img)
-    
+
     # 円の描画（時計の外枠）
-    margin = 2
-    draw.ellipse(
-        [(margin, margin), (size[0] - margin, size[1] - margin)],
-        fill=bg_color
-    )
-    
-    # 時計の中心
-    center_x, center_y = size[0] // 2, size[1] // 2
-    
-    # 時計の針（時針）
-    hour_hand_length = size[0] // 3
-    draw.line(
-        [(center_x, center_y), 
-         (center_x, center_y - hour_hand_length)],
-        fill=fg_color, width=3
-    )
-    
-    # 時計の針（分針）
-    minute_hand_length = size[0] // 2.5
-    draw.line(
-        [(center_x, center_y), 
-         (center_x + minute_hand_length * 0.7, center_y + minute_hand_length * 0.7)],
-        fill=fg_color, width=2
-    )
-    
+    margin = 1 * scale
+    draw.ellipse([(margin, margin), (canvas - margin, canvas - margin)], fill=bg_color)
+
+    # 時計の針（時針・分針）
+    center = canvas / 2
+    hour_length = 9 * scale
+    draw.line([(center, center), (center, center - hour_length)], fill=fg_color, width=max(1, round(2.6 * scale)))
+    minute_length = 11.5 * scale
+    angle = math.radians(minute_angle)
+    draw.line([(center, center),
+               (center + minute_length * math.sin(angle), center - minute_length * math.cos(angle))],
+              fill=fg_color, width=max(1, round(1.8 * scale)))
+
     # 時計の中心点
-    center_dot_radius = size[0] // 20
-    draw.ellipse(
-        [(center_x - center_dot_radius, center_y - center_dot_radius),
-         (center_x + center_dot_radius, center_y + center_dot_radius)],
-        fill=fg_color
-    )
-    
+    dot = 1.8 * scale
+    draw.ellipse([(center - dot, center - dot), (center + dot, center + dot)], fill=fg_color)
+
+    if badge and size >= BADGE_MIN_SIZE:
+        _draw_badge(draw, badge, scale, fg_color, bg_color)
+
+    return img.resize((size, size), Image.LANCZOS)
+
+
+def render_state(state, size, frame=None):
+    """状態のアイコン（frame を指定した場合はアニメーションのコマ）を描画"""
+    style = STATE_STYLES[state]
+    if frame is None:
+        return render_clock(size, style["bg"], style["fg"], style["badge"])
+    # コマでは分針の動きが見えるよう、バッジは描かない
+    return render_clock(size, style["bg"], style["fg"], None, minute_angle=360.0 * frame / ANIMATION_FRAMES[state])
+
+
+def frame_name(state, frame):
+    """アニメーションのコマの名前"""
+    return f"{state}.{frame}"
+
+
+def icon_names():
+    """(名前, 状態, コマ番号) の一覧"""
+    names = [(state, state, None) for state in STATES]
+    for state, count in ANIMATION_FRAMES.items():
+        names += [(frame_name(state, frame), state, frame) for frame in range(count)]
+    return names
+
+
+def icon_file_name(name, size):
+    return f"{name}_{size}.png"
+
+
+def build_icon_cache(directory=ICON_DIR, sizes=SIZES):
+    """すべての状態・コマ・サイズのアイコンを用意し、{名前: {サイズ: パス}} を返す
+
+    名前は状態（"busy" など）か、アニメーションのコマ（"busy.0" など）です。
+    同じパラメータで描画済みであればPILは使いません。
+    """
+    cache_root = Path(directory) / "cache"
+    target = cache_root / render_hash(sizes)
+    paths = {name: {size: target / icon_file_name(name, size) for size in sizes} for name, _, _ in icon_names()}
+    if all(path.exists() for sizes_paths in paths.values() for path in sizes_paths.values()):
+        return paths
+
+    # 別のフォルダに描画してから置き換える（途中で終了しても壊れたキャッシュが残らない）
+    temp = cache_root / f"{target.name}.tmp{os.getpid()}"
+    temp.mkdir(parents=True, exist_ok=True)
+    for name, state, frame in icon_names():
+        for size in sizes:
+            render_state(state, size, frame).save(temp / icon_file_name(name, size))
+    if target.exists():
+        shutil.rmtree(target, ignore_errors=True)
+    os.replace(temp, target)
+
+    # 古いパラメータのキャッシュを削除
+    for old in cache_root.iterdir():
+        if old != target and old.is_dir():
+            shutil.rmtree(old, ignore_errors=True)
+    logger.info(f"アイコンを作成しました: {target}")
+    return paths
+
+
+class IconFactory:
+    """状態ごと・コマごとのQIcon（起動時に一度だけ読み込み、メモリに保持する）"""
+
+    def __init__(self, directory=ICON_DIR, sizes=SIZES):
+        from PySide6.QtCore import QSize
+        from PySide6.QtGui import QIcon
+
+        self.paths = build_icon_cache(directory, sizes)
+        self._icons = {}
+        for name, sizes_paths in self.paths.items():
+            icon = QIcon()
+            for size, path in sizes_paths.items():
+                icon.addFile(str(path), QSize(size, size))
+            self._icons[name] = icon
+
+    def icon(self, state):
+        """状態のアイコン"""
+        return self._icons[state]
+
+    def frames(self, state):
+        """アニメーションのコマのアイコン（アニメーションのない状態は空）"""
+        return [self._icons[frame_name(state, frame)] for frame in range(ANIMATION_FRAMES.get(state, 0))]
+
+    @staticmethod
+    def label(state):
+        """状態の表示名"""
+        return STATE_STYLES[state]["label"]
+
+
+def create_clock_icon(output_path, size=(64, 64), bg_color=(52, 152, 219), fg_color=(255, 255, 255)):
+    """時計アイコンを作成する"""
+    img = render_clock(size[0], bg_color, fg_color)
+    if size[0] != size[1]:
+        img = img.resize(size)
+
     # 画像の保存
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     img.save(output_path)
-    
+
     return output_path
 
 def main():
     # アイコンの保存先
-    icon_dir = Path(__file__).parent / "icons"
+    icon_dir = ICON_DIR
     icon_dir.mkdir(exist_ok=True)
-    
+
     # 通常アイコンの作成
     normal_icon_path = icon_dir / "clock_icon.png"
     create_clock_icon(normal_icon_path)
-    
     print(f"アイコンを作成しました: {normal_icon_path}")
 
+    # 状態ごとのアイコンの作成
+    paths = build_icon_cache(icon_dir)
+    print(f"状態ごとのアイコンを作成しました: {paths[STATES[0]][SIZES[0]].parent}")
+    print(f"  状態: {', '.join(STATES)} / サイズ: {', '.join(str(size) for size in SIZES)}px")
+
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
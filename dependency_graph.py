@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+依存関係グラフ
+インストール済みパッケージのメタデータ（Requires-Dist）から依存関係グラフを作成し、
+requirements.txt に書かれたパッケージから到達できるパッケージと、その最短の経路を求めます。
+
+環境マーカー（python_version, sys_platform など）は現在の環境で評価し、
+extra の依存関係は、その extra を指定した依存元から辿った場合だけ有効にします。
+"""
+
+import sys
+import logging
+import argparse
+from collections import deque
+
+from packaging.requirements import Requirement, InvalidRequirement
+from packaging.utils import canonicalize_name
+
+from package_inventory import collect_inventory
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_requirement(text):
+    """Requires-Dist の1行を解析（解釈できない場合はNone）"""
+    try:
+        return Requirement(text)
+    except InvalidRequirement:
+        logger.warning(f"依存関係を解釈できません: {text}")
+        return None
+
+
+class DependencyGraph:
+    """インストール済みパッケージの依存関係グラフ
+
+    edges[パッケージ名][extra] は、そのextraを指定したときに追加される依存先の
+    (パッケージ名, 依存先に指定するextraのタプル) の一覧です（extraなしはNone）。
+    """
+
+    def __init__(self, edges):
+        self.edges = edges
+
+    @classmethod
+    def from_inventory(cls, inventory, environment=None):
+        """collect_inventory() の結果からグラフを作成"""
+        environment = dict(environment or {})
+        edges = {}
+        for name, item in inventory.items():
+            by_extra = {None: []}
+            for text in item["requires"]:
+                requirement = _parse_requirement(text)
+                if requirement is None:
+                    continue
+                target = canonicalize_name(requirement.name)
+                if target not in inventory:
+                    # インストールされていない依存先（他の環境向けの依存など）は無視する
+                    continue
+                edge = (target, tuple(sorted(canonicalize_name(extra) for extra in requirement.extras)))
+                marker = requirement.marker
+                if marker is None or marker.evaluate(dict(environment, extra="")):
+                    by_extra[None].append(edge)
+                    continue
+                # extraを指定したときだけ有効になる依存関係
+                for extra in item.get("extras", ()):
+                    if marker.evaluate(dict(environment, extra=extra)):
+                        by_extra.setdefault(extra, []).append(edge)
+            edges[name] = by_extra
+        return cls(edges)
+
+    def direct_dependencies(self):
+        """{パッケージ名: extraを指定しない場合の依存先の一覧}"""
+        return {name: [target for target, _ in by_extra[None]] for name, by_extra in self.edges.items()}
+
+    def shortest_paths(self, roots):
+        """roots から幅優先探索で到達できるパッケージと、最短経路の直前のパッケージを求める
+
+        戻り値は {パッケージ名: 直前のパッケージ名（rootsの場合はNone）} の辞書です。
+        各 (パッケージ, extra) を一度だけ訪れるため、グラフの大きさに比例した時間で終わります。
+        """
+        parents = {}
+        visited = set()
+        queue = deque()
+        for root in roots:
+            root = canonicalize_name(root)
+            if root in self.edges and root not in parents:
+                parents[root] = None
+                queue.append((root, None))
+                visited.add((root, None))
+
+        while queue:
+            name, extra = queue.popleft()
+            for target, extras in self.edges[name].get(extra, ()):
+                if target not in parents:
+                    parents[target] = name
+                for state in ((target, None),) + tuple((target, value) for value in extras):
+                    if state not in visited:
+                        visited.add(state)
+                        queue.append(state)
+        return parents
+
+
+def path_to(parents, name):
+    """最短経路（直接の依存パッケージから name まで）を返す（到達できない場合はNone）"""
+    name = canonicalize_name(name)
+    if name not in parents:
+        return None
+    path = [name]
+    while parents[path[-1]] is not None:
+        path.append(parents[path[-1]])
+    path.reverse()
+    return path
+
+
+def main(argv=None):
+    """指定したパッケージから到達できる各パッケージへの経路を表示"""
+    parser = argparse.ArgumentParser(description="依存関係グラフから到達できるパッケージを表示します")
+    parser.add_argument("roots", nargs="+", help="起点となるパッケージ名")
+    args = parser.parse_args(argv)
+
+    graph = DependencyGraph.from_inventory(collect_inventory())
+    parents = graph.shortest_paths(args.roots)
+    for name in sorted(parents):
+        print(" -> ".join(path_to(parents, name)))
+    return True
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(0 if main() else 1)
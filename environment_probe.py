@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+セットアップ用の環境チェック
+Python・pip・requirements.txt のパッケージ・Seleniumのインポート・Chromeのパスとバージョン
+（browser_discovery.py）・
+ChromeDriverの起動をまとめて1つのプロセスで確認し、結果をJSONで返します。
+
+チェックごとに新しいPythonを起動するとそのたびに起動とインポートの時間がかかるため、
+setup_beginner.py と setup_selenium.py はこのスクリプトを1回だけ別プロセスで実行します
+（パッケージのインストール直後でも、インストール後の状態を正しく確認できます）。
+結果は環境の指紋（Pythonの実行ファイル・site-packages・requirements.txt・Chromeの更新日時など）
+ごとに保存し、環境が変わっていなければプロセスを起動せずに前回の結果を使います。
+
+    python environment_probe.py            # 結果を表示
+    python environment_probe.py --driver   # ChromeDriverの起動も確認する
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import site
+import hashlib
+import logging
+import argparse
+import platform
+import importlib
+import importlib.util
+import subprocess
+from pathlib import Path
+from importlib import metadata
+
+import browser_discovery
+from browser_discovery import find_browser
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = ".environment_probe.json"
+# 保存しておく指紋の数（仮想環境とシステムのPythonを切り替えて使う場合など）
+MAX_CACHE_ENTRIES = 8
+REQUIREMENTS_PATH = "requirements.txt"
+MINIMUM_PYTHON = (3, 8)
+PROBE_TIMEOUT = 300
+
+# Web打刻ツールが使うSeleniumのモジュール
+SELENIUM_MODULES = (
+    "selenium.webdriver",
+    "selenium.webdriver.chrome.service",
+    "selenium.webdriver.chrome.options",
+    "webdriver_manager.chrome",
+)
+
+# webdriver-managerがダウンロードしたドライバーの一覧
+WDM_DRIVERS_JSON = Path.home() / ".wdm" / "drivers.json"
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _stat_key(path):
+    """ファイル・ディレクトリのサイズと更新日時（存在しない場合はNone）"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def site_directories():
+    """パッケージのインストール先のディレクトリ"""
+    directories = list(site.getsitepackages()) if hasattr(site, "getsitepackages") else []
+    user_site = site.getusersitepackages() if hasattr(site, "getusersitepackages") else None
+    if user_site:
+        directories.append(user_site)
+    return directories
+
+
+def installed_fingerprint():
+    """インストール済みパッケージの状態（site-packages の更新日時）"""
+    return {directory: _stat_key(directory) for directory in site_directories()}
+
+
+def environment_fingerprint(requirements_path=REQUIREMENTS_PATH, packages=(), driver=False):
+    """環境の指紋
+
+    pipでパッケージを追加・削除・更新すると site-packages に .dist-info ディレクトリが
+    作り直されてディレクトリの更新日時が変わるため、インストール状態の変化を検出できます。
+    """
+    try:
+        requirements_hash = _file_sha256(requirements_path)
+    except OSError:
+        requirements_hash = None
+    parts = {
+        "python": [sys.executable, _stat_key(sys.executable), platform.python_version()],
+        "platform": platform.platform(),
+        "path": os.environ.get("PATH", ""),
+        "site": installed_fingerprint(),
+        "requirements": requirements_hash,
+        "packages": sorted(packages),
+        "chrome": browser_discovery.fingerprint(),
+        "drivers": _stat_key(WDM_DRIVERS_JSON) if driver else None,
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def parse_requirements(path=REQUIREMENTS_PATH):
+    """requirements.txt の (パッケージ名, 指定) の一覧"""
+    requirements = []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return requirements
+    for line in lines:
+        line = line.split("#", 1)[0].strip()
+        if not line or line.startswith("-"):
+            continue
+        match = re.match(r"^([A-Za-z0-9][A-Za-z0-9._-]*)(.*)$", line)
+        if match:
+            requirements.append((match.group(1), match.group(2).strip()))
+    return requirements
+
+
+def _satisfies(installed, specifier):
+    """インストール済みのバージョンが指定を満たすか"""
+    if installed is None:
+        return False
+    specifier = specifier.split(";", 1)[0].strip()
+    if not specifier:
+        return True
+    try:
+        from packaging.specifiers import SpecifierSet
+        return SpecifierSet(specifier).contains(installed, prereleases=True)
+    except ImportError:
+        # packagingがまだインストールされていない場合は完全一致の指定だけを確認する
+        return specifier.startswith("==") and specifier[2:].strip() == installed
+    except Exception:
+        return False
+
+
+def _installed_version(name):
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def probe_python():
+    version = platform.python_version()
+    return {"executable": sys.executable, "version": version,
+            "ok": sys.version_info[:2] >= MINIMUM_PYTHON}
+
+
+def probe_pip():
+    version = _installed_version("pip")
+    ok = version is not None and importlib.util.find_spec("pip") is not None
+    return {"ok": ok, "version": version}
+
+
+def probe_packages(requirements_path=REQUIREMENTS_PATH, packages=()):
+    """requirements.txt と追加で指定したパッケージのインストール状態"""
+    result = {}
+    for name, specifier in parse_requirements(requirements_path):
+        installed = _installed_version(name)
+        result[name] = {"required": specifier, "installed": installed, "ok": _satisfies(installed, specifier)}
+    for name in packages:
+        if name not in result:
+            installed = _installed_version(name)
+            result[name] = {"required": "", "installed": installed, "ok": installed is not None}
+    return result
+
+
+def probe_modules(modules=SELENIUM_MODULES):
+    """モジュールを実際にインポートできるか"""
+    errors = {}
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            errors[module] = f"{type(e).__name__}: {e}"
+    return {"ok": not errors, "errors": errors}
+
+
+def probe_chrome():
+    """Chromeのパスとバージョン（ブラウザは起動せず、ディスク上の情報から取得する）"""
+    browser = find_browser()
+    if browser is None:
+        return {"found": False, "path": None, "version": None}
+    return {"found": True, "path": browser["path"], "version": browser["version"], "name": browser["name"]}
+
+
+def probe_driver():
+    """ChromeDriverを用意し、ヘッドレスのChromeが起動できるか確認"""
+    result = {"checked": True, "ok": False, "path": None, "hash": None, "error": None}
+    try:
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service
+        from selenium.webdriver.chrome.options import Options
+        from webdriver_manager.chrome import ChromeDriverManager
+
+        driver_path = ChromeDriverManager().install()
+        result["path"] = driver_path
+        result["hash"] = _file_sha256(driver_path)
+
+        options = Options()
+        options.add_argument("--headless=new")
+        options.add_argument("--no-sandbox")
+        options.add_argument("--disable-dev-shm-usage")
+        driver = webdriver.Chrome(service=Service(driver_path), options=options)
+        driver.quit()
+        result["ok"] = True
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def collect(requirements_path=REQUIREMENTS_PATH, packages=(), driver=False):
+    """すべてのチェックを現在のプロセスで実行"""
+    start = time.perf_counter()
+    result = {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": probe_python(),
+        "pip": probe_pip(),
+        "packages": probe_packages(requirements_path, packages),
+        "selenium": probe_modules(),
+        "chrome": probe_chrome(),
+        "driver": probe_driver() if driver else {"checked": False},
+    }
+    result["requirements_satisfied"] = all(
+        item["ok"] for name, item in result["packages"].items() if name not in packages)
+    result["elapsed"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+class ProbeCache:
+    """環境の指紋ごとのチェック結果"""
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self._entries = {}
+        if path:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+
+    def get(self, fingerprint, driver=False):
+        entry = self._entries.get(fingerprint)
+        if entry is None:
+            return None
+        # ChromeDriverの確認が必要なのに、前回は確認していない（または失敗した）場合は使わない
+        if driver and not entry["driver"].get("ok"):
+            return None
+        return entry
+
+    def latest_driver(self):
+        """最後に動作を確認できたChromeDriverのパス"""
+        for entry in reversed(list(self._entries.values())):
+            if entry["driver"].get("ok"):
+                return entry["driver"]["path"]
+        return None
+
+    def put(self, fingerprint, result):
+        self._entries.pop(fingerprint, None)
+        self._entries[fingerprint] = result
+        while len(self._entries) > MAX_CACHE_ENTRIES:
+            del self._entries[next(iter(self._entries))]
+        if not self.path:
+            return
+        temp_path = f"{self.path}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.warning(f"環境チェックの結果を保存できませんでした: {e}")
+
+
+def run_probe(driver=False, packages=(), requirements_path=REQUIREMENTS_PATH, cache_path=CACHE_PATH,
+              python=None):
+    """環境チェックを別プロセスで1回だけ実行して結果を返す
+
+    環境の指紋が前回と同じであれば、プロセスを起動せずに保存した結果を返します。
+    別のPython（python）を指定した場合は指紋を計算できないため、常にチェックします。
+    チェックを実行できなかった場合はNoneを返します。
+    """
+    python = python or sys.executable
+    use_cache = cache_path and os.path.abspath(python) == os.path.abspath(sys.executable)
+    cache = ProbeCache(cache_path if use_cache else None)
+    fingerprint = environment_fingerprint(requirements_path, packages, driver) if use_cache else None
+    if use_cache:
+        cached = cache.get(fingerprint, driver)
+        if cached is not None:
+            logger.info("環境が前回のチェックから変わっていないため、前回の結果を使います")
+            return dict(cached, cached=True)
+
+    command = [python, str(Path(__file__).resolve()), "--json", "--requirements", requirements_path]
+    if driver:
+        command.append("--driver")
+    if packages:
+        command += ["--packages", *packages]
+    try:
+        # Windowsのパイプは既定でANSIコードページ（cp932など）になるため、子プロセスの入出力をUTF-8に揃える
+        completed = subprocess.run(command, check=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   text=True, encoding="utf-8", errors="replace", timeout=PROBE_TIMEOUT,
+                                   env={**os.environ, "PYTHONIOENCODING": "utf-8"})
+        result = json.loads(completed.stdout)
+    except subprocess.TimeoutExpired:
+        logger.error("環境チェックがタイムアウトしました")
+        return None
+    except (OSError, ValueError) as e:
+        logger.error(f"環境チェックを実行できませんでした: {e}")
+        return None
+
+    if use_cache:
+        # ChromeDriverのダウンロードで drivers.json が更新されるため、チェック後の状態で指紋を取り直す
+        cache.put(environment_fingerprint(requirements_path, packages, driver), result)
+    return dict(result, cached=False)
+
+
+def print_result(result):
+    """チェック結果を表示"""
+    mark = {True: "✅", False: "❌"}
+    print(f"{mark[result['python']['ok']]} Python {result['python']['version']} ({result['python']['executable']})")
+    print(f"{mark[result['pip']['ok']]} pip {result['pip']['version'] or '-'}")
+    missing = [name for name, item in result["packages"].items() if not item["ok"]]
+    print(f"{mark[not missing]} パッケージ: {len(result['packages']) - len(missing)}/{len(result['packages'])}")
+    for name in missing:
+        item = result["packages"][name]
+        print(f"   - {name}{item['required']}（インストール済み: {item['installed'] or 'なし'}）")
+    print(f"{mark[result['selenium']['ok']]} Seleniumのインポート")
+    for module, error in result["selenium"]["errors"].items():
+        print(f"   - {module}: {error}")
+    chrome = result["chrome"]
+    print(f"{mark[chrome['found']]} Chrome: {chrome['path'] or '見つかりません'} {chrome['version'] or ''}")
+    if result["driver"].get("checked"):
+        driver = result["driver"]
+        print(f"{mark[driver['ok']]} ChromeDriver: {driver['path'] or '-'} {driver['error'] or ''}")
+
+
+def main(argv=None):
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description="セットアップに必要な環境をまとめて確認します")
+    parser.add_argument("--driver", action="store_true", help="ChromeDriverの用意とChromeの起動も確認する")
+    parser.add_argument("--requirements", default=REQUIREMENTS_PATH, help="requirements.txt のパス")
+    parser.add_argument("--packages", nargs="*", default=[], help="追加で確認するパッケージ名")
+    parser.add_argument("--json", action="store_true",
+                        help="このプロセスでチェックし、結果をJSONで標準出力に書き出す（保存した結果は使わない）")
+    parser.add_argument("--no-cache", action="store_true", help="保存した結果を使わずにチェックする")
+    args = parser.parse_args(argv)
+
+    if args.json:
+        result = collect(args.requirements, args.packages, args.driver)
+        # 日本語のパスやエラーメッセージを含んでも、標準出力のエンコーディングに関係なく読めるようにする
+        json.dump(result, sys.stdout, ensure_ascii=True)
+        sys.stdout.write("\n")
+        return True
+
+    result = run_probe(args.driver, args.packages, args.requirements, None if args.no_cache else CACHE_PATH)
+    if result is None:
+        return False
+    print_result(result)
+    return (result["python"]["ok"] and result["pip"]["ok"] and result["requirements_satisfied"]
+            and result["selenium"]["ok"] and result["chrome"]["found"]
+            and (not args.driver or result["driver"]["ok"]))
+
+
+if __name__ == "__main__":
+    # --json の場合、標準出力はJSONだけにするためログは標準エラーに出力する
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+    sys.exit(0 if main() else 1)
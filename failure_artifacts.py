@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+打刻失敗時の証跡保存
+ログインや打刻に失敗したときのスクリーンショット・ページHTML・
+ブラウザのコンソールログを取得し、バックグラウンドでzipに圧縮して
+容量上限付きの保存先に保管します。
+"""
+
+import os
+import json
+import uuid
+import queue
+import logging
+import zipfile
+import threading
+from pathlib import Path
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class ArtifactStore:
+    """容量上限付きの証跡保存クラス
+
+    証跡は1件1つのzipファイルとして保存します。合計サイズが max_bytes を
+    超えた場合は、保存した時刻（更新日時）が古いものから削除します。
+    """
+
+    def __init__(self, directory="artifacts", max_bytes=50 * 1024 * 1024, max_pending=8):
+        """初期化"""
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, name="ArtifactStore", daemon=True)
+        self._worker.start()
+
+    def capture(self, driver, label):
+        """ブラウザの状態を取得して圧縮を予約し、保存先のパスを返す
+
+        ブラウザからの取得だけを呼び出し元のスレッドで行い、圧縮と書き込みは
+        バックグラウンドスレッドで行います。取得できなかった項目は省略します。
+        """
+        if driver is None:
+            return None
+
+        files = {}
+        try:
+            files["screenshot.png"] = driver.get_screenshot_as_png()
+        except Exception as e:
+            logger.warning(f"スクリーンショットの取得に失敗しました: {e}")
+        try:
+            files["page.html"] = driver.page_source.encode("utf-8")
+        except Exception as e:
+            logger.warning(f"ページHTMLの取得に失敗しました: {e}")
+        try:
+            console = driver.get_log("browser")
+            files["console.json"] = json.dumps(console, ensure_ascii=False, indent=2).encode("utf-8")
+        except Exception as e:
+            logger.warning(f"コンソールログの取得に失敗しました: {e}")
+
+        meta = {"label": label, "captured_at": datetime.now().isoformat(timespec="seconds")}
+        try:
+            meta["url"] = driver.current_url
+        except Exception:
+            pass
+        files["meta.json"] = json.dumps(meta, ensure_ascii=False, indent=2).encode("utf-8")
+
+        artifact_id = f"{datetime.now():%Y%m%d_%H%M%S}_{label}_{uuid.uuid4().hex[:6]}"
+        path = self.directory / f"{artifact_id}.zip"
+        try:
+            self._queue.put_nowait((path, files))
+        except queue.Full:
+            logger.warning(f"証跡の保存待ちが多すぎるため破棄しました: {artifact_id}")
+            return None
+        return str(path)
+
+    def flush(self, timeout=None):
+        """保存待ちの証跡がすべて書き込まれるまで待つ"""
+        if timeout is None:
+            self._queue.join()
+            return True
+        done = threading.Event()
+        threading.Thread(target=lambda: (self._queue.join(), done.set()), daemon=True).start()
+        return done.wait(timeout)
+
+    def _run(self):
+        """圧縮スレッドの処理"""
+        while True:
+            path, files = self._queue.get()
+            try:
+                self._write(path, files)
+                self._evict(keep=path)
+            except Exception as e:
+                logger.error(f"証跡の保存に失敗しました: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, path, files):
+        """証跡をzipに圧縮して保存"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_suffix(".tmp")
+        with zipfile.ZipFile(temp_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for name, data in files.items():
+                # PNGは圧縮済みのため再圧縮しない
+                compress_type = zipfile.ZIP_STORED if name.endswith(".png") else zipfile.ZIP_DEFLATED
+                archive.writestr(name, data, compress_type=compress_type)
+        os.replace(temp_path, path)
+        logger.info(f"証跡を保存しました: {path}")
+
+    def _evict(self, keep=None):
+        """合計サイズが上限を超えた分を、保存が古いものから削除（keep は削除しない）"""
+        with self._lock:
+            entries = []
+            total = 0
+            for path in self.directory.glob("*.zip"):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                total += stat.st_size
+                # 保存したばかりの証跡は、それだけで上限を超えていても残す（ログに出したパスを消さない）
+                if path != keep:
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    path.unlink()
+                    total -= size
+                    logger.info(f"容量上限のため証跡を削除しました: {path}")
+                except OSError as e:
+                    logger.warning(f"証跡の削除に失敗しました: {e}")
+            if total > self.max_bytes:
+                logger.warning(f"保存した証跡だけで容量上限を超えています: {keep}")
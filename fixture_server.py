@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+check_dependencies.py のテスト用ローカルサーバー
+PyPIのJSON API・プロジェクトページ・pypistatsの /recent・Safety DB の代わりに
+応答を返します。インターネットに接続せずにチェック処理の動作確認や性能測定ができます。
+
+応答は --fixtures のディレクトリに記録したものがあればそれを返し、なければ
+パッケージ名から決まる合成データを返します（--record で本物の応答を記録できます）。
+遅延（--latency, --jitter）とエラー率（--error-rate）を指定でき、
+/__stats でURLの種類ごとのリクエスト数を取得できます。
+
+    python fixture_server.py --port 8765 --latency 0.05 --error-rate 0.01
+    python check_dependencies.py --pypi-url http://127.0.0.1:8765 \\
+        --pypistats-url http://127.0.0.1:8765 \\
+        --safety-db-url http://127.0.0.1:8765/safety-db/insecure_full.json --no-cache
+"""
+
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import logging
+import argparse
+import threading
+from pathlib import Path
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+logger = logging.getLogger(__name__)
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+ROUTES = (
+    ("pypi", re.compile(r"^/pypi/(?P<package>[^/]+)/json$")),
+    ("project", re.compile(r"^/project/(?P<package>[^/]+)/(?P<version>[^/]+)/$")),
+    ("pypistats", re.compile(r"^/api/packages/(?P<package>[^/]+)/recent$")),
+    ("safety_db", re.compile(r"^/safety-db/insecure_full\.json$")),
+)
+
+# 記録する本物の問い合わせ先
+UPSTREAM_URLS = {
+    "pypi": "https://pypi.org/pypi/{package}/json",
+    "project": "https://pypi.org/project/{package}/{version}/",
+    "pypistats": "https://pypistats.org/api/packages/{package}/recent",
+    "safety_db": "https://raw.githubusercontent.com/pyupio/safety-db/master/data/insecure_full.json",
+}
+
+# 合成データで脆弱性を持たせるパッケージの割合（名前のハッシュで決める）
+SYNTHETIC_VULNERABLE_RATE = 0.1
+
+
+def _seed(name):
+    """パッケージ名から決まる疑似乱数の種"""
+    return int.from_bytes(hashlib.sha256(name.encode("utf-8")).digest()[:8], "little")
+
+
+def synthetic_pypi(package):
+    """PyPIのJSON APIの合成データ"""
+    rng = random.Random(_seed(package))
+    versions = [f"{major}.{minor}.0" for major in range(1, 3) for minor in range(rng.randint(1, 5))]
+    releases = {
+        version: [{
+            "filename": f"{package}-{version}.tar.gz",
+            "upload_time": f"20{20 + i // 3:02d}-{i % 12 + 1:02d}-01T00:00:00",
+            "downloads": -1,
+        }]
+        for i, version in enumerate(versions)
+    }
+    return {
+        "info": {
+            "name": package,
+            "version": versions[-1],
+            "author": f"{package} developers",
+            "author_email": f"dev@{package}.example",
+            "home_page": f"https://{package}.example",
+            "project_url": f"https://pypi.org/project/{package}/",
+            "summary": f"Synthetic package {package}",
+        },
+        "releases": releases,
+    }
+
+
+def synthetic_project_page(package, version):
+    """PyPIのプロジェクトページの合成データ"""
+    return (f"<!DOCTYPE html><html><head><title>{package} {version}</title></head>"
+            f"<body><h1>{package} {version}</h1><p>{'x' * 2000}</p></body></html>")
+
+
+def synthetic_pypistats(package):
+    """pypistatsの /recent の合成データ"""
+    rng = random.Random(_seed(package) ^ 1)
+    month = int(10 ** rng.uniform(2, 8))
+    return {"data": {"last_day": month // 30, "last_week": month // 4, "last_month": month},
+            "package": package, "type": "recent_downloads"}
+
+
+def synthetic_safety_db(packages):
+    """Safety DB（insecure_full.json）の合成データ"""
+    data = {"$meta": {"advisory": "synthetic", "timestamp": 0}}
+    for package in packages:
+        rng = random.Random(_seed(package) ^ 2)
+        if rng.random() >= SYNTHETIC_VULNERABLE_RATE:
+            continue
+        data[package] = [{
+            "id": f"pyup.io-{rng.randint(10000, 99999)}",
+            "cve": None,
+            "advisory": f"Synthetic advisory for {package}",
+            "specs": [f"<{rng.randint(1, 3)}.{rng.randint(0, 5)}.0"],
+            "v": "",
+        }]
+    return data
+
+
+class FixtureStore:
+    """記録済みの応答と合成データ"""
+
+    def __init__(self, directory=FIXTURES_DIR, packages=()):
+        self.directory = Path(directory)
+        self.packages = list(packages)
+        self._safety_db = None
+        self._lock = threading.Lock()
+
+    def _path(self, route, params):
+        if route == "safety_db":
+            return self.directory / "safety_db.json"
+        if route == "project":
+            return self.directory / route / f"{params['package']}-{params['version']}.html"
+        return self.directory / route / f"{params['package']}.json"
+
+    def get(self, route, params):
+        """(ステータスコード, Content-Type, 本文) を返す"""
+        path = self._path(route, params)
+        if path.exists():
+            content_type = "text/html; charset=utf-8" if path.suffix == ".html" else "application/json"
+            return 200, content_type, path.read_bytes()
+
+        if route == "pypi":
+            body = json.dumps(synthetic_pypi(params["package"]))
+        elif route == "project":
+            return 200, "text/html; charset=utf-8", synthetic_project_page(**params).encode("utf-8")
+        elif route == "pypistats":
+            body = json.dumps(synthetic_pypistats(params["package"]))
+        else:
+            with self._lock:
+                if self._safety_db is None:
+                    self._safety_db = json.dumps(synthetic_safety_db(self.packages)).encode("utf-8")
+            return 200, "application/json", self._safety_db
+        return 200, "application/json", body.encode("utf-8")
+
+    def record(self, route, params, timeout=30):
+        """本物の問い合わせ先から応答を取得して保存"""
+        import requests
+
+        url = UPSTREAM_URLS[route].format(**params)
+        try:
+            response = requests.get(url, timeout=timeout)
+            response.raise_for_status()
+        except Exception as e:
+            logger.error(f"応答を記録できませんでした: {url}: {e}")
+            return False
+        path = self._path(route, params)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(response.content)
+        logger.info(f"応答を記録しました: {path}")
+        return True
+
+
+class FixtureServer:
+    """別スレッドで動くテスト用HTTPサーバー"""
+
+    def __init__(self, store, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, error_rate=0.0, seed=0):
+        self.store = store
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.stats = {route: 0 for route, _ in ROUTES}
+        self.stats["errors"] = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def safety_db_url(self):
+        return self.base_url + "/safety-db/insecure_full.json"
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # ヘッダーと本文を別々に送るため、Nagleアルゴリズムによる遅延を避ける
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                server.handle(self)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return Handler
+
+    def _draw(self):
+        """遅延時間とエラーにするかを決める"""
+        with self._lock:
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            failed = self._random.random() < self.error_rate
+        return delay, failed
+
+    def handle(self, request):
+        """1件のリクエストに応答"""
+        path = request.path.split("?", 1)[0]
+        if path == "/__stats":
+            with self._lock:
+                body = json.dumps(self.stats).encode("utf-8")
+            return self._send(request, 200, "application/json", body)
+
+        for route, pattern in ROUTES:
+            match = pattern.match(path)
+            if match:
+                break
+        else:
+            return self._send(request, 404, "application/json", b'{"message": "Not Found"}')
+
+        delay, failed = self._draw()
+        with self._lock:
+            self.stats[route] += 1
+            if failed:
+                self.stats["errors"] += 1
+        if delay:
+            time.sleep(delay)
+        if failed:
+            return self._send(request, 503, "text/plain", b"Service Unavailable")
+        status, content_type, body = self.store.get(route, match.groupdict())
+        self._send(request, status, content_type, body)
+
+    @staticmethod
+    def _send(request, status, content_type, body):
+        request.send_response(status)
+        request.send_header("Content-Type", content_type)
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+    def serve_forever(self):
+        """サーバーを現在のスレッドで動かす"""
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._httpd.server_close()
+
+    def start(self):
+        """サーバーを別スレッドで起動"""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """サーバーを停止"""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def main(argv=None):
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description="check_dependencies.py のテスト用ローカルサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fixtures", default=str(FIXTURES_DIR), help="記録済みの応答のディレクトリ")
+    parser.add_argument("--latency", type=float, default=0.0, help="応答までの遅延（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="遅延のばらつき（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="503を返す割合（0〜1）")
+    parser.add_argument("--packages", nargs="*", default=[], help="合成のSafety DBに含めるパッケージ名")
+    # 数千件の名前をコマンドラインに並べると、Windowsのコマンドラインの長さの上限（32767文字）を超えるため
+    parser.add_argument("--count", type=int, default=0,
+                        help="--name-pattern の名前を0番からこの数だけ合成のSafety DBに含める")
+    parser.add_argument("--name-pattern", default="bench-pkg-{:05d}", help="--count で作るパッケージ名の書式")
+    parser.add_argument("--record", nargs="*", metavar="PACKAGE==VERSION",
+                        help="本物の問い合わせ先から応答を記録して終了する")
+    args = parser.parse_args(argv)
+
+    packages = args.packages + [args.name_pattern.format(i) for i in range(args.count)]
+    store = FixtureStore(args.fixtures, packages)
+    if args.record is not None:
+        success = store.record("safety_db", {})
+        for item in args.record:
+            package, _, version = item.partition("==")
+            success &= store.record("pypi", {"package": package})
+            success &= store.record("pypistats", {"package": package})
+            if version:
+                success &= store.record("project", {"package": package, "version": version})
+        return success
+
+    server = FixtureServer(store, args.host, args.port, args.latency, args.jitter, args.error_rate)
+    print(f"テスト用サーバーを起動しました: {server.base_url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return True
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+HTTPレスポンスの永続キャッシュ
+ETag/Last-Modifiedによる条件付きリクエストとエンドポイントごとの有効期限で、
+同じ内容の再ダウンロードを避けます。
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class CachedResponse:
+    """キャッシュから返すレスポンス（requests.Responseの必要な部分のみ）"""
+
+    def __init__(self, status_code, content, headers=None, from_cache=False):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.from_cache = from_cache
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class HttpCache:
+    """ディスク上のHTTPキャッシュ
+
+    1件ごとに本文（.body）とメタ情報（.json）を保存します。
+    ttls はURLの先頭部分と有効期限（秒）の対応で、最も長く一致したものを使います。
+    有効期限内はネットワークにアクセスせず、期限切れの場合は条件付きリクエストで
+    更新の有無だけを確認します。
+    """
+
+    # キャッシュするステータスコード（404は「存在しない」ことを覚えておく）
+    CACHEABLE_STATUS = (200, 404)
+
+    def __init__(self, directory=".http_cache", ttls=None, default_ttl=3600,
+                 max_bytes=200 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.ttls = sorted((ttls or {}).items(), key=lambda item: len(item[0]), reverse=True)
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.stats = {"fresh": 0, "revalidated": 0, "downloaded": 0, "stale": 0}
+        self._stats_lock = threading.Lock()
+
+    def ttl_for(self, url):
+        """URLに対応する有効期限（秒）"""
+        for prefix, ttl in self.ttls:
+            if url.startswith(prefix):
+                return ttl
+        return self.default_ttl
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self.directory / f"{key}.json", self.directory / f"{key}.body"
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _load(self, url):
+        """キャッシュ済みのメタ情報と本文を読み込む"""
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None, None
+        if meta.get("url") != url:
+            return None, None
+        return meta, body
+
+    def _store(self, url, meta, body=None):
+        """メタ情報と本文を書き込む（一時ファイル経由で置き換え）"""
+        meta_path, body_path = self._paths(url)
+        suffix = f".{threading.get_ident()}.tmp"
+        try:
+            if body is not None:
+                temp_body = body_path.with_name(body_path.name + suffix)
+                with open(temp_body, "wb") as f:
+                    f.write(body)
+                os.replace(temp_body, body_path)
+            temp_meta = meta_path.with_name(meta_path.name + suffix)
+            with open(temp_meta, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            os.replace(temp_meta, meta_path)
+        except OSError as e:
+            logger.warning(f"キャッシュの書き込みに失敗しました: {e}")
+
+    def get(self, session, url, timeout=10, rate_limiter=None):
+        """キャッシュを使ってGETリクエストを送信"""
+        meta, body = self._load(url)
+        now = time.time()
+
+        if meta and now - meta["fetched_at"] < self.ttl_for(url):
+            self._count("fresh")
+            return CachedResponse(meta["status"], body, meta.get("headers"), from_cache=True)
+
+        headers = {}
+        if meta and meta["status"] == 200:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        if rate_limiter:
+            rate_limiter.wait(url)
+        try:
+            response = session.get(url, headers=headers, timeout=timeout)
+        except Exception:
+            # 取得に失敗した場合は期限切れのキャッシュでも使う
+            if meta:
+                self._count("stale")
+                logger.warning(f"取得に失敗したため期限切れのキャッシュを使用します: {url}")
+                return CachedResponse(meta["status"], body, meta.get("headers"), from_cache=True)
+            raise
+
+        if response.status_code == 304 and meta:
+            self._count("revalidated")
+            meta["fetched_at"] = now
+            self._store(url, meta)
+            return CachedResponse(meta["status"], body, meta.get("headers"), from_cache=True)
+
+        self._count("downloaded")
+        if response.status_code in self.CACHEABLE_STATUS:
+            content_type = response.headers.get("Content-Type", "")
+            self._store(url, {
+                "url": url,
+                "status": response.status_code,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "headers": {"Content-Type": content_type},
+                "fetched_at": now,
+            }, response.content)
+        return CachedResponse(response.status_code, response.content, dict(response.headers))
+
+    def prune(self):
+        """合計サイズが上限を超えた分を、取得日時が古いものから削除"""
+        entries = []
+        total = 0
+        for meta_path in self.directory.glob("*.json"):
+            body_path = meta_path.with_suffix(".body")
+            try:
+                size = meta_path.stat().st_size + body_path.stat().st_size
+                mtime = meta_path.stat().st_mtime
+            except OSError:
+                continue
+            entries.append((mtime, size, meta_path, body_path))
+            total += size
+
+        entries.sort()
+        removed = 0
+        for _, size, meta_path, body_path in entries:
+            if total <= self.max_bytes:
+                break
+            for path in (meta_path, body_path):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+            total -= size
+            removed += 1
+        if removed:
+            logger.info(f"キャッシュの容量上限を超えたため{removed}件を削除しました")
+        return removed
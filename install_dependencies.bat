@@ -20,6 +20,17 @@ REM Check Python version
 python --version
 echo.
 
+REM Install from the local wheelhouse (no internet access) if one was built
+if exist wheelhouse\manifest.json (
+    echo Installing required libraries from the wheelhouse...
+    echo.
+    python wheelhouse.py install
+    if not errorlevel 1 goto installed
+    echo.
+    echo The wheelhouse could not be used. Installing from the internet instead...
+    echo.
+)
+
 echo Installing required libraries...
 echo This may take a few minutes.
 echo.
@@ -30,6 +41,7 @@ python -m pip install --upgrade pip
 REM Install libraries from requirements.txt
 python -m pip install -r requirements.txt
 
+:installed
 if %errorlevel% neq 0 (
     echo.
     echo ERROR: Failed to install libraries.
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+非同期ログパイプライン
+QueueHandler/QueueListenerでファイル書き込みを専用スレッドに移し、
+人が読むテキストログとJSON Lines形式の構造化ログを同時に出力します。
+"""
+
+import json
+import time
+import uuid
+import queue
+import atexit
+import logging
+import logging.handlers
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# 構造化ログに出力する追加フィールド
+STRUCTURED_FIELDS = ("punch_id", "phase", "duration", "account", "result", "artifact")
+
+_queue = None
+_listener = None
+_lock = threading.Lock()
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """上限付きキューに書き込むハンドラ
+
+    キューが満杯のときは block_timeout 秒だけ待ち、それでも空かなければ
+    レコードを破棄して件数を数えます。破棄件数は次に書き込めたときに
+    警告として出力します。
+    """
+
+    def __init__(self, log_queue, block_timeout=0.01):
+        super().__init__(log_queue)
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def enqueue(self, record):
+        """レコードをキューに追加"""
+        try:
+            self.queue.put(record, timeout=self.block_timeout)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+            return
+
+        if self.dropped:
+            with self._dropped_lock:
+                dropped, self.dropped = self.dropped, 0
+            notice = logging.LogRecord(
+                record.name, logging.WARNING, __file__, 0,
+                f"ログキューが満杯のため{dropped}件のログを破棄しました", None, None
+            )
+            try:
+                self.queue.put_nowait(notice)
+            except queue.Full:
+                with self._dropped_lock:
+                    self.dropped += dropped
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """1レコード1行のJSON形式で出力するフォーマッタ"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def setup_logging(log_file="web_dakoku.log", structured_file="web_dakoku.jsonl",
+                  level=logging.INFO, queue_size=10000):
+    """ルートロガーを非同期パイプラインに切り替える"""
+    global _queue, _listener
+
+    with _lock:
+        if _listener is not None:
+            return _listener
+
+        text_handler = logging.FileHandler(log_file, encoding="utf-8")
+        text_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+        json_handler = logging.FileHandler(structured_file, encoding="utf-8")
+        json_handler.setFormatter(JsonLinesFormatter())
+
+        _queue = queue.Queue(maxsize=queue_size)
+        _listener = logging.handlers.QueueListener(
+            _queue, text_handler, json_handler, respect_handler_level=True
+        )
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(BoundedQueueHandler(_queue))
+        root.setLevel(level)
+
+        _listener.start()
+        atexit.register(shutdown_logging)
+        return _listener
+
+
+def flush_logging(timeout=2.0):
+    """キューに溜まっているログがファイルに書き出されるまで待つ"""
+    if _queue is None or _listener is None:
+        return True
+
+    deadline = time.monotonic() + timeout
+    while _queue.unfinished_tasks:
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def shutdown_logging(timeout=2.0):
+    """ログを書き出してリスナースレッドを停止する"""
+    global _listener
+
+    with _lock:
+        if _listener is None:
+            return
+        flush_logging(timeout)
+        try:
+            _listener.stop()
+        except queue.Full:
+            logging.getLogger(__name__).warning("ログリスナーの停止に失敗しました")
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def new_punch_id():
+    """打刻処理ごとの識別子を生成"""
+    return uuid.uuid4().hex[:12]
+
+
+@contextmanager
+def punch_phase(punch_id, phase, account="", logger=None):
+    """打刻フェーズの所要時間と結果を構造化ログとして記録
+
+    ブロック内で state["result"] を設定すると、その値が結果として記録されます。
+    例外が発生した場合は "error" として記録し、例外はそのまま送出します。
+    """
+    logger = logger or logging.getLogger("web_dakoku.punch")
+    state = {"result": "success"}
+    start = time.perf_counter()
+    try:
+        yield state
+    except Exception as e:
+        state["result"] = "error"
+        state.setdefault("error", str(e))
+        raise
+    finally:
+        duration = round(time.perf_counter() - start, 3)
+        level = logging.INFO if state["result"] == "success" else logging.WARNING
+        message = f"打刻処理 {phase}: {state['result']} ({duration}秒)"
+        if state.get("error"):
+            message += f" - {state['error']}"
+        if state.get("artifact"):
+            message += f" [証跡: {state['artifact']}]"
+        logger.log(level, message, extra={
+            "punch_id": punch_id,
+            "phase": phase,
+            "duration": duration,
+            "account": account,
+            "result": state["result"],
+            "artifact": state.get("artifact"),
+        })
@@ -5,11 +5,10 @@ import sys
 import os
 import time
 import datetime
-import schedule
 import threading
 import json
 import logging
-from datetime import datetime, time as dt_time
+from datetime import datetime, timedelta
 from pathlib import Path
 
 from PySide6.QtWidgets import (QApplication, QSystemTrayIcon, QMenu, 
@@ -24,18 +23,52 @@ from PySide6.QtCore import Qt, QTimer, Signal, Slot, QObject, QTime
 
 from config_manager import ConfigManager
 from web_dakoku import WebDakoku
-from create_icon import create_clock_icon
+from create_icon import IconFactory
+from failure_artifacts import ArtifactStore
+from browser_discovery import find_browser
+from punch_rules import RuleIndex, rules_from_config, occurrence_date
+from work_calendar import calendar_from_config
+from clock_watch import ClockWatch, install_resume_listener, describe as describe_clock_change
+from log_pipeline import (setup_logging, flush_logging, shutdown_logging,
+                          new_punch_id, punch_phase)
 
-# ロガーの設定
-logging.basicConfig(
-    filename='web_dakoku.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
+# ロガーの設定（ファイル書き込みは専用スレッドで行う）
+setup_logging(
+    log_file='web_dakoku.log',
+    structured_file='web_dakoku.jsonl',
+    level=logging.INFO
 )
 
+# 次の打刻ルールまでタイマーで待つ最大の時間（ミリ秒、QTimerの上限を超えないように）
+MAX_RULE_WAIT = 24 * 60 * 60 * 1000
+# 開始時刻からこれ以上遅れてチェックしたルールは、スリープなどで実行できなかったものとして扱う（秒）
+MISSED_GRACE = 120
+# スリープから復帰してからチェックするまでの時間（ミリ秒、ネットワークの再接続を待つ）
+RESUME_DELAY = 10 * 1000
+# OSの通知を受け取れない環境で、時刻の変更・スリープを検出するための確認の間隔（ミリ秒）
+CLOCK_CHECK_INTERVAL = 60 * 1000
+# 打刻処理中のアニメーションのコマの間隔（ミリ秒）
+ANIMATION_INTERVAL = 150
+# 打刻の種類ごとの (実行するフェーズ, 成功時の状態, 成功時の通知, 失敗時の通知)
+PUNCH_JOBS = {
+    "auto_clock_in": ("clock_in", "clocked_in", ("自動出勤打刻", "出勤打刻が完了しました"),
+                      ("自動出勤打刻エラー", "出勤打刻に失敗しました")),
+    "clock_in": ("clock_in", "clocked_in", ("出勤打刻完了", "出勤打刻が完了しました"),
+                 ("出勤打刻エラー", "出勤打刻に失敗しました")),
+    "clock_out": ("clock_out", "clocked_out", ("退勤打刻完了", "退勤打刻が完了しました"),
+                  ("退勤打刻エラー", "退勤打刻に失敗しました")),
+    "auto_clock_out": ("clock_out", "clocked_out", ("自動退勤打刻", "退勤打刻が完了しました"),
+                       ("自動退勤打刻エラー", "退勤打刻に失敗しました")),
+}
+
 class DakokuApp(QApplication):
     """打刻アプリケーションのメインクラス"""
     
+    # トレイアイコンの状態の変更（打刻処理のスレッドからも変更できるようシグナルで通知する）
+    tray_state_changed = Signal(str)
+    # 打刻の完了（打刻の種類, 成功したか）
+    punch_finished = Signal(str, bool)
+    
     def __init__(self, argv):
         super().__init__(argv)
         self.setQuitOnLastWindowClosed(False)
@@ -46,6 +79,13 @@ class DakokuApp(QApplication):
         # Web打刻ハンドラの初期化
         self.web_dakoku = WebDakoku(self.config_manager)
         
+        # 失敗時の証跡保存先の初期化
+        self.artifact_store = ArtifactStore("artifacts")
+        
+        # ブラウザの検出（結果はキャッシュされ、セットアップと共有する）
+        self.browser = None
+        self.detect_browser()
+        
         # アイコンの準備
         self.prepare_icon()
         
@@ -60,44 +100,131 @@ class DakokuApp(QApplication):
         # 定期チェックタイマーの設定
         self.check_timer = QTimer(self)
         self.check_timer.timeout.connect(self.check_dakoku)
-        self.check_timer.start(15 * 60 * 1000)  # 15分ごとにチェック
+        self.check_timer.start(15 * 60 * 1000)  # 15分ごとにチェック（確認・通知の繰り返し）
         
-        # 日付変更チェックタイマーの設定
-        self.date_check_timer = QTimer(self)
-        self.date_check_timer.timeout.connect(self.check_date_change)
-        self.date_check_timer.start(60 * 60 * 1000)  # 1時間ごとにチェック
+        # 打刻ルールの設定（次にルールが始まる時刻と日付が変わる時刻にチェックする）
+        self.setup_punch_rules()
         
-        # 自動退勤タイマーの設定
-        self.setup_auto_clock_out()
+        # スリープからの復帰・時刻の変更の検出
+        self.setup_clock_watch()
         
         # 初回起動時のチェック
         self.check_dakoku()
         
-        # 自動退勤タイマー
-        self.auto_end_timer = QTimer(self)
-        self.auto_end_timer.timeout.connect(self.check_auto_end)
-        self.auto_end_timer.start(60000)  # 1分ごとにチェック
-        
         # UIのセットアップ
         self.setup_ui()
     
+    def detect_browser(self):
+        """Chrome/Chromiumの検出（起動を遅らせないよう別スレッドで行う）"""
+        def run_detect():
+            try:
+                self.browser = find_browser()
+            except Exception as e:
+                logging.error(f"ブラウザの検出中にエラーが発生しました: {e}")
+                return
+            if self.browser:
+                logging.info(f"{self.browser['name']}を検出しました: {self.browser['path']} "
+                             f"(バージョン {self.browser['version'] or '不明'})")
+            else:
+                logging.warning("Chrome/Chromiumが見つかりませんでした。打刻にはGoogle Chromeが必要です")
+        
+        threading.Thread(target=run_detect, daemon=True).start()
+    
     def prepare_icon(self):
-        """アイコンの準備"""
+        """アイコンの準備（状態ごと・サイズごとのアイコンをメモリに読み込んでおく）"""
         icon_dir = Path(__file__).parent / "icons"
         icon_dir.mkdir(exist_ok=True)
         
-        self.icon_path = icon_dir / "clock_icon.png"
+        self.icons = IconFactory(icon_dir)
+        self.tray_state = "idle"
+        self.tray_state_changed.connect(self.apply_tray_state)
         
-        # アイコンが存在しない場合は作成
-        if not self.icon_path.exists():
-            create_clock_icon(self.icon_path)
+        # 打刻処理中のアニメーション（コマは描画済みのものを順に表示するだけで、処理中以外はタイマーを止める）
+        self.busy_frames = self.icons.frames("busy")
+        self.frame_index = 0
+        self.animation_timer = QTimer(self)
+        self.animation_timer.setInterval(ANIMATION_INTERVAL)
+        self.animation_timer.timeout.connect(self.advance_animation)
+        
+        # 打刻は1件ずつ実行する（処理中のクリックで二重に打刻しないように）
+        self.punch_lock = threading.Lock()
+        self.punch_finished.connect(self.on_punch_finished)
+    
+    def set_tray_state(self, state):
+        """トレイアイコンの状態を変更（どのスレッドからでも呼び出せる）"""
+        self.tray_state_changed.emit(state)
+    
+    @Slot(str)
+    def apply_tray_state(self, state):
+        """トレイアイコンを状態のアイコンに切り替える"""
+        self.tray_state = state
+        self.tray_icon.setIcon(self.icons.icon(state))
+        self.tray_icon.setToolTip(f"Web打刻ツール - {self.icons.label(state)}")
+        if state == "busy" and self.busy_frames:
+            if not self.animation_timer.isActive():
+                self.frame_index = 0
+                self.animation_timer.start()
+        else:
+            self.animation_timer.stop()
+    
+    @Slot()
+    def advance_animation(self):
+        """打刻処理中のアニメーションを次のコマに進める"""
+        self.frame_index = (self.frame_index + 1) % len(self.busy_frames)
+        self.tray_icon.setIcon(self.busy_frames[self.frame_index])
+    
+    def begin_punch(self):
+        """打刻を始められるか（処理中の打刻があれば通知してFalseを返す）"""
+        if self.punch_lock.acquire(blocking=False):
+            return True
+        self.show_notification("打刻処理中です", "前の打刻が終わるまでお待ちください")
+        return False
+    
+    def run_punch(self, kind):
+        """打刻を別スレッドで実行（処理中もアイコンのアニメーションや操作が止まらないように）"""
+        if not self.begin_punch():
+            return False
+        phase = PUNCH_JOBS[kind][0]
+        account = self.get_account()
+        self.set_tray_state("busy")
+        
+        def run():
+            success = False
+            try:
+                with punch_phase(new_punch_id(), phase, account) as state:
+                    success = bool(getattr(self.web_dakoku, phase)())
+                    if not success:
+                        state["result"] = "failure"
+            except Exception as e:
+                logging.error(f"打刻中にエラーが発生しました: {e}")
+            finally:
+                self.punch_lock.release()
+                self.punch_finished.emit(kind, success)
+        
+        threading.Thread(target=run, daemon=True).start()
+        return True
+    
+    @Slot(str, bool)
+    def on_punch_finished(self, kind, success):
+        """打刻の結果を反映（GUIスレッドで実行される）"""
+        _, done_state, done_message, error_message = PUNCH_JOBS[kind]
+        if success:
+            if done_state == "clocked_in":
+                self.today_clock_in = True
+            else:
+                self.today_clock_out = True
+            self.set_tray_state(done_state)
+            self.show_notification(*done_message)
+        else:
+            self.set_tray_state("error")
+            self.show_notification(*error_message)
     
     def setup_tray_icon(self):
         """システムトレイアイコンの設定"""
         # アイコンの作成
         self.tray_icon = QSystemTrayIcon(self)
-        self.tray_icon.setIcon(QIcon(str(self.icon_path)))
-        self.tray_icon.setToolTip("Web打刻ツール")
+        self.tray_icon.setIcon(self.icons.icon(self.tray_state))
+        self.tray_icon.setToolTip(f"Web打刻ツール - {self.icons.label(self.tray_state)}")
         
         # メニューの作成
         tray_menu = QMenu()
@@ -142,8 +269,8 @@ class DakokuApp(QApplication):
             self.manual_clock_out()
     
     def check_dakoku(self):
-        """打刻状態のチェック"""
-        now = datetime.datetime.now()
+        """打刻状態のチェック（今有効な打刻ルールを実行する）"""
+        now = datetime.now()
         
         # 設定が完了しているか確認
         if not self.config_manager.is_configured():
@@ -151,54 +278,172 @@ class DakokuApp(QApplication):
             self.show_settings()
             return
         
-        # 日付が変わっていたら状態をリセット
-        if self.last_check_date is not None and self.last_check_date.date() != now.date():
-            self.today_clock_in = False
-            self.today_clock_out = False
-        
+        since = self.last_check_date
         self.last_check_date = now
+        self.calendar.refresh()
+        
+        # 開始時刻に実行できなかったルール（スリープ中など）は、ルールごとの設定に従って扱う
+        # （打刻が必要だったかは日付が変わる前の状態で判断する）
+        confirm = []
+        if since is not None:
+            missed = self.punch_rules.missed_events(since, now - timedelta(seconds=MISSED_GRACE),
+                                                    self.calendar.is_off_day)
+            for event_at, rule in missed:
+                if self.handle_missed_rule(rule, event_at, now):
+                    confirm.append((event_at, rule))
         
-        # 出勤打刻のチェック（12時前かつ未打刻の場合）
-        if not self.today_clock_in and now.hour < 12:
-            self.show_clock_in_dialog()
-        
-        # 退勤打刻のチェック（出勤済みかつ未退勤の場合）
-        if self.today_clock_in and not self.today_clock_out and now.hour >= 17:
+        # 日付が変わっていたら状態をリセット
+        if since is not None and since.date() != now.date():
+            self.reset_day(now)
+        self.schedule_next_rule(now)
+        
+        # 休日（週末・祝日・休暇）に始まったルールと、実行しないことにしたルールは実行しない
+        due = [rule for rule in self.punch_rules.due(now)
+               if not self.calendar.is_off_day(occurrence_date(rule, now))
+               and (rule["name"], occurrence_date(rule, now)) not in self.skipped_rules]
+        
+        # 15分ごとのチェックは有効なルールがあるときだけ動かす（それ以外は次のルールの開始で起こされる）
+        if not due:
+            self.check_timer.stop()
+        elif not self.check_timer.isActive():
+            self.check_timer.start()
+        
+        # 同じ打刻・方法のルールが重なっていても1回だけ実行する
+        handled = set()
+        for rule in due:
+            key = (rule["action"], rule["mode"])
+            if key in handled or not self.needs_punch(rule["action"]):
+                continue
+            handled.add(key)
+            self.apply_punch_rule(rule, now)
+        
+        for event_at, rule in confirm:
+            self.confirm_missed_punch(rule, event_at)
+    
+    def handle_missed_rule(self, rule, event_at, now):
+        """開始時刻に実行できなかったルールの扱いを決める（実行前に確認する場合はTrue）"""
+        occurrence = occurrence_date(rule, event_at)
+        key = (rule["name"], occurrence)
+        active = rule in self.punch_rules.due(now) and occurrence_date(rule, now) == occurrence
+        logging.warning(f"{rule['name']}（{event_at:%Y-%m-%d %H:%M:%S}）を開始時刻に実行できませんでした"
+                        f"（{'実行中の時間帯' if active else '時間帯は終了'}、扱い: {rule['missed']}）")
+        if not active:
+            # 時間帯が過ぎた自動打刻は実行せず、行われなかったことだけを知らせる
+            if rule["mode"] == "auto" and rule["missed"] != "skip" and self.needs_punch(rule["action"]):
+                self.show_notification("実行されなかった自動打刻",
+                                       f"{event_at:%m/%d %H:%M}の{rule['name']}はスリープ中などのため行われませんでした")
+            return False
+        if rule["missed"] == "skip":
+            self.skipped_rules.add(key)
+        elif rule["missed"] == "prompt" and rule["mode"] == "auto":
+            # 自動では打刻せず、確認してから打刻する
+            self.fired_rules.add(key)
+            return self.needs_punch(rule["action"])
+        return False
+    
+    def confirm_missed_punch(self, rule, event_at):
+        """実行できなかった自動打刻を、確認してから行う"""
+        label = "出勤打刻" if rule["action"] == "clock_in" else "退勤打刻"
+        if not self.needs_punch(rule["action"]):
+            return
+        if self.confirm_punch(f"{label}確認", f"{event_at:%H:%M}の{rule['name']}はスリープ中などのため行われませんでした。"
+                                            f"今{label}を行いますか？"):
+            self.run_punch(rule["action"])
+    
+    def reset_day(self, now):
+        """日付が変わったときの状態のリセット"""
+        self.today_clock_in = False
+        self.today_clock_out = False
+        # 前日より前に始まったルールの記録は不要
+        yesterday = now.date() - timedelta(days=1)
+        self.fired_rules = {key for key in self.fired_rules if key[1] >= yesterday}
+        self.skipped_rules = {key for key in self.skipped_rules if key[1] >= yesterday}
+        self.set_tray_state("idle")
+    
+    def needs_punch(self, action):
+        """その打刻がまだ必要か（出勤は未出勤のとき、退勤は出勤済みかつ未退勤のとき）"""
+        if action == "clock_in":
+            return not self.today_clock_in
+        return self.today_clock_in and not self.today_clock_out
+    
+    def apply_punch_rule(self, rule, now):
+        """打刻ルールの実行（確認ダイアログ・通知・自動打刻）"""
+        action, mode = rule["action"], rule["mode"]
+        if mode == "auto":
+            # 自動打刻はルールの区間ごとに1回だけ（失敗しても繰り返さない）
+            key = (rule["name"], occurrence_date(rule, now))
+            if key not in self.fired_rules and self.run_punch(f"auto_{action}"):
+                self.fired_rules.add(key)
+        elif mode == "prompt":
+            if action == "clock_in":
+                self.show_clock_in_dialog()
+            else:
+                self.show_clock_out_dialog()
+        elif action == "clock_in":
+            self.show_notification("出勤打刻", "タスクトレイメニューから出勤打刻ができます")
+        else:
             self.show_notification("退勤打刻", "タスクトレイアイコンをクリックして退勤打刻ができます")
     
-    def check_date_change(self):
-        """日付変更のチェック"""
-        now = datetime.datetime.now()
+    def setup_clock_watch(self):
+        """スリープからの復帰・時刻の変更の検出"""
+        self.clock_watch = ClockWatch()
+        self.resume_listener = install_resume_listener(self, self.on_resume)
+        self.clock_check_timer = None
+        if self.resume_listener is not None:
+            # 通知で作り直すため、定期的に起きる必要はない（休日は1回も起きない）。
+            # Linuxでスリープを伴わない時刻の変更は、次にスケジュールで起きたときに反映される
+            return
         
-        # 日付が変わっていたら状態をリセット
-        if self.last_check_date is not None and self.last_check_date.date() != now.date():
-            self.today_clock_in = False
-            self.today_clock_out = False
-            self.last_check_date = now
-    
-    def setup_auto_clock_out(self):
-        """自動退勤処理のスケジュール設定"""
-        def run_schedule():
-            while True:
-                schedule.run_pending()
-                time.sleep(60)
-        
-        # 毎日22時に自動退勤
-        schedule.every().day.at("22:00").do(self.auto_clock_out)
-        
-        # スケジューラを別スレッドで実行
-        scheduler_thread = threading.Thread(target=run_schedule, daemon=True)
-        scheduler_thread.start()
-    
-    def auto_clock_out(self):
-        """自動退勤処理"""
-        if self.today_clock_in and not self.today_clock_out:
-            success = self.web_dakoku.clock_out()
-            if success:
-                self.today_clock_out = True
-                self.show_notification("自動退勤打刻", "退勤打刻が完了しました")
-            else:
-                self.show_notification("自動退勤打刻エラー", "退勤打刻に失敗しました")
+        # OSの通知を受け取れない環境（macOSなど）だけ、時計のずれを定期的に確認する（確認は時計を読むだけ）
+        logging.info("スリープからの復帰の通知を受け取れないため、時計のずれを定期的に確認します")
+        self.clock_check_timer = QTimer(self)
+        self.clock_check_timer.timeout.connect(self.check_clock)
+        self.clock_check_timer.start(CLOCK_CHECK_INTERVAL)
+    
+    def on_resume(self):
+        """スリープからの復帰・時刻の変更の通知"""
+        logging.info("スリープからの復帰または時刻の変更を検出しました")
+        self.clock_watch.mark()
+        QTimer.singleShot(RESUME_DELAY, self.check_dakoku)
+    
+    def check_clock(self):
+        """時計のずれを確認し、ずれていればすぐにスケジュールを作り直す"""
+        info = self.clock_watch.check(self.clock_check_timer.interval() / 1000)
+        if info:
+            logging.warning(describe_clock_change(info))
+            self.check_dakoku()
+    
+    def setup_punch_rules(self):
+        """打刻ルールの設定"""
+        self.fired_rules = set()
+        self.skipped_rules = set()
+        self.rule_timer = QTimer(self)
+        self.rule_timer.setSingleShot(True)
+        self.rule_timer.timeout.connect(self.check_dakoku)
+        self.load_punch_rules()
+    
+    def load_punch_rules(self):
+        """設定から打刻ルールの索引と休日カレンダーを作成"""
+        try:
+            config = self.config_manager.load_config()
+        except Exception as e:
+            logging.error(f"設定の読み込み中にエラーが発生しました: {e}")
+            config = {}
+        # 自動打刻はPC・ユーザーごとに決まった時間だけずらす（多くのPCが同時に打刻しないように）
+        seed = self.config_manager.get_installation_id(config)
+        self.punch_rules = RuleIndex(rules_from_config(config, seed))
+        self.calendar = calendar_from_config(config)
+    
+    def schedule_next_rule(self, now):
+        """次に打刻ルールが始まる時刻（休日を除く）か日付が変わる時刻の早い方にチェックするようタイマーを設定"""
+        midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        next_at, rule = self.punch_rules.next_event(now, self.calendar.is_off_day)
+        if next_at is None or next_at > midnight:
+            next_at, name = midnight, "日付の変更"
+        else:
+            name = rule["name"]
+        self.rule_timer.start(min(MAX_RULE_WAIT, max(1000, int((next_at - now).total_seconds() * 1000))))
+        logging.debug(f"次のチェック: {name}（{next_at:%Y-%m-%d %H:%M:%S}）")
     
     def manual_clock_in(self):
         """手動出勤打刻"""
@@ -206,12 +451,7 @@ class DakokuApp(QApplication):
             self.show_notification("既に出勤打刻済みです", "本日は既に出勤打刻が完了しています")
             return
         
-        success = self.web_dakoku.clock_in()
-        if success:
-            self.today_clock_in = True
-            self.show_notification("出勤打刻完了", "出勤打刻が完了しました")
-        else:
-            self.show_notification("出勤打刻エラー", "出勤打刻に失敗しました")
+        self.run_punch("clock_in")
     
     def manual_clock_out(self):
         """手動退勤打刻"""
@@ -223,27 +463,34 @@ class DakokuApp(QApplication):
             self.show_notification("既に退勤打刻済みです", "本日は既に退勤打刻が完了しています")
             return
         
-        success = self.web_dakoku.clock_out()
-        if success:
-            self.today_clock_out = True
-            self.show_notification("退勤打刻完了", "退勤打刻が完了しました")
-        else:
-            self.show_notification("退勤打刻エラー", "退勤打刻に失敗しました")
+        self.run_punch("clock_out")
     
     def show_clock_in_dialog(self):
         """出勤打刻確認ダイアログの表示"""
+        if self.confirm_punch("出勤打刻確認", "出勤打刻を行いますか？"):
+            self.manual_clock_in()
+    
+    def show_clock_out_dialog(self):
+        """退勤打刻確認ダイアログの表示"""
+        if self.confirm_punch("退勤打刻確認", "退勤打刻を行いますか？"):
+            self.manual_clock_out()
+    
+    def confirm_punch(self, title, text):
+        """打刻確認ダイアログを表示し、「はい」が選ばれたかを返す"""
         dialog = QMessageBox()
-        dialog.setWindowTitle("出勤打刻確認")
-        dialog.setText("出勤打刻を行いますか？")
+        dialog.setWindowTitle(title)
+        dialog.setText(text)
         dialog.setStandardButtons(QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
         dialog.setDefaultButton(QMessageBox.StandardButton.Yes)
         
         # ダイアログを最前面に表示
         dialog.setWindowFlags(dialog.windowFlags() | Qt.WindowType.WindowStaysOnTopHint)
         
-        result = dialog.exec()
-        if result == QMessageBox.StandardButton.Yes:
-            self.manual_clock_in()
+        return dialog.exec() == QMessageBox.StandardButton.Yes
+    
+    def get_account(self):
+        """構造化ログに記録するアカウント（ユーザーID）を取得"""
+        return self.config_manager.load_config().get("user_id", "")
     
     def show_notification(self, title, message):
         """通知の表示"""
@@ -251,8 +498,12 @@ class DakokuApp(QApplication):
     
     def show_settings(self):
         """設定画面の表示"""
-        settings_dialog = SettingsDialog(self.config_manager, self.web_dakoku)
+        settings_dialog = SettingsDialog(self.config_manager, self.web_dakoku, self.artifact_store)
         settings_dialog.exec()
+        
+        # 変更された打刻ルール・自動退勤時刻・休日カレンダーを反映
+        self.load_punch_rules()
+        self.schedule_next_rule(datetime.now())
     
     def quit(self):
         """アプリケーションの終了"""
@@ -266,75 +517,73 @@ class DakokuApp(QApplication):
         
         result = dialog.exec()
         if result == QMessageBox.StandardButton.Yes:
+            # 保存待ちの証跡とキューに残っているログを書き出してから終了
+            self.artifact_store.flush(timeout=5)
+            shutdown_logging()
             super().quit()
 
-    def check_auto_end(self):
-        """自動退勤のチェック"""
-        try:
-            # 設定を読み込む
-            config = self.config_manager.load_config()
-            advanced = config.get("advanced", {})
-            auto_end = advanced.get("auto_end", {})
-            
-            # 自動退勤が有効かチェック
-            if not auto_end.get("enabled", False):
-                return
-                
-            # 現在時刻の取得
-            now = datetime.now()
-            current_time = now.time()
-            
-            # 設定された退勤時刻の取得
-            auto_end_time_str = auto_end.get("time", "18:00")
-            hours, minutes = map(int, auto_end_time_str.split(":"))
-            auto_end_time = dt_time(hours, minutes)
-            
-            # 現在時刻が設定時刻を過ぎているかチェック
-            if current_time >= auto_end_time:
-                # 既に退勤済みかチェック（実装が必要）
-                # ここでは簡易的に実装
-                self.end_work(auto=True)
-        except Exception as e:
-            logging.error(f"自動退勤チェック中にエラーが発生しました: {e}")
-            
     def start_work(self):
         """出勤処理"""
         self.status_label.setText("ステータス: 出勤処理中...")
         
         # 別スレッドで実行
         def run_start():
+            self.set_tray_state("busy")
+            punch_id = new_punch_id()
+            account = self.get_account()
             try:
                 # WebDriverのセットアップ
-                driver = self.web_dakoku._setup_driver()
+                with punch_phase(punch_id, "driver_setup", account) as state:
+                    driver = self.web_dakoku._setup_driver()
+                    if not driver:
+                        state["result"] = "failure"
                 if not driver:
+                    self.set_tray_state("error")
                     self.status_label.setText("ステータス: WebDriverの初期化に失敗しました")
                     QMessageBox.warning(self, "エラー", "WebDriverの初期化に失敗しました")
                     return
                     
                 # ログイン
-                if not self.web_dakoku._login(driver):
+                with punch_phase(punch_id, "login", account) as state:
+                    logged_in = self.web_dakoku._login(driver)
+                    if not logged_in:
+                        state["result"] = "failure"
+                        state["artifact"] = self.artifact_store.capture(driver, "login")
+                if not logged_in:
+                    self.set_tray_state("error")
                     self.status_label.setText("ステータス: ログインに失敗しました")
                     QMessageBox.warning(self, "エラー", "ログインに失敗しました")
                     driver.quit()
                     return
                     
                 # 出勤打刻
-                success = self.web_dakoku.clock_in(driver)
+                with punch_phase(punch_id, "clock_in", account) as state:
+                    success = self.web_dakoku.clock_in(driver)
+                    if not success:
+                        state["result"] = "failure"
+                        state["artifact"] = self.artifact_store.capture(driver, "clock_in")
                 
                 # 結果の表示
                 if success:
+                    self.set_tray_state("clocked_in")
                     self.status_label.setText("ステータス: 出勤打刻完了")
                     QMessageBox.information(self, "成功", "出勤打刻が完了しました")
                 else:
+                    self.set_tray_state("error")
                     self.status_label.setText("ステータス: 出勤打刻に失敗しました")
                     QMessageBox.warning(self, "エラー", "出勤打刻に失敗しました")
                     
                 # WebDriverの終了
                 driver.quit()
             except Exception as e:
+                self.set_tray_state("error")
                 self.status_label.setText(f"ステータス: エラー - {str(e)}")
                 QMessageBox.warning(self, "エラー", f"出勤処理中にエラーが発生しました: {str(e)}")
-                
+            finally:
+                self.punch_lock.release()
+        
+        if not self.begin_punch():
+            return
         threading.Thread(target=run_start).start()
         
     def end_work(self, auto=False):
@@ -346,17 +595,30 @@ class DakokuApp(QApplication):
             
         # 別スレッドで実行
         def run_end():
+            self.set_tray_state("busy")
+            punch_id = new_punch_id()
+            account = self.get_account()
             try:
                 # WebDriverのセットアップ
-                driver = self.web_dakoku._setup_driver()
+                with punch_phase(punch_id, "driver_setup", account) as state:
+                    driver = self.web_dakoku._setup_driver()
+                    if not driver:
+                        state["result"] = "failure"
                 if not driver:
+                    self.set_tray_state("error")
                     self.status_label.setText("ステータス: WebDriverの初期化に失敗しました")
                     if not auto:
                         QMessageBox.warning(self, "エラー", "WebDriverの初期化に失敗しました")
                     return
                     
                 # ログイン
-                if not self.web_dakoku._login(driver):
+                with punch_phase(punch_id, "login", account) as state:
+                    logged_in = self.web_dakoku._login(driver)
+                    if not logged_in:
+                        state["result"] = "failure"
+                        state["artifact"] = self.artifact_store.capture(driver, "login")
+                if not logged_in:
+                    self.set_tray_state("error")
                     self.status_label.setText("ステータス: ログインに失敗しました")
                     if not auto:
                         QMessageBox.warning(self, "エラー", "ログインに失敗しました")
@@ -364,21 +626,26 @@ class DakokuApp(QApplication):
                     return
                     
                 # 退勤打刻
-                success = self.web_dakoku.clock_out(driver)
+                with punch_phase(punch_id, "clock_out", account) as state:
+                    success = self.web_dakoku.clock_out(driver)
+                    if not success:
+                        state["result"] = "failure"
+                        state["artifact"] = self.artifact_store.capture(driver, "clock_out")
                 
                 # 結果の表示
+                self.set_tray_state("clocked_out" if success else "error")
                 if success:
                     if auto:
                         self.status_label.setText("ステータス: 自動退勤打刻完了")
                         # 自動退勤の場合は通知のみ
-                        self.tray_icon.showMessage("Web打刻ツール", "自動退勤打刻が完了しました", QIcon("icon.png"), 5000)
+                        self.tray_icon.showMessage("Web打刻ツール", "自動退勤打刻が完了しました", self.icons.icon("clocked_out"), 5000)
                     else:
                         self.status_label.setText("ステータス: 退勤打刻完了")
                         QMessageBox.information(self, "成功", "退勤打刻が完了しました")
                 else:
                     if auto:
                         self.status_label.setText("ステータス: 自動退勤打刻に失敗しました")
-                        self.tray_icon.showMessage("Web打刻ツール", "自動退勤打刻に失敗しました", QIcon("icon.png"), 5000)
+                        self.tray_icon.showMessage("Web打刻ツール", "自動退勤打刻に失敗しました", self.icons.icon("error"), 5000)
                     else:
                         self.status_label.setText("ステータス: 退勤打刻に失敗しました")
                         QMessageBox.warning(self, "エラー", "退勤打刻に失敗しました")
@@ -387,22 +654,28 @@ class DakokuApp(QApplication):
                 driver.quit()
             except Exception as e:
                 error_msg = f"退勤処理中にエラーが発生しました: {str(e)}"
+                self.set_tray_state("error")
                 self.status_label.setText(f"ステータス: エラー - {str(e)}")
                 if auto:
-                    self.tray_icon.showMessage("Web打刻ツール", error_msg, QIcon("icon.png"), 5000)
+                    self.tray_icon.showMessage("Web打刻ツール", error_msg, self.icons.icon("error"), 5000)
                 else:
                     QMessageBox.warning(self, "エラー", error_msg)
-                
+            finally:
+                self.punch_lock.release()
+        
+        if not self.begin_punch():
+            return
         threading.Thread(target=run_end).start()
 
 
 class SettingsDialog(QDialog):
     """設定ダイアログ"""
     
-    def __init__(self, config_manager, web_dakoku=None):
+    def __init__(self, config_manager, web_dakoku=None, artifact_store=None):
         super().__init__()
         self.config_manager = config_manager
         self.web_dakoku = web_dakoku
+        self.artifact_store = artifact_store
         
         self.setWindowTitle("Web打刻ツール設定")
         self.setMinimumWidth(500)
@@ -656,8 +929,8 @@ class SettingsDialog(QDialog):
             if value:
                 selectors[key] = value
                 
-        # 詳細設定の取得
-        advanced = {}
+        # 詳細設定の取得（画面にない設定（打刻ルール・休日カレンダーなど）はそのまま残す）
+        advanced = dict(self.config_manager.load_config().get("advanced", {}))
         
         # 自動退勤設定
         auto_end = {
@@ -752,6 +1025,7 @@ class SettingsDialog(QDialog):
                     # WebDriverのセットアップ
                     driver = self.web_dakoku._setup_driver()
                     if not driver:
+                        flush_logging()
                         # ログからエラーメッセージを取得
                         try:
                             with open('web_dakoku.log', 'r', encoding='utf-8') as f:
@@ -773,6 +1047,11 @@ class SettingsDialog(QDialog):
                     
                     # ログイン処理
                     success = self.web_dakoku._login(driver)
+                    artifact = None
+                    if not success and self.artifact_store:
+                        artifact = self.artifact_store.capture(driver, "test_connection")
+                        logging.warning(f"テスト接続の失敗時の証跡: {artifact}", extra={"artifact": artifact})
+                    flush_logging()
                     if success:
                         QMessageBox.information(self, "テスト接続成功", "Web打刻システムへの接続に成功しました")
                     else:
@@ -792,6 +1071,10 @@ class SettingsDialog(QDialog):
                         error_message += "1. URLが正しいか確認してください\n"
                         error_message += "2. ユーザーIDとパスワードが正しいか確認してください\n"
                         error_message += "3. 各セレクタ設定が実際のWeb要素IDと一致しているか確認してください"
+                        
+                        # 証跡の保存先を案内
+                        if artifact:
+                            error_message += f"\n\n【証跡】\nスクリーンショット・ページHTML・コンソールログ:\n{artifact}"
                 except Exception as e:
                     error_message = f"テスト接続中に予期せぬエラーが発生しました: {e}"
                 finally:
@@ -874,11 +1157,6 @@ class MainWindow(QMainWindow):
         # Web打刻ハンドラの初期化
         self.web_dakoku = WebDakoku(self.config_manager)
         
-        # 自動退勤タイマー
-        self.auto_end_timer = QTimer(self)
-        self.auto_end_timer.timeout.connect(self.check_auto_end)
-        self.auto_end_timer.start(60000)  # 1分ごとにチェック
-        
         # UIのセットアップ
         self.setup_ui()
         
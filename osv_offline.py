@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+オフライン脆弱性チェック
+OSV形式のアドバイザリ（zipまたはJSONのディレクトリ）を1件ずつ読み込んで
+PyPIのパッケージ名で引ける索引ファイルを作成し、メモリマップで参照します。
+インターネットに接続できない環境でも脆弱性をチェックできます。
+
+索引ファイルの形式:
+    マジック(8) | メタ情報の長さ(4) | メタ情報(JSON) | 件数(4) |
+    (名前のハッシュ(8), オフセット(4), 長さ(4)) × 件数（ハッシュ順） |
+    パッケージごとのアドバイザリ(JSON)
+"""
+
+import os
+import sys
+import json
+import mmap
+import struct
+import hashlib
+import logging
+import zipfile
+import argparse
+from pathlib import Path
+
+from packaging.utils import canonicalize_name
+from packaging.version import Version, InvalidVersion
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"OSVIDX1\0"
+ENTRY = struct.Struct("<QII")
+COUNT = struct.Struct("<I")
+
+# 索引に残す説明文の最大長
+SUMMARY_LIMIT = 300
+
+
+def _name_hash(name):
+    """正規化したパッケージ名の64ビットハッシュ"""
+    return int.from_bytes(hashlib.blake2b(name.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def source_fingerprint(source):
+    """アドバイザリの取得元の更新を検出するための値"""
+    path = Path(source)
+    if path.is_dir():
+        latest = 0
+        count = 0
+        for item in path.rglob("*.json"):
+            latest = max(latest, item.stat().st_mtime_ns)
+            count += 1
+        return f"dir:{count}:{latest}"
+    stat = path.stat()
+    return f"file:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def iter_advisories(source):
+    """zipまたはディレクトリからアドバイザリを1件ずつ読み込む"""
+    path = Path(source)
+    if path.is_dir():
+        for item in sorted(path.rglob("*.json")):
+            try:
+                with open(item, "r", encoding="utf-8") as f:
+                    yield json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"アドバイザリの読み込みに失敗しました: {item}: {e}")
+        return
+
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            if not info.filename.endswith(".json"):
+                continue
+            try:
+                with archive.open(info) as f:
+                    yield json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"アドバイザリの読み込みに失敗しました: {info.filename}: {e}")
+
+
+def _compact_advisory(advisory, affected):
+    """索引に保存する項目だけを取り出す"""
+    summary = advisory.get("summary") or advisory.get("details") or "No description available"
+    ranges = [
+        [(key, value) for event in item.get("events", []) for key, value in event.items()]
+        for item in affected.get("ranges", []) if item.get("type") == "ECOSYSTEM"
+    ]
+    return {
+        "id": advisory.get("id", "Unknown"),
+        "aliases": advisory.get("aliases", []),
+        "summary": summary[:SUMMARY_LIMIT],
+        "versions": affected.get("versions", []),
+        "ranges": ranges,
+    }
+
+
+def build_index(source, output):
+    """アドバイザリから索引ファイルを作成"""
+    packages = {}
+    count = 0
+    for advisory in iter_advisories(source):
+        if advisory.get("withdrawn"):
+            continue
+        for affected in advisory.get("affected", []):
+            package = affected.get("package", {})
+            if package.get("ecosystem") != "PyPI" or not package.get("name"):
+                continue
+            name = canonicalize_name(package["name"])
+            packages.setdefault(name, []).append(_compact_advisory(advisory, affected))
+        count += 1
+
+    entries = []
+    blob = bytearray()
+    for name, advisories in packages.items():
+        data = json.dumps({"name": name, "advisories": advisories},
+                          ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        entries.append((_name_hash(name), len(blob), len(data)))
+        blob += data
+    entries.sort()
+
+    meta = json.dumps({"source": str(source), "fingerprint": source_fingerprint(source)}).encode("utf-8")
+    header_size = len(MAGIC) + COUNT.size + len(meta) + COUNT.size + ENTRY.size * len(entries)
+
+    temp_path = f"{output}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(COUNT.pack(len(meta)))
+        f.write(meta)
+        f.write(COUNT.pack(len(entries)))
+        for name_hash, offset, length in entries:
+            f.write(ENTRY.pack(name_hash, header_size + offset, length))
+        f.write(blob)
+    os.replace(temp_path, output)
+    logger.info(f"{count}件のアドバイザリから{len(entries)}パッケージ分の索引を作成しました: {output}")
+
+
+def _version_key(value):
+    """OSVのイベントのバージョンを比較用に変換（"0"は最小値）"""
+    return Version("0") if value == "0" else Version(value)
+
+
+def is_affected(record, version):
+    """OSVの定義に従ってバージョンが影響を受けるか判定"""
+    if str(version) in record["versions"]:
+        return True
+
+    for events in record["ranges"]:
+        try:
+            ordered = sorted(((_version_key(value), kind) for kind, value in events if kind != "limit"),
+                             key=lambda event: event[0])
+        except InvalidVersion:
+            continue
+        affected = False
+        for event_version, kind in ordered:
+            if event_version > version:
+                break
+            if kind == "introduced":
+                affected = True
+            elif kind == "fixed":
+                affected = False
+            elif kind == "last_affected":
+                # last_affected はそのバージョン自体を含む
+                affected = event_version == version
+        if affected:
+            return True
+    return False
+
+
+class OsvIndex:
+    """メモリマップした索引ファイル"""
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"索引ファイルの形式が正しくありません: {path}")
+        offset = len(MAGIC)
+        (meta_length,) = COUNT.unpack_from(self._map, offset)
+        offset += COUNT.size
+        self.meta = json.loads(self._map[offset:offset + meta_length])
+        offset += meta_length
+        (self.count,) = COUNT.unpack_from(self._map, offset)
+        self._table = offset + COUNT.size
+
+    def close(self):
+        """索引ファイルを閉じる"""
+        self._map.close()
+        self._file.close()
+
+    def _entry(self, i):
+        return ENTRY.unpack_from(self._map, self._table + i * ENTRY.size)
+
+    def _record(self, name):
+        """正規化したパッケージ名の項目を二分探索で取得（JSONのバイト列と読み込んだ内容）"""
+        target = _name_hash(name)
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._entry(mid)[0] < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        # ハッシュが衝突した場合に備えて同じハッシュの項目を順に確認
+        while lo < self.count:
+            name_hash, offset, length = self._entry(lo)
+            if name_hash != target:
+                break
+            data = self._map[offset:offset + length]
+            record = json.loads(data)
+            if record["name"] == name:
+                return data, record
+            lo += 1
+        return None, None
+
+    def lookup(self, package_name):
+        """パッケージのアドバイザリ一覧を取得"""
+        _, record = self._record(canonicalize_name(package_name))
+        return record["advisories"] if record else []
+
+    def digest(self, package_name):
+        """パッケージのアドバイザリの内容を識別するための値（該当なしは空文字列）"""
+        data, _ = self._record(canonicalize_name(package_name))
+        return hashlib.sha256(data).hexdigest() if data else ""
+
+    def affected(self, package_name, version):
+        """指定したバージョンが該当するアドバイザリの一覧を返す"""
+        advisories = self.lookup(package_name)
+        if not advisories:
+            return []
+        try:
+            installed = Version(version)
+        except InvalidVersion:
+            logger.warning(f"{package_name}のバージョンを解釈できません: {version}")
+            return []
+        return [advisory for advisory in advisories if is_affected(advisory, installed)]
+
+
+def open_index(source, index_path=None):
+    """索引を開く（取得元が更新されていれば作り直す）"""
+    index_path = index_path or f"{Path(source).name}.osvidx"
+    fingerprint = source_fingerprint(source)
+    if os.path.exists(index_path):
+        try:
+            index = OsvIndex(index_path)
+            if index.meta.get("fingerprint") == fingerprint:
+                return index
+            index.close()
+        except (OSError, ValueError) as e:
+            logger.warning(f"索引ファイルを読み込めないため作り直します: {e}")
+    build_index(source, index_path)
+    return OsvIndex(index_path)
+
+
+def main(argv=None):
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description="OSV形式のアドバイザリから索引を作成します")
+    parser.add_argument("source", help="OSVのzipファイルまたはJSONのディレクトリ")
+    parser.add_argument("--output", help="索引ファイルの保存先")
+    parser.add_argument("--query", nargs=2, metavar=("PACKAGE", "VERSION"), help="索引を引いて結果を表示")
+    args = parser.parse_args(argv)
+
+    index = open_index(args.source, args.output)
+    if args.query:
+        for advisory in index.affected(*args.query):
+            print(f"{advisory['id']}: {advisory['summary']}")
+    index.close()
+    return True
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(0 if main() else 1)
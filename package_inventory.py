@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+インストール済みパッケージの一覧
+pipを別プロセスで起動せず、importlib.metadataで同じプロセス内から
+インストール済みのディストリビューションの情報を収集します。
+"""
+
+import sys
+import json
+import hashlib
+import time
+import logging
+from importlib import metadata
+
+from packaging.utils import canonicalize_name
+
+logger = logging.getLogger(__name__)
+
+
+def _direct_url(dist):
+    """direct_url.json（PEP 610）を読み込む"""
+    try:
+        text = dist.read_text("direct_url.json")
+        return json.loads(text) if text else None
+    except (OSError, ValueError):
+        return None
+
+
+def collect_inventory(path=None):
+    """インストール済みパッケージの情報を収集
+
+    戻り値は正規化したパッケージ名をキーとする辞書で、各要素には
+    name, version, requires（Requires-Dist）, extras（Provides-Extra）, location, installer,
+    editable, vcs, url, license, record_hash（RECORDのSHA-256）を含みます。
+    同じ名前のディストリビューションが複数ある場合は、importと同じく
+    sys.path で先に見つかったものを使用します。
+    """
+    inventory = {}
+    for dist in metadata.distributions(path=path if path is not None else sys.path):
+        meta = dist.metadata
+        raw_name = meta["Name"]
+        if not raw_name:
+            continue
+        name = canonicalize_name(raw_name)
+        if name in inventory:
+            continue
+
+        direct_url = _direct_url(dist)
+        installer = dist.read_text("INSTALLER")
+        record = dist.read_text("RECORD")
+        license_text = meta["License-Expression"] or meta["License"] or ""
+        inventory[name] = {
+            "name": name,
+            "display_name": raw_name,
+            "version": meta["Version"] or "",
+            "requires": meta.get_all("Requires-Dist") or [],
+            "extras": [canonicalize_name(extra) for extra in meta.get_all("Provides-Extra") or []],
+            "location": str(dist.locate_file("")),
+            "installer": installer.strip() if installer else "",
+            "editable": bool(direct_url and direct_url.get("dir_info", {}).get("editable")),
+            "vcs": direct_url.get("vcs_info", {}).get("vcs") if direct_url else None,
+            "url": direct_url.get("url") if direct_url else None,
+            # License には全文が書かれていることがあるため1行目だけを使う
+            "license": license_text.strip().splitlines()[0] if license_text.strip() else "",
+            "record_hash": hashlib.sha256(record.encode("utf-8")).hexdigest() if record else None,
+        }
+    return inventory
+
+
+def versions_of(inventory):
+    """{パッケージ名: バージョン} の辞書に変換"""
+    return {name: item["version"] for name, item in inventory.items()}
+
+
+def main():
+    """インベントリをJSONで表示"""
+    start = time.perf_counter()
+    inventory = collect_inventory()
+    elapsed = time.perf_counter() - start
+    print(json.dumps(inventory, ensure_ascii=False, indent=2))
+    print(f"{len(inventory)}個のパッケージを{elapsed * 1000:.1f}ミリ秒で収集しました", file=sys.stderr)
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
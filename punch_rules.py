@@ -0,0 +1,395 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+打刻ルール
+「どの曜日の何時から何時まで、どの打刻を、どのように（確認・通知・自動）行うか」を
+ルールとして宣言し、1週間を秒単位の区間に分けた索引に変換します。
+索引は区間の境目の一覧（昇順）と区間ごとに有効なルールからなり、
+「今有効なルール」と「次にルールが始まる時刻」を二分探索で求めます。
+
+ルールは設定ファイルの advanced.punch_rules で変更できます（省略時は DEFAULT_RULES）:
+
+    {"name": "出勤確認", "action": "clock_in", "mode": "prompt",
+     "days": [0, 1, 2, 3, 4], "start": "07:00", "end": "12:00"}
+
+- action: clock_in（出勤）・clock_out（退勤）
+- mode: prompt（確認ダイアログ）・remind（通知のみ）・auto（自動で打刻）
+- days: 曜日（0=月曜〜6=日曜、省略時は毎日）
+- start・end: 時刻（HH:MM、end は "24:00" まで指定可。end が start 以前なら翌日の end まで）
+- spread: 自動打刻を分散させる幅（分、省略時は advanced.auto_spread_minutes）
+- missed: スリープなどで開始時刻に実行できなかったときの扱い。catch_up（そのまま実行）・
+  skip（その回は実行しない）・prompt（自動打刻の前に確認する）で、省略時は自動打刻が prompt、
+  それ以外が catch_up
+
+多くのPCが同じ時刻に自動打刻すると打刻システムに負荷が集中するため、自動打刻のルールは
+PC・ユーザーごとに決まったずれ（spread の幅の中で、マシンIDとユーザーIDのハッシュから決まる秒数）
+だけ遅らせて開始します。ずれは毎回同じで、PCの台数が多ければ打刻は幅の中に均等に分散します。
+--fleet を指定すると、指定した台数での1秒あたりの打刻数を表示します。
+
+休日（work_calendar.py）に始まるルールは実行しません。
+"""
+
+import sys
+import json
+import hashlib
+import logging
+import argparse
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+from work_calendar import calendar_from_config
+
+logger = logging.getLogger(__name__)
+
+ACTIONS = ("clock_in", "clock_out")
+MODES = ("prompt", "remind", "auto")
+MISSED_POLICIES = ("catch_up", "skip", "prompt")
+ALL_DAYS = (0, 1, 2, 3, 4, 5, 6)
+DAY_MINUTES = 24 * 60
+DAY_SECONDS = DAY_MINUTES * 60
+WEEK_SECONDS = 7 * DAY_SECONDS
+
+DEFAULT_RULES = [
+    {"name": "出勤確認", "action": "clock_in", "mode": "prompt", "start": "00:00", "end": "12:00"},
+    {"name": "退勤リマインダー", "action": "clock_out", "mode": "remind", "start": "17:00", "end": "24:00"},
+    {"name": "自動退勤", "action": "clock_out", "mode": "auto", "start": "22:00", "end": "24:00"},
+]
+
+WEEKDAY_NAMES = "月火水木金土日"
+# 次のイベントを探す範囲（休日が続いてもこれより先は探さない）
+EVENT_HORIZON = timedelta(days=366)
+
+
+def parse_minutes(text):
+    """"HH:MM" を0時からの分に変換（"24:00" は1440）"""
+    try:
+        hours, minutes = map(int, str(text).split(":"))
+    except ValueError:
+        raise ValueError(f"時刻の形式が正しくありません: {text}")
+    if not (0 <= hours <= 24 and 0 <= minutes < 60) or (hours == 24 and minutes):
+        raise ValueError(f"時刻の範囲が正しくありません: {text}")
+    return hours * 60 + minutes
+
+
+def normalize_rule(rule, seed=None, default_spread=0):
+    """ルールを検証し、省略された項目を補ったルールを返す（不正な場合は ValueError）"""
+    action = rule.get("action")
+    mode = rule.get("mode", "prompt")
+    if action not in ACTIONS:
+        raise ValueError(f"action は {', '.join(ACTIONS)} のいずれかです: {action}")
+    if mode not in MODES:
+        raise ValueError(f"mode は {', '.join(MODES)} のいずれかです: {mode}")
+    days = tuple(sorted(set(rule.get("days", ALL_DAYS))))
+    if not days or any(day not in ALL_DAYS for day in days):
+        raise ValueError(f"days は0（月曜）〜6（日曜）で指定してください: {list(days)}")
+    start = parse_minutes(rule.get("start", "00:00"))
+    end = parse_minutes(rule.get("end", "24:00"))
+    if start == DAY_MINUTES:
+        raise ValueError("start に 24:00 は指定できません")
+    spread = float(rule.get("spread", default_spread))
+    if spread < 0:
+        raise ValueError(f"spread は0以上で指定してください: {spread}")
+    missed = rule.get("missed", "prompt" if mode == "auto" else "catch_up")
+    if missed not in MISSED_POLICIES:
+        raise ValueError(f"missed は {', '.join(MISSED_POLICIES)} のいずれかです: {missed}")
+    rule = {
+        "name": rule.get("name") or f"{action}/{mode}",
+        "action": action,
+        "mode": mode,
+        "days": days,
+        "start": start,
+        "end": end,
+        # 自動打刻以外は打刻システムにアクセスしないため分散させない
+        "spread": int(spread * 60) if mode == "auto" else 0,
+        "offset": 0,
+        "missed": missed,
+    }
+    # ずれは区間の長さより短くする（区間の最後の1分は残す）
+    rule["spread"] = max(0, min(rule["spread"], window_seconds(rule) - 60))
+    if rule["spread"] and seed is not None:
+        rule["offset"] = jitter_offset(seed, rule["name"], rule["spread"])
+    return rule
+
+
+def window_seconds(rule):
+    """ルールの区間の長さ（秒）"""
+    minutes = rule["end"] - rule["start"]
+    return (minutes if minutes > 0 else minutes + DAY_MINUTES) * 60
+
+
+def jitter_offset(seed, name, spread):
+    """PC・ユーザー（seed）とルールの名前から決まる、0以上 spread 秒未満のずれ"""
+    digest = hashlib.sha256(f"{seed}\0{name}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % spread
+
+
+def rules_from_config(config, seed=None):
+    """設定から打刻ルールを作成（不正なルールは警告して無視する）
+
+    advanced.auto_end が有効な場合は、その時刻からの自動退勤ルールを加えます。
+    seed（PC・ユーザーに固有の文字列）を指定すると、自動打刻のルールを分散させます。
+    """
+    advanced = config.get("advanced", {})
+    default_spread = advanced.get("auto_spread_minutes", 0)
+    rules = []
+    for rule in advanced.get("punch_rules", DEFAULT_RULES):
+        try:
+            rules.append(normalize_rule(rule, seed, default_spread))
+        except (ValueError, TypeError, AttributeError) as e:
+            logger.warning(f"打刻ルールを無視します（{e}）: {rule}")
+    auto_end = advanced.get("auto_end", {})
+    if auto_end.get("enabled", False):
+        try:
+            rules.append(normalize_rule({"name": "自動退勤（設定）", "action": "clock_out", "mode": "auto",
+                                         "start": auto_end.get("time", "18:00"), "end": "24:00"},
+                                        seed, default_spread))
+        except (ValueError, TypeError) as e:
+            logger.warning(f"自動退勤時刻を無視します（{e}）")
+    return rules
+
+
+def week_second(moment):
+    """週の始め（月曜0時）からの秒"""
+    return moment.weekday() * DAY_SECONDS + moment.hour * 3600 + moment.minute * 60 + moment.second
+
+
+def start_second(rule):
+    """ルールが始まる時刻（0時からの秒、分散のずれを含む）
+
+    日をまたぐルールでは、ずれによって翌日（DAY_SECONDS 以上）になることがあります。
+    """
+    return rule["start"] * 60 + rule["offset"]
+
+
+def week_start(rule, day):
+    """day 曜日に始まる回の開始時刻（週の始めからの秒、日曜の回が月曜にずれた場合は週の始めに戻す）"""
+    return (day * DAY_SECONDS + start_second(rule)) % WEEK_SECONDS
+
+
+def rule_intervals(rule):
+    """ルールが有効な区間 [開始, 終了) の一覧（週の始めからの秒、週をまたぐ区間は分割する）"""
+    intervals = []
+    for day in rule["days"]:
+        # 区間の長さ（開始のずれの分だけ短くなる）
+        length = window_seconds(rule) - rule["offset"]
+        start = week_start(rule, day)
+        end = start + length
+        if end > WEEK_SECONDS:
+            intervals.append((start, WEEK_SECONDS))
+            intervals.append((0, end - WEEK_SECONDS))
+        else:
+            intervals.append((start, end))
+    # 逆向きの区間があると索引が壊れる（ずれが区間の長さ未満になっているかの確認）
+    for start, end in intervals:
+        if not 0 <= start < end <= WEEK_SECONDS:
+            raise ValueError(f"{rule['name']}の区間が正しくありません: {start}〜{end}")
+    return intervals
+
+
+class RuleIndex:
+    """打刻ルールの索引
+
+    1週間を「有効なルールの組み合わせが変わる時刻」で区切り、
+    区間ごとの有効なルールを持っておきます。
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        intervals = [(start, end, rule) for rule in self.rules for start, end in rule_intervals(rule)]
+
+        self.bounds = sorted({0} | {point for start, end, _ in intervals for point in (start, end)} - {WEEK_SECONDS})
+        self.active = [[] for _ in self.bounds]
+        for start, end, rule in intervals:
+            first = bisect_right(self.bounds, start) - 1
+            for segment in range(first, len(self.bounds)):
+                if self.bounds[segment] >= end:
+                    break
+                self.active[segment].append(rule)
+        self.active = [tuple(rules) for rules in self.active]
+
+        # ルールが始まる時刻（次のイベントの検索用）
+        events = sorted((week_start(rule, day), index)
+                        for index, rule in enumerate(self.rules) for day in rule["days"])
+        self.event_seconds = [second for second, _ in events]
+        self.event_rules = [self.rules[index] for _, index in events]
+
+    def due(self, moment):
+        """その時刻に有効なルール"""
+        return self.active[bisect_right(self.bounds, week_second(moment)) - 1]
+
+    def next_event(self, moment, skip_day=None):
+        """その時刻より後で最初にルールが始まる (時刻, ルール)（ルールがなければ (None, None)）
+
+        同じ時刻に複数のルールが始まる場合は、そのうちの1つを返します（すべて必要なら next_events）。
+        """
+        event_at, rules = self.next_events(moment, skip_day)
+        return (event_at, rules[0]) if rules else (None, None)
+
+    def next_events(self, moment, skip_day=None):
+        """その時刻より後で最初にルールが始まる (時刻, [その時刻に始まるルール])（なければ (None, []））
+
+        skip_day を指定した場合、skip_day(日付) がTrueになる日（休日）に始まるルールは飛ばします
+        （日付は occurrence_date の日付で、ずれで翌日になった回も元の日として判断します）。
+        """
+        limit = moment + EVENT_HORIZON
+        while True:
+            event_at, rules = self._events_after(moment)
+            if skip_day is not None:
+                rules = [rule for rule in rules if not skip_day(occurrence_date(rule, event_at))]
+            if rules:
+                return event_at, rules
+            if event_at is None or event_at > limit:
+                return None, []
+            moment = event_at
+
+    def missed_events(self, since, until, skip_day=None):
+        """since より後、until 以前に始まったルールの [(時刻, ルール)]
+
+        同じルールが何回も始まっていた場合（長いスリープなど）は、最後の1回にまとめます。
+        """
+        latest = {}
+        moment = since
+        while moment < until:
+            event_at, rules = self.next_events(moment, skip_day)
+            if not rules or event_at > until:
+                break
+            # 同じ時刻に始まるルールはすべて記録する（1つだけにすると残りの missed の指定が使われない）
+            for rule in rules:
+                latest[rule["name"]] = (event_at, rule)
+            moment = event_at
+        return sorted(latest.values(), key=lambda item: item[0])
+
+    def _events_after(self, moment):
+        """その時刻より後で最初にルールが始まる (時刻, [その時刻に始まるすべてのルール])"""
+        if not self.event_seconds:
+            return None, []
+        second = week_second(moment)
+        position = bisect_right(self.event_seconds, second)
+        if position == len(self.event_seconds):
+            position = 0
+            target = self.event_seconds[0] + WEEK_SECONDS
+        else:
+            target = self.event_seconds[position]
+        last = bisect_right(self.event_seconds, self.event_seconds[position])
+        start = moment.replace(microsecond=0)
+        return start + timedelta(seconds=target - second), self.event_rules[position:last]
+
+
+def occurrence_date(rule, moment):
+    """有効なルールの区間が始まった日付（日をまたぐ区間の翌日分は前日になる）"""
+    seconds = moment.hour * 3600 + moment.minute * 60 + moment.second
+    if seconds < start_second(rule):
+        return (moment - timedelta(days=1)).date()
+    return moment.date()
+
+
+def describe_rule(rule, show_offset=True):
+    days = "毎日" if rule["days"] == ALL_DAYS else "・".join(WEEKDAY_NAMES[day] for day in rule["days"])
+    text = (f"{rule['name']}: {days} {rule['start'] // 60:02d}:{rule['start'] % 60:02d}〜"
+            f"{rule['end'] // 60:02d}:{rule['end'] % 60:02d} {rule['action']}/{rule['mode']}")
+    if rule["spread"]:
+        text += f"（{rule['spread'] // 60}分の幅で分散"
+        if show_offset:
+            text += f"、このPCは +{rule['offset'] // 60}分{rule['offset'] % 60:02d}秒"
+        text += "）"
+    return text
+
+
+def load_curve(fleet, spread, name="自動退勤"):
+    """fleet 台のPCが spread 秒の幅で分散したときの、1秒ごとの打刻数の一覧"""
+    counts = [0] * max(1, spread)
+    for number in range(fleet):
+        counts[jitter_offset(f"pc-{number}", name, spread) if spread else 0] += 1
+    return counts
+
+
+def print_load_curve(fleet, spread, session_seconds, buckets=20):
+    """負荷の見積もり（1秒あたりの打刻数と、同時にログインしているセッション数）を表示"""
+    counts = load_curve(fleet, spread)
+    peak = max(counts)
+    # 同時セッション数: 各打刻が session_seconds 秒かかるとしたときの最大値
+    window = max(1, session_seconds)
+    running = sum(counts[:window])
+    concurrent = running
+    for second in range(window, len(counts)):
+        running += counts[second] - counts[second - window]
+        concurrent = max(concurrent, running)
+
+    print(f"PC {fleet}台・分散の幅 {spread // 60}分{spread % 60:02d}秒:")
+    print(f"  平均 {fleet / len(counts):.2f} 件/秒・最大 {peak} 件/秒")
+    print(f"  同時セッション数（1回の打刻に{session_seconds}秒かかる場合）: 最大 {concurrent}")
+    if len(counts) <= 1:
+        return
+    size = -(-len(counts) // buckets)
+    rates = [sum(counts[index:index + size]) / len(counts[index:index + size])
+             for index in range(0, len(counts), size)]
+    top = max(rates) or 1
+    print("  1秒あたりの打刻数の推移:")
+    for number, rate in enumerate(rates):
+        offset = number * size
+        print(f"  +{offset // 60:3d}分{offset % 60:02d}秒 {rate:7.2f} {'#' * round(40 * rate / top)}")
+
+
+def main(argv=None):
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description="打刻ルールと、今有効なルール・次のイベントを表示します")
+    parser.add_argument("--config", help="ルールを読み込む設定（JSON、advanced.punch_rules を使用）")
+    parser.add_argument("--at", help="この日時で評価する（例: 2024-04-01T08:30）")
+    parser.add_argument("--events", type=int, default=5, help="表示する次のイベントの数")
+    parser.add_argument("--fleet", type=int, help="このPC台数で自動打刻したときの負荷を表示する")
+    parser.add_argument("--spread", type=float,
+                        help="負荷の表示に使う分散の幅（分、省略時は advanced.auto_spread_minutes）")
+    parser.add_argument("--session-seconds", type=int, default=20, help="1回の打刻にかかる秒数（負荷の表示用）")
+    args = parser.parse_args(argv)
+
+    config = {}
+    if args.config:
+        try:
+            with open(args.config, "r", encoding="utf-8") as f:
+                config = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"設定を読み込めませんでした: {e}")
+            return False
+    try:
+        moment = datetime.fromisoformat(args.at) if args.at else datetime.now()
+    except ValueError:
+        logger.error(f"日時の形式が正しくありません: {args.at}")
+        return False
+
+    if args.fleet:
+        spread = args.spread if args.spread is not None else config.get("advanced", {}).get("auto_spread_minutes", 0)
+        print_load_curve(args.fleet, int(spread * 60), args.session_seconds)
+        return True
+
+    # アプリと同じずれを表示するため、アプリと同じ方法でPC・ユーザーのIDを求める
+    seed = None
+    try:
+        from config_manager import ConfigManager
+        seed = ConfigManager(args.config or "config.json").get_installation_id(config)
+    except Exception as e:
+        logger.warning(f"PC・ユーザーのIDを取得できないため、自動打刻のずれは含めずに表示します: {e}")
+
+    index = RuleIndex(rules_from_config(config, seed))
+    calendar = calendar_from_config(config)
+    print("ルール:")
+    for rule in index.rules:
+        print(f"  {describe_rule(rule, seed is not None)}")
+    print(f"\n{moment:%Y-%m-%d %H:%M:%S}（{WEEKDAY_NAMES[moment.weekday()]}）に有効なルール:")
+    due = [rule for rule in index.due(moment) if not calendar.is_off_day(occurrence_date(rule, moment))]
+    for rule in due:
+        print(f"  {rule['name']}")
+    if not due:
+        print("  なし")
+    print("\n次のイベント:")
+    for _ in range(args.events):
+        moment, rule = index.next_event(moment, calendar.is_off_day)
+        if rule is None:
+            print("  なし")
+            break
+        print(f"  {moment:%Y-%m-%d %H:%M:%S}（{WEEKDAY_NAMES[moment.weekday()]}） {rule['name']}")
+    return True
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+インストール済みファイルの改ざんチェック
+各ディストリビューションの RECORD に記録されたハッシュとインストール済みファイルを照合し、
+内容が変わったファイル・削除されたファイル・RECORDにないファイルを報告します。
+
+ハッシュの計算は大きなバッファで読み込みながらスレッドプールで並列に行います
+（hashlibは大きなデータのハッシュ計算中にGILを解放するため、複数のコアを使えます）。
+照合済みのファイルのサイズ・更新日時・inode番号・ctime はキャッシュに保存し、再チェックでは
+変更されたファイルだけを計算し直します（ctime は利用者が設定できないため、更新日時を
+元に戻した書き換えも検出できます）。--no-cache を指定するとすべてのファイルを計算し直します。
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import hashlib
+import logging
+import argparse
+import threading
+from pathlib import Path
+from importlib import metadata
+from concurrent.futures import ThreadPoolExecutor
+
+from packaging.utils import canonicalize_name
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = ".integrity_cache.json"
+REPORT_PATH = "integrity_report.json"
+# ファイルを読み込むバッファのサイズ
+BUFFER_SIZE = 1024 * 1024
+MAX_WORKERS = min(8, (os.cpu_count() or 1) * 2)
+
+# インストール後に作られるため RECORD に記録されないファイル
+IGNORED_DIRECTORIES = {"__pycache__"}
+IGNORED_SUFFIXES = (".pyc", ".pyo")
+
+_buffers = threading.local()
+
+
+def hash_file(path, algorithm):
+    """ファイルのハッシュ（RECORDと同じurlsafe base64、パディングなし）を計算"""
+    buffer = getattr(_buffers, "buffer", None)
+    if buffer is None:
+        buffer = _buffers.buffer = bytearray(BUFFER_SIZE)
+    view = memoryview(buffer)
+    digest = hashlib.new(algorithm)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            size = f.readinto(buffer)
+            if not size:
+                break
+            digest.update(view[:size])
+    return base64.urlsafe_b64encode(digest.digest()).rstrip(b"=").decode("ascii")
+
+
+class HashCache:
+    """照合済みファイルのサイズ・更新日時・inode番号・ctime とハッシュのキャッシュ"""
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self._entries = {}
+        self._lock = threading.Lock()
+        if path:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+
+    @staticmethod
+    def _key(stat, algorithm):
+        # ctime は書き換えると必ず更新され、touch -r などで戻せない
+        return [stat.st_size, stat.st_mtime_ns, stat.st_ino, stat.st_ctime_ns, algorithm]
+
+    def get(self, path, stat, algorithm):
+        """サイズ・更新日時・inode番号・ctime が前回と同じならハッシュを返す"""
+        entry = self._entries.get(path)
+        if entry and entry[:-1] == self._key(stat, algorithm):
+            return entry[-1]
+        return None
+
+    def put(self, path, stat, algorithm, digest):
+        with self._lock:
+            self._entries[path] = self._key(stat, algorithm) + [digest]
+
+    def save(self):
+        """キャッシュを保存"""
+        if not self.path:
+            return
+        temp_path = f"{self.path}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, separators=(",", ":"))
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.warning(f"ハッシュのキャッシュを保存できませんでした: {e}")
+
+
+def collect_records(path=None):
+    """RECORD に記録されたファイルの一覧を取得
+
+    戻り値は (照合するファイルの一覧, RECORDに記録された全ファイルの集合,
+    パッケージのディレクトリの一覧) です。
+    """
+    entries = []
+    recorded = set()
+    directories = set()
+    seen = set()
+    for dist in metadata.distributions(path=path if path is not None else sys.path):
+        raw_name = dist.metadata["Name"]
+        if not raw_name:
+            continue
+        name = canonicalize_name(raw_name)
+        if name in seen:
+            continue
+        seen.add(name)
+
+        files = dist.files
+        if files is None:
+            logger.warning(f"{raw_name}にはRECORDがないため照合できません")
+            continue
+        for file in files:
+            location = os.path.normpath(str(dist.locate_file(file)))
+            recorded.add(location)
+            parts = file.parts
+            # パッケージのディレクトリ（site-packages直下のディレクトリ）
+            if len(parts) > 1 and parts[0] != ".." and not parts[0].endswith((".dist-info", ".egg-info", ".data")):
+                directories.add(os.path.normpath(str(dist.locate_file(parts[0]))))
+            if file.hash is None:
+                # RECORD自身など、ハッシュが記録されていないファイル
+                continue
+            entries.append((name, location, file.hash.mode, file.hash.value, file.size))
+    return entries, recorded, sorted(directories)
+
+
+def find_unexpected_files(recorded, directories):
+    """パッケージのディレクトリにあって、どのRECORDにも記録されていないファイル"""
+    unexpected = []
+    for directory in directories:
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = [d for d in dirs if d not in IGNORED_DIRECTORIES]
+            for filename in files:
+                if filename.endswith(IGNORED_SUFFIXES):
+                    continue
+                path = os.path.join(root, filename)
+                if path not in recorded:
+                    unexpected.append(path)
+    return unexpected
+
+
+def verify_environment(path=None, cache_path=CACHE_PATH, max_workers=MAX_WORKERS):
+    """インストール済みファイルをRECORDと照合"""
+    start = time.perf_counter()
+    entries, recorded, directories = collect_records(path)
+    cache = HashCache(cache_path)
+    counts = {"hashed": 0, "cached": 0}
+    counts_lock = threading.Lock()
+
+    def verify(entry):
+        name, location, algorithm, expected, size = entry
+        try:
+            stat = os.stat(location)
+        except FileNotFoundError:
+            return {"package": name, "path": location, "problem": "missing"}
+        except OSError as e:
+            return {"package": name, "path": location, "problem": "unreadable", "detail": str(e)}
+        if size is not None and stat.st_size != size:
+            return {"package": name, "path": location, "problem": "size_mismatch",
+                    "detail": f"{size} -> {stat.st_size}"}
+
+        digest = cache.get(location, stat, algorithm)
+        if digest is None:
+            try:
+                digest = hash_file(location, algorithm)
+            except (OSError, ValueError) as e:
+                return {"package": name, "path": location, "problem": "unreadable", "detail": str(e)}
+            # 一致したファイルだけをキャッシュし、不一致のファイルは毎回報告する
+            if digest == expected:
+                cache.put(location, stat, algorithm, digest)
+            with counts_lock:
+                counts["hashed"] += 1
+        else:
+            with counts_lock:
+                counts["cached"] += 1
+        if digest != expected:
+            return {"package": name, "path": location, "problem": "hash_mismatch"}
+        return None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        problems = [problem for problem in executor.map(verify, entries) if problem]
+    cache.save()
+
+    unexpected = find_unexpected_files(recorded, directories)
+    result = {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "checked_files": len(entries),
+        "hashed_files": counts["hashed"],
+        "cached_files": counts["cached"],
+        "elapsed": round(time.perf_counter() - start, 3),
+        "problems": problems,
+        "unexpected_files": unexpected,
+    }
+    logger.info(f"{len(entries)}個のファイルを照合しました（計算 {counts['hashed']} / キャッシュ {counts['cached']}、"
+                f"{result['elapsed']}秒）: 問題 {len(problems)}件 / RECORDにないファイル {len(unexpected)}件")
+    return result
+
+
+def save_result(result, filename=REPORT_PATH):
+    """照合結果をJSONファイルとして保存"""
+    try:
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        logger.info(f"改ざんチェックの結果を保存しました: {filename}")
+        return True
+    except Exception as e:
+        logger.error(f"改ざんチェックの結果の保存に失敗しました: {e}")
+        return False
+
+
+def print_result(result):
+    """照合結果を表示"""
+    labels = {
+        "missing": "削除されたファイル",
+        "size_mismatch": "サイズが異なるファイル",
+        "hash_mismatch": "内容が異なるファイル",
+        "unreadable": "読み込めないファイル",
+    }
+    print(f"\nインストール済みファイルの改ざんチェック: {result['checked_files']}個のファイルを照合しました")
+    for problem in result["problems"]:
+        print(f"- {labels[problem['problem']]}: {problem['path']} ({problem['package']})")
+    for path in result["unexpected_files"]:
+        print(f"- RECORDにないファイル: {path}")
+    if not result["problems"] and not result["unexpected_files"]:
+        print("- 問題は見つかりませんでした")
+
+
+def main(argv=None):
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description="インストール済みファイルをRECORDのハッシュと照合します")
+    parser.add_argument("--no-cache", action="store_true", help="キャッシュを使わずにすべてのファイルを計算する")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="並列に計算するスレッド数")
+    parser.add_argument("--output", default=REPORT_PATH, help="結果の保存先")
+    args = parser.parse_args(argv)
+
+    result = verify_environment(cache_path=None if args.no_cache else CACHE_PATH, max_workers=args.workers)
+    save_result(result, args.output)
+    print_result(result)
+    return not result["problems"]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(0 if main() else 1)
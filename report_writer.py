@@ -0,0 +1,411 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+セキュリティレポートの逐次書き込み
+パッケージごとのチェック結果を、得られた順にJSONとHTMLのレポートへ書き出します。
+レポート全体をメモリ上に組み立てないため、パッケージ数が増えてもメモリ使用量は
+ほぼ一定です。
+
+書き込み中は「<ファイル名>.partial」に出力し、1パッケージごとにフラッシュします。
+完了時に本来のファイル名へ置き換えるため、途中で中断した場合も前回のレポートは
+そのまま残り、中断時点までの結果は .partial から読み出せます（read_partial_report）。
+
+JSONの .partial ファイルは次のように1行1要素で書き込みます:
+    1行目: レポートの基本情報（timestamp, python_version, os, scan_state）
+    2行目: 怪しいパッケージの一覧
+    4行目以降: パッケージごとの結果（1行1パッケージ）
+"""
+
+import os
+import json
+import html
+import logging
+
+logger = logging.getLogger(__name__)
+
+HTML_HEAD = """<!DOCTYPE html>
+<html lang="ja">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Web打刻ツール - セキュリティレポート</title>
+__CSS__
+</head>
+<body>
+    <section style="order: 0">
+        <h1>Web打刻ツール - セキュリティレポート</h1>
+        <p>生成日時: {timestamp}</p>
+        <p>Python バージョン: {python_version}</p>
+        <p>OS: {os}</p>
+    </section>
+"""
+
+HTML_STYLE = """    <style>
+        body {
+            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+            line-height: 1.6;
+            color: #333;
+            max-width: 1200px;
+            margin: 0 auto;
+            padding: 20px;
+        }
+        h1, h2, h3 {
+            color: #2c3e50;
+        }
+        .summary {
+            background-color: #f8f9fa;
+            border-radius: 5px;
+            padding: 15px;
+            margin-bottom: 20px;
+        }
+        .warning {
+            background-color: #fff3cd;
+            color: #856404;
+            padding: 10px;
+            border-radius: 5px;
+            margin-bottom: 10px;
+        }
+        .danger {
+            background-color: #f8d7da;
+            color: #721c24;
+            padding: 10px;
+            border-radius: 5px;
+            margin-bottom: 10px;
+        }
+        .info {
+            background-color: #d1ecf1;
+            color: #0c5460;
+            padding: 10px;
+            border-radius: 5px;
+            margin-bottom: 10px;
+        }
+        table {
+            width: 100%;
+            border-collapse: collapse;
+            margin-bottom: 20px;
+        }
+        th, td {
+            padding: 12px 15px;
+            text-align: left;
+            border-bottom: 1px solid #ddd;
+        }
+        th {
+            background-color: #f2f2f2;
+        }
+        tr:hover {
+            background-color: #f5f5f5;
+        }
+        .badge {
+            display: inline-block;
+            padding: 3px 7px;
+            font-size: 12px;
+            font-weight: 700;
+            line-height: 1;
+            text-align: center;
+            white-space: nowrap;
+            vertical-align: baseline;
+            border-radius: 10px;
+            margin-right: 5px;
+        }
+        .badge-warning {
+            background-color: #ffc107;
+            color: #212529;
+        }
+        .badge-danger {
+            background-color: #dc3545;
+            color: white;
+        }
+        .badge-info {
+            background-color: #17a2b8;
+            color: white;
+        }
+        .badge-success {
+            background-color: #28a745;
+            color: white;
+        }
+        /* 本文はflexboxで並べ、後から書き込むサマリーなどをorderで上に表示する */
+        body {
+            display: flex;
+            flex-direction: column;
+        }
+    </style>
+"""
+
+SUSPICIOUS_SECTION = """
+    <section style="order: 2">
+    <h2>怪しいパッケージ</h2>
+    <div class="danger">
+        <p>以下のパッケージは悪意のあるパッケージである可能性があります。慎重に確認してください。</p>
+    </div>
+    <table>
+        <tr>
+            <th>パッケージ名</th>
+            <th>理由</th>
+        </tr>
+{rows}
+    </table>
+    </section>
+"""
+
+PACKAGES_SECTION_START = """
+    <section style="order: 4">
+    <h2>すべてのパッケージ</h2>
+    <table>
+        <tr>
+            <th>パッケージ名</th>
+            <th>バージョン</th>
+            <th>作者</th>
+            <th>最終更新日</th>
+            <th>ステータス</th>
+        </tr>
+"""
+
+PACKAGE_ROW = """        <tr>
+            <td>{name}</td>
+            <td>{version}</td>
+            <td>{author}</td>
+            <td>{last_updated}</td>
+            <td>{badges}</td>
+        </tr>
+"""
+
+SUMMARY_SECTION = """    </table>
+    </section>
+
+    <section class="summary" style="order: 1">
+        <h2>サマリー</h2>
+        <p>合計パッケージ数: {total_packages}</p>
+        <p>怪しいパッケージ: {suspicious_count}</p>
+        <p>脆弱性のあるパッケージ: {vulnerable_count}</p>
+        <p>人気度の低いパッケージ: {low_popularity_count}</p>
+    </section>
+"""
+
+VULNERABLE_SECTION = """
+    <section style="order: 3">
+    <h2>脆弱性のあるパッケージ</h2>
+    <div class="warning">
+        <p>以下のパッケージには既知の脆弱性があります。アップデートを検討してください。</p>
+    </div>
+    <table>
+        <tr>
+            <th>パッケージ名</th>
+            <th>バージョン</th>
+            <th>依存経路</th>
+            <th>脆弱性</th>
+        </tr>
+{rows}
+    </table>
+    </section>
+"""
+
+RECOMMENDATIONS_START = """
+    <section style="order: 5">
+    <h2>推奨事項</h2>
+"""
+
+SUSPICIOUS_ADVICE = """
+    <div class="danger">
+        <h3>怪しいパッケージの対応</h3>
+        <p>怪しいパッケージが検出されました。以下の対応を検討してください：</p>
+        <ul>
+            <li>パッケージの公式サイトやGitHubリポジトリを確認し、正規のパッケージであることを確認する</li>
+            <li>正規のパッケージに置き換える</li>
+            <li>必要ない場合はアンインストールする</li>
+        </ul>
+    </div>
+"""
+
+VULNERABLE_ADVICE = """
+    <div class="warning">
+        <h3>脆弱性のあるパッケージの対応</h3>
+        <p>脆弱性のあるパッケージが検出されました。以下の対応を検討してください：</p>
+        <ul>
+            <li>最新バージョンにアップデートする</li>
+            <li>脆弱性が修正されたバージョンに指定する</li>
+            <li>代替パッケージを使用する</li>
+        </ul>
+    </div>
+"""
+
+LOW_POPULARITY_ADVICE = """
+    <div class="info">
+        <h3>人気度の低いパッケージの対応</h3>
+        <p>人気度の低いパッケージが検出されました。以下の対応を検討してください：</p>
+        <ul>
+            <li>パッケージの信頼性を確認する</li>
+            <li>より人気のある代替パッケージを検討する</li>
+            <li>必要性を再検討する</li>
+        </ul>
+    </div>
+"""
+
+HTML_TAIL = """
+    <div class="info">
+        <h3>一般的な推奨事項</h3>
+        <ul>
+            <li>定期的にパッケージをアップデートする</li>
+            <li>requirements.txtでバージョンを固定する</li>
+            <li>仮想環境を使用して依存関係を分離する</li>
+            <li>信頼できるソースからのみパッケージをインストールする</li>
+        </ul>
+    </div>
+    </section>
+
+    <footer style="order: 6">
+        <p>このレポートは自動生成されたものです。詳細な分析には専門家の判断が必要です。</p>
+    </footer>
+</body>
+</html>
+"""
+
+
+def _escape(value):
+    return html.escape(str(value))
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False)
+
+
+class ReportWriter:
+    """JSONとHTMLのレポートを逐次書き込むクラス"""
+
+    def __init__(self, json_path="security_report.json", html_path="security_report.html"):
+        self.json_path = json_path
+        self.html_path = html_path
+        self._json = None
+        self._html = None
+        self._suspicious = set()
+        self._count = 0
+        # 依存関係グラフから到達できるかを記録したか
+        self._has_reachability = False
+
+    @staticmethod
+    def partial_path(path):
+        """書き込み中のファイル名"""
+        return f"{path}.partial"
+
+    def begin(self, header, suspicious):
+        """基本情報と怪しいパッケージの一覧を書き込む"""
+        self._json = open(self.partial_path(self.json_path), "w", encoding="utf-8")
+        self._html = open(self.partial_path(self.html_path), "w", encoding="utf-8")
+        self._suspicious = {item["name"] for item in suspicious}
+        self._count = 0
+
+        self._json.write(_dumps(header)[:-1] + ",\n")
+        self._json.write(f'"suspicious_packages": {_dumps(suspicious)},\n')
+        self._json.write('"packages": [')
+
+        head = HTML_HEAD.format(**{key: _escape(header.get(key, "")) for key in ("timestamp", "python_version", "os")})
+        self._html.write(head.replace("__CSS__", HTML_STYLE))
+        if suspicious:
+            rows = "".join(
+                f"        <tr>\n            <td>{_escape(item['name'])}</td>\n"
+                f"            <td>{_escape(item['reason'])}</td>\n        </tr>\n"
+                for item in suspicious
+            )
+            self._html.write(SUSPICIOUS_SECTION.format(rows=rows))
+        self._html.write(PACKAGES_SECTION_START)
+        self._flush()
+
+    def add_package(self, info, vulnerabilities):
+        """1パッケージ分の結果を書き込む"""
+        record = dict(info, vulnerabilities=vulnerabilities)
+        self._json.write(("," if self._count else "") + "\n" + _dumps(record))
+        self._count += 1
+        self._has_reachability = self._has_reachability or "reachable" in info
+
+        badges = ""
+        if info.get("is_project_dependency", False):
+            badges += '<span class="badge badge-info">プロジェクト依存</span>'
+        if info.get("low_popularity", False):
+            badges += '<span class="badge badge-warning">低人気度</span>'
+        if vulnerabilities:
+            badges += '<span class="badge badge-danger">脆弱性あり</span>'
+        is_suspicious = info["name"] in self._suspicious
+        if is_suspicious:
+            badges += '<span class="badge badge-danger">怪しい</span>'
+        if not vulnerabilities and not is_suspicious and not info.get("low_popularity", False):
+            badges += '<span class="badge badge-success">問題なし</span>'
+        self._html.write(PACKAGE_ROW.format(
+            name=_escape(info["name"]),
+            version=_escape(info["version"]),
+            author=_escape(info.get("author", "Unknown")),
+            last_updated=_escape(info.get("last_updated", "Unknown")),
+            badges=badges,
+        ))
+        self._flush()
+
+    def finish(self, vulnerable_packages, summary):
+        """サマリーなどを書き込み、完成したレポートで置き換える"""
+        self._json.write("\n],\n")
+        self._json.write(f'"vulnerable_packages": {_dumps(vulnerable_packages)},\n')
+        self._json.write(f'"summary": {_dumps(summary)}\n}}\n')
+
+        self._html.write(SUMMARY_SECTION.format(**summary))
+        if vulnerable_packages:
+            rows = ""
+            for package in vulnerable_packages:
+                vulns = "<br>".join(f"{_escape(v['source'])}: {_escape(v['description'])}"
+                                    for v in package["vulnerabilities"])
+                path = package.get("dependency_path")
+                if path:
+                    route = " &rarr; ".join(_escape(name) for name in path)
+                elif self._has_reachability:
+                    route = "requirements.txt から到達しない"
+                else:
+                    route = "-"
+                rows += (f"        <tr>\n            <td>{_escape(package['name'])}</td>\n"
+                         f"            <td>{_escape(package['version'])}</td>\n"
+                         f"            <td>{route}</td>\n"
+                         f"            <td>{vulns}</td>\n        </tr>\n")
+            self._html.write(VULNERABLE_SECTION.format(rows=rows))
+        self._html.write(RECOMMENDATIONS_START)
+        if self._suspicious:
+            self._html.write(SUSPICIOUS_ADVICE)
+        if vulnerable_packages:
+            self._html.write(VULNERABLE_ADVICE)
+        if summary["low_popularity_count"] > 0:
+            self._html.write(LOW_POPULARITY_ADVICE)
+        self._html.write(HTML_TAIL)
+        self.close()
+
+        os.replace(self.partial_path(self.json_path), self.json_path)
+        logger.info(f"レポートを保存しました: {self.json_path}")
+        os.replace(self.partial_path(self.html_path), self.html_path)
+        logger.info(f"HTMLレポートを保存しました: {self.html_path}")
+
+    def close(self):
+        """ファイルを閉じる（完了前に閉じた場合は .partial のまま残る）"""
+        for f in (self._json, self._html):
+            if f is not None and not f.closed:
+                f.close()
+
+    def _flush(self):
+        self._json.flush()
+        self._html.flush()
+
+
+def read_partial_report(path):
+    """中断した .partial のJSONレポートから、書き込まれた分の結果を読み出す"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            header = json.loads(f.readline().rstrip().rstrip(",") + "}")
+            suspicious = json.loads("{" + f.readline().rstrip().rstrip(",") + "}")
+            f.readline()
+            packages = []
+            for line in f:
+                line = line.strip().rstrip(",")
+                if not line.startswith("{"):
+                    break
+                try:
+                    packages.append(json.loads(line))
+                except ValueError:
+                    # 書き込み途中の行
+                    break
+    except (OSError, ValueError):
+        return None
+    report = dict(header, packages=packages, partial=True)
+    report.update(suspicious)
+    return report
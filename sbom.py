@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+SBOM（ソフトウェア部品表）の出力
+check_dependencies.py が収集したインベントリと脆弱性の情報から、
+CycloneDX 1.5 または SPDX 2.3 のJSONを作成します。
+
+セキュリティレポートと同じく、パッケージの結果が得られるたびに1件ずつ書き込みます。
+依存関係・脆弱性のように文書の後半にまとめて書く必要がある項目は一時ファイルに
+書き溜めてから最後に連結するため、パッケージ数が増えてもメモリ使用量はほぼ一定です。
+"""
+
+import os
+import abc
+import json
+import uuid
+import logging
+import platform
+import tempfile
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("cyclonedx", "spdx")
+DEFAULT_PATHS = {"cyclonedx": "sbom.cdx.json", "spdx": "sbom.spdx.json"}
+TOOL_NAME = "web-dakoku-tool-security-check"
+
+# 脆弱性IDから参照先のURLを作る（IDの形式ごと）
+ADVISORY_URLS = (
+    ("CVE-", "https://nvd.nist.gov/vuln/detail/{id}"),
+    ("GHSA-", "https://github.com/advisories/{id}"),
+    ("PYSEC-", "https://osv.dev/vulnerability/{id}"),
+    ("pyup.io-", "https://data.safetycli.com/v/{number}/eda"),
+)
+
+
+def purl(name, version):
+    """パッケージURL（pkg:pypi/名前@バージョン）"""
+    return f"pkg:pypi/{quote(name)}@{quote(version)}"
+
+
+def advisory_url(vuln_id, source=None):
+    """脆弱性IDの参照先のURL（わからない場合はNone）"""
+    for prefix, template in ADVISORY_URLS:
+        if vuln_id.startswith(prefix):
+            return template.format(id=vuln_id, number=vuln_id[len(prefix):])
+    if source == "OSV":
+        return f"https://osv.dev/vulnerability/{quote(vuln_id)}"
+    return None
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _timestamp():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class SbomWriter(abc.ABC):
+    """SBOMを逐次書き込む基底クラス
+
+    inventory は collect_inventory() の結果、dependencies は {パッケージ名: [依存先]} です。
+    """
+
+    def __init__(self, path, inventory, dependencies=None):
+        self.path = path
+        self.inventory = inventory
+        self.dependencies = dependencies or {}
+        self._file = None
+        self._spool = None
+        self._count = 0
+
+    @classmethod
+    def create(cls, sbom_format, inventory, dependencies=None, path=None):
+        """形式を指定してSBOMの書き込みを準備"""
+        writer_class = {"cyclonedx": CycloneDxWriter, "spdx": SpdxWriter}[sbom_format]
+        return writer_class(path or DEFAULT_PATHS[sbom_format], inventory, dependencies)
+
+    def begin(self):
+        """文書の先頭を書き込む"""
+        self._file = open(f"{self.path}.partial", "w", encoding="utf-8")
+        self._spool = tempfile.TemporaryFile("w+", encoding="utf-8")
+        self._count = 0
+        self._write_header()
+        self._file.flush()
+
+    def add_package(self, info, vulnerabilities):
+        """1パッケージ分の部品を書き込む"""
+        item = self.inventory.get(info["name"], {})
+        self._file.write(("," if self._count else "") + "\n" + _dumps(self._component(info, item, vulnerabilities)))
+        self._count += 1
+        for line in self._trailing_items(info, vulnerabilities):
+            self._spool.write(_dumps(line) + "\n")
+        self._file.flush()
+
+    def finish(self):
+        """書き溜めた項目を連結し、完成したSBOMで置き換える"""
+        self._write_footer()
+        self.close()
+        os.replace(f"{self.path}.partial", self.path)
+        logger.info(f"SBOMを保存しました: {self.path}")
+
+    def close(self):
+        for f in (self._file, self._spool):
+            if f is not None and not f.closed:
+                f.close()
+
+    def _write_items(self, kind):
+        """一時ファイルの中から kind の項目だけをJSON配列の要素として書き込む"""
+        self._spool.seek(0)
+        first = True
+        for line in self._spool:
+            entry = json.loads(line)
+            if entry.pop("kind") != kind:
+                continue
+            self._file.write(("" if first else ",") + "\n" + _dumps(entry))
+            first = False
+
+    @abc.abstractmethod
+    def _write_header(self):
+        """文書の先頭から部品の配列の開始までを書き込む"""
+
+    @abc.abstractmethod
+    def _component(self, info, item, vulnerabilities):
+        """1パッケージ分の部品（辞書）"""
+
+    @abc.abstractmethod
+    def _trailing_items(self, info, vulnerabilities):
+        """文書の後半に書く項目（"kind" を付けた辞書）を順に返す"""
+
+    @abc.abstractmethod
+    def _write_footer(self):
+        """部品の配列を閉じ、書き溜めた項目と文書の末尾を書き込む"""
+
+
+class CycloneDxWriter(SbomWriter):
+    """CycloneDX 1.5（JSON）"""
+
+    def _write_header(self):
+        header = {
+            "bomFormat": "CycloneDX",
+            "specVersion": "1.5",
+            "serialNumber": f"urn:uuid:{uuid.uuid4()}",
+            "version": 1,
+            "metadata": {
+                "timestamp": _timestamp(),
+                "tools": {"components": [{"type": "application", "name": TOOL_NAME}]},
+                "component": {"type": "application", "name": platform.node() or "workstation",
+                              "bom-ref": "workstation",
+                              "properties": [{"name": "python_version", "value": platform.python_version()},
+                                             {"name": "os", "value": platform.platform()}]},
+            },
+        }
+        self._file.write(_dumps(header)[:-1] + ',\n"components": [')
+
+    def _component(self, info, item, vulnerabilities):
+        name = item.get("display_name", info["name"])
+        component = {
+            "type": "library",
+            "bom-ref": purl(info["name"], info["version"]),
+            "name": name,
+            "version": info["version"],
+            "purl": purl(info["name"], info["version"]),
+        }
+        if item.get("license"):
+            component["licenses"] = [{"license": {"name": item["license"]}}]
+        if info.get("author") not in (None, "", "Unknown"):
+            component["author"] = info["author"]
+        references = []
+        if info.get("home_page") not in (None, "", "Unknown"):
+            references.append({"type": "website", "url": info["home_page"]})
+        if item.get("vcs") and item.get("url"):
+            references.append({"type": "vcs", "url": item["url"]})
+        if references:
+            component["externalReferences"] = references
+        properties = [{"name": "location", "value": item["location"]}] if item.get("location") else []
+        if "reachable" in info:
+            properties.append({"name": "reachable_from_requirements", "value": str(info["reachable"]).lower()})
+        if item.get("record_hash"):
+            # RECORD（インストールされた全ファイルのハッシュ一覧）のハッシュ。wheelのハッシュではないため
+            # hashes には入れない
+            properties.append({"name": "record-sha256", "value": item["record_hash"]})
+        if properties:
+            component["properties"] = properties
+        return component
+
+    def _trailing_items(self, info, vulnerabilities):
+        ref = purl(info["name"], info["version"])
+        depends_on = [purl(target, self.inventory[target]["version"])
+                      for target in self.dependencies.get(info["name"], ()) if target in self.inventory]
+        yield {"kind": "dependency", "ref": ref, "dependsOn": sorted(set(depends_on))}
+        for vuln in vulnerabilities:
+            entry = {
+                "kind": "vulnerability",
+                "id": vuln.get("id", "N/A"),
+                "source": {"name": vuln["source"]},
+                "description": vuln["description"],
+                "affects": [{"ref": ref, "versions": [{"version": info["version"], "status": "affected"}]}],
+            }
+            url = advisory_url(entry["id"], vuln["source"])
+            if url:
+                entry["source"]["url"] = url
+            yield entry
+
+    def _write_footer(self):
+        self._file.write('\n],\n"dependencies": [')
+        self._write_items("dependency")
+        self._file.write('\n],\n"vulnerabilities": [')
+        self._write_items("vulnerability")
+        self._file.write("\n]\n}\n")
+
+
+class SpdxWriter(SbomWriter):
+    """SPDX 2.3（JSON）"""
+
+    @staticmethod
+    def _spdx_id(name, version):
+        safe = "".join(char if char.isalnum() or char in ".-" else "-" for char in f"{name}-{version}")
+        return f"SPDXRef-Package-{safe}"
+
+    def _write_header(self):
+        name = f"{platform.node() or 'workstation'}-python-environment"
+        header = {
+            "spdxVersion": "SPDX-2.3",
+            "dataLicense": "CC0-1.0",
+            "SPDXID": "SPDXRef-DOCUMENT",
+            "name": name,
+            "documentNamespace": f"https://spdx.org/spdxdocs/{quote(name)}-{uuid.uuid4()}",
+            "creationInfo": {"created": _timestamp(), "creators": [f"Tool: {TOOL_NAME}"]},
+        }
+        self._file.write(_dumps(header)[:-1] + ',\n"packages": [')
+
+    def _component(self, info, item, vulnerabilities):
+        package = {
+            "SPDXID": self._spdx_id(info["name"], info["version"]),
+            "name": item.get("display_name", info["name"]),
+            "versionInfo": info["version"],
+            "downloadLocation": item["url"] if item.get("vcs") and item.get("url") else "NOASSERTION",
+            "filesAnalyzed": False,
+            "licenseDeclared": "NOASSERTION",
+            "licenseConcluded": "NOASSERTION",
+            "copyrightText": "NOASSERTION",
+            "externalRefs": [{"referenceCategory": "PACKAGE-MANAGER", "referenceType": "purl",
+                              "referenceLocator": purl(info["name"], info["version"])}],
+        }
+        comments = []
+        if item.get("license"):
+            comments.append(f"License: {item['license']}")
+        if item.get("record_hash"):
+            # RECORDのハッシュはwheelのハッシュではないため checksums には入れない
+            comments.append(f"record-sha256: {item['record_hash']}")
+        if comments:
+            package["comment"] = "\n".join(comments)
+        if info.get("author") not in (None, "", "Unknown"):
+            package["supplier"] = f"Person: {info['author']}"
+        if info.get("home_page") not in (None, "", "Unknown"):
+            package["homepage"] = info["home_page"]
+        # 脆弱性は SECURITY カテゴリの外部参照として部品に直接結び付ける（参照先はURLに限られるため、
+        # URLのわからない脆弱性は含めない）
+        for vuln in vulnerabilities:
+            url = advisory_url(vuln.get("id", ""), vuln["source"])
+            if not url:
+                continue
+            package["externalRefs"].append({
+                "referenceCategory": "SECURITY",
+                "referenceType": "advisory",
+                "referenceLocator": url,
+                "comment": f"{vuln['source']}: {vuln['description']}",
+            })
+        return package
+
+    def _trailing_items(self, info, vulnerabilities):
+        spdx_id = self._spdx_id(info["name"], info["version"])
+        yield {"kind": "relationship", "spdxElementId": "SPDXRef-DOCUMENT",
+               "relationshipType": "DESCRIBES", "relatedSpdxElement": spdx_id}
+        for target in self.dependencies.get(info["name"], ()):
+            if target in self.inventory:
+                yield {"kind": "relationship", "spdxElementId": spdx_id, "relationshipType": "DEPENDS_ON",
+                       "relatedSpdxElement": self._spdx_id(target, self.inventory[target]["version"])}
+
+    def _write_footer(self):
+        self._file.write('\n],\n"relationships": [')
+        self._write_items("relationship")
+        self._file.write("\n]\n}\n")
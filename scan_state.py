@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+差分スキャンの状態管理
+前回のセキュリティレポートに保存したパッケージごとのフィンガープリントと
+今回の値を比べ、バージョンまたは該当するアドバイザリが変わったパッケージだけを
+再チェックします。前回との差分（新しい脆弱性・解消した脆弱性・削除したパッケージ等）も
+ここで作成します。
+"""
+
+import os
+import json
+import hashlib
+import logging
+
+from report_writer import ReportWriter, read_partial_report
+
+logger = logging.getLogger(__name__)
+
+SCAN_STATE_VERSION = 2
+
+
+def advisory_sources(vuln_index=None, osv_index=None):
+    """使用したアドバイザリデータの版"""
+    return {
+        "safety_db": vuln_index.source if vuln_index is not None else None,
+        "osv": osv_index.meta.get("fingerprint") if osv_index is not None else None,
+    }
+
+
+def package_fingerprint(name, version, vuln_index=None, osv_index=None, offline=False):
+    """チェック結果を左右する入力（バージョン・該当するアドバイザリ・オフラインか）の値"""
+    parts = [
+        version,
+        "offline" if offline else "online",
+        vuln_index.digest(name) if vuln_index is not None else "-",
+        osv_index.digest(name) if osv_index is not None else "-",
+    ]
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def load_previous_report(filename="security_report.json"):
+    """前回のレポートを読み込む（差分スキャンの状態がない場合はNone）
+
+    前回のチェックが中断され、完成したレポートより新しい .partial が残っている場合は、
+    中断時点までの結果を読み込みます（"partial": True）。
+    """
+    partial = ReportWriter.partial_path(filename)
+    report = None
+    if os.path.exists(partial) and (not os.path.exists(filename)
+                                    or os.path.getmtime(partial) > os.path.getmtime(filename)):
+        report = read_partial_report(partial)
+        if report:
+            logger.info(f"中断したチェックの結果を読み込みました: {len(report['packages'])}個のパッケージ")
+    if report is None:
+        try:
+            with open(filename, "r", encoding="utf-8") as f:
+                report = json.load(f)
+        except (OSError, ValueError):
+            return None
+    state = report.get("scan_state")
+    if not state or state.get("version") != SCAN_STATE_VERSION:
+        logger.info("前回のレポートに差分スキャンの情報がないため、すべてのパッケージをチェックします")
+        return None
+    return report
+
+
+def previous_results(report):
+    """前回のレポートから {パッケージ名: (フィンガープリント, 情報, 脆弱性)} を作成"""
+    if not report:
+        return {}
+    results = {}
+    for record in report.get("packages", []):
+        info = dict(record)
+        fingerprint = info.pop("fingerprint", None)
+        vulnerabilities = info.pop("vulnerabilities", [])
+        if fingerprint:
+            results[info["name"]] = (fingerprint, info, vulnerabilities)
+    return results
+
+
+def _vulnerability_keys(report):
+    """(パッケージ名, 取得元, ID) -> (バージョン, 説明) の辞書"""
+    keys = {}
+    for item in report.get("vulnerable_packages", []):
+        for vuln in item["vulnerabilities"]:
+            keys[(item["name"], vuln["source"], vuln.get("id", "N/A"))] = (item["version"], vuln["description"])
+    return keys
+
+
+def diff_reports(previous, current, installed):
+    """前回と今回のレポートの差分を作成（installed は今回の {パッケージ名: バージョン}）"""
+    old_packages = {item["name"]: item["version"] for item in previous.get("packages", [])}
+    new_packages = installed
+    old_vulns = _vulnerability_keys(previous)
+    new_vulns = _vulnerability_keys(current)
+    old_suspicious = {item["name"] for item in previous.get("suspicious_packages", [])}
+
+    def vulnerability_list(keys, source):
+        return [
+            {"name": name, "version": source[(name, origin, vuln_id)][0], "source": origin,
+             "id": vuln_id, "description": source[(name, origin, vuln_id)][1]}
+            for name, origin, vuln_id in sorted(keys)
+        ]
+
+    old_sources = previous.get("scan_state", {}).get("advisory_sources", {})
+    new_sources = current.get("scan_state", {}).get("advisory_sources", {})
+    return {
+        "previous_timestamp": previous.get("timestamp"),
+        "timestamp": current.get("timestamp"),
+        "advisory_data_updated": sorted(key for key in new_sources if new_sources.get(key) != old_sources.get(key)),
+        "added_packages": [{"name": name, "version": new_packages[name]}
+                           for name in sorted(new_packages.keys() - old_packages.keys())],
+        "removed_packages": [{"name": name, "version": old_packages[name]}
+                             for name in sorted(old_packages.keys() - new_packages.keys())],
+        "updated_packages": [{"name": name, "from": old_packages[name], "to": new_packages[name]}
+                             for name in sorted(new_packages.keys() & old_packages.keys())
+                             if new_packages[name] != old_packages[name]],
+        "new_vulnerabilities": vulnerability_list(new_vulns.keys() - old_vulns.keys(), new_vulns),
+        "fixed_vulnerabilities": vulnerability_list(old_vulns.keys() - new_vulns.keys(), old_vulns),
+        "new_suspicious_packages": [item for item in current.get("suspicious_packages", [])
+                                    if item["name"] not in old_suspicious],
+    }
+
+
+def save_diff(diff, filename="security_report_diff.json"):
+    """差分レポートをJSONファイルとして保存"""
+    try:
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(diff, f, ensure_ascii=False, indent=2)
+        logger.info(f"差分レポートを保存しました: {filename}")
+        return True
+    except Exception as e:
+        logger.error(f"差分レポートの保存に失敗しました: {e}")
+        return False
+
+
+def print_diff(diff):
+    """差分レポートの内容を表示"""
+    print(f"\n前回（{diff['previous_timestamp']}）からの変更:")
+    if diff["advisory_data_updated"]:
+        print(f"- 更新された脆弱性データ: {', '.join(diff['advisory_data_updated'])}")
+    for item in diff["added_packages"]:
+        print(f"- 追加: {item['name']} {item['version']}")
+    for item in diff["removed_packages"]:
+        print(f"- 削除: {item['name']} {item['version']}")
+    for item in diff["updated_packages"]:
+        print(f"- 更新: {item['name']} {item['from']} -> {item['to']}")
+    for item in diff["new_vulnerabilities"]:
+        print(f"- 新しい脆弱性: {item['name']} {item['version']} ({item['source']}: {item['id']})")
+    for item in diff["fixed_vulnerabilities"]:
+        print(f"- 解消した脆弱性: {item['name']} {item['version']} ({item['source']}: {item['id']})")
+    for item in diff["new_suspicious_packages"]:
+        print(f"- 新しい怪しいパッケージ: {item['name']}: {item['reason']}")
+    if not any(diff[key] for key in ("advisory_data_updated", "added_packages", "removed_packages",
+                                     "updated_packages", "new_vulnerabilities", "fixed_vulnerabilities",
+                                     "new_suspicious_packages")):
+        print("- 変更はありません")
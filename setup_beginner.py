@@ -12,9 +12,14 @@ import subprocess
 import platform
 import logging
 import shutil
+import argparse
 import webbrowser
 from pathlib import Path
 
+from environment_probe import run_probe, installed_fingerprint, ProbeCache, CACHE_PATH as PROBE_CACHE_PATH
+from setup_pipeline import Step, SetupPipeline, file_hash
+import wheelhouse
+
 # ロガーの設定
 logging.basicConfig(
     level=logging.INFO,
@@ -56,65 +61,25 @@ def check_python_version():
     print("✅ Pythonのバージョンは要件を満たしています。")
     return True
 
-def check_pip():
+def check_pip(probe):
     """pipがインストールされているか確認"""
     print_step(2, "pipの状態を確認しています...")
     
-    try:
-        subprocess.run(
-            [sys.executable, "-m", "pip", "--version"],
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        print("✅ pipが正常にインストールされています。")
+    if probe["pip"]["ok"]:
+        print(f"✅ pipが正常にインストールされています。（バージョン {probe['pip']['version']}）")
         return True
-    except (subprocess.SubprocessError, FileNotFoundError):
-        print("❌ pipがインストールされていないか、正常に動作していません。")
-        print("   Pythonを再インストールするか、以下のコマンドでpipをインストールしてください:")
-        print("   python -m ensurepip --upgrade")
-        return False
+    
+    print("❌ pipがインストールされていないか、正常に動作していません。")
+    print("   Pythonを再インストールするか、以下のコマンドでpipをインストールしてください:")
+    print("   python -m ensurepip --upgrade")
+    return False
 
-def check_chrome():
+def check_chrome(probe):
     """Google Chromeがインストールされているか確認"""
     print_step(3, "Google Chromeを確認しています...")
     
-    system = platform.system()
-    chrome_found = False
-    chrome_path = None
-    
-    if system == "Windows":
-        chrome_paths = [
-            os.path.join(os.environ.get("PROGRAMFILES", "C:\\Program Files"), "Google\\Chrome\\Application\\chrome.exe"),
-            os.path.join(os.environ.get("PROGRAMFILES(X86)", "C:\\Program Files (x86)"), "Google\\Chrome\\Application\\chrome.exe"),
-            os.path.join(os.environ.get("LOCALAPPDATA", ""), "Google\\Chrome\\Application\\chrome.exe")
-        ]
-        
-        for path in chrome_paths:
-            if os.path.exists(path):
-                chrome_found = True
-                chrome_path = path
-                break
-    
-    elif system == "Darwin":  # macOS
-        chrome_path = "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome"
-        if os.path.exists(chrome_path):
-            chrome_found = True
-    
-    elif system == "Linux":
-        chrome_paths = [
-            "/usr/bin/google-chrome",
-            "/usr/bin/chrome",
-            "/usr/bin/chromium",
-            "/usr/bin/chromium-browser"
-        ]
-        
-        for path in chrome_paths:
-            if os.path.exists(path):
-                chrome_found = True
-                chrome_path = path
-                break
+    chrome_found = probe["chrome"]["found"]
+    chrome_path = probe["chrome"]["path"]
     
     if chrome_found:
         print(f"✅ Google Chromeが見つかりました: {chrome_path}")
@@ -134,7 +99,7 @@ def check_chrome():
             
         return False
 
-def install_dependencies():
+def install_dependencies(probe):
     """必要なパッケージをインストール"""
     print_step(4, "必要なパッケージをインストールしています...")
     
@@ -145,6 +110,18 @@ def install_dependencies():
         print("   正しいディレクトリにいることを確認してください。")
         return False
     
+    if probe["requirements_satisfied"]:
+        print("✅ 必要なパッケージはすべてインストールされています。")
+        return True
+    
+    # wheelhouseがあれば、インターネットに接続せずにインストールする
+    if wheelhouse.available():
+        print("wheelhouseからパッケージをインストールしています...")
+        if wheelhouse.install():
+            print("✅ 必要なパッケージのインストールが完了しました。")
+            return True
+        print("⚠ wheelhouseからのインストールに失敗したため、インターネットからインストールします。")
+    
     # パッケージのインストール
     try:
         print("パッケージのインストールを開始します...")
@@ -167,85 +144,35 @@ def setup_selenium():
     """Seleniumの初期設定"""
     print_step(5, "Seleniumの初期設定を行っています...")
     
-    try:
-        # Seleniumのインポートテスト
-        print("Seleniumのインポートをテストしています...")
-        import_cmd = (
-            "try:\n"
-            "    from selenium import webdriver\n"
-            "    from selenium.webdriver.chrome.service import Service\n"
-            "    from selenium.webdriver.chrome.options import Options\n"
-            "    from webdriver_manager.chrome import ChromeDriverManager\n"
-            "    print('Seleniumのインポートに成功しました')\n"
-            "except ImportError as e:\n"
-            "    print(f'Seleniumのインポートに失敗しました: {e}')\n"
-            "    exit(1)\n"
-        )
-        
-        result = subprocess.run(
-            [sys.executable, "-c", import_cmd],
-            check=False,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        
-        if result.returncode != 0:
-            print("❌ Seleniumのインポートに失敗しました。")
-            print("   以下のコマンドを手動で実行してみてください:")
-            print("   pip install selenium webdriver-manager")
-            return False
-        
-        print(result.stdout.strip())
-        
-        # ChromeDriverのダウンロードテスト
-        print("\nChromeDriverのダウンロードをテストしています...")
-        driver_cmd = (
-            "try:\n"
-            "    from selenium import webdriver\n"
-            "    from selenium.webdriver.chrome.service import Service\n"
-            "    from selenium.webdriver.chrome.options import Options\n"
-            "    from webdriver_manager.chrome import ChromeDriverManager\n"
-            "    \n"
-            "    options = Options()\n"
-            "    options.add_argument('--headless=new')\n"
-            "    options.add_argument('--no-sandbox')\n"
-            "    options.add_argument('--disable-dev-shm-usage')\n"
-            "    \n"
-            "    service = Service(ChromeDriverManager().install())\n"
-            "    driver = webdriver.Chrome(service=service, options=options)\n"
-            "    print('ChromeDriverのセットアップに成功しました')\n"
-            "    driver.quit()\n"
-            "except Exception as e:\n"
-            "    print(f'ChromeDriverのセットアップに失敗しました: {e}')\n"
-            "    exit(1)\n"
-        )
-        
-        result = subprocess.run(
-            [sys.executable, "-c", driver_cmd],
-            check=False,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        
-        if result.returncode != 0:
-            print("❌ ChromeDriverのセットアップに失敗しました。")
-            print("   詳細なエラーメッセージ:")
-            print(result.stdout.strip())
-            print(result.stderr.strip())
-            print("\n   以下の点を確認してください:")
-            print("   - インターネット接続が正常か")
-            print("   - Google Chromeが最新バージョンか")
-            print("   - ファイアウォールがダウンロードをブロックしていないか")
-            return False
-        
-        print(result.stdout.strip())
-        print("✅ Seleniumの初期設定が完了しました。")
-        return True
-    except Exception as e:
-        print(f"❌ Seleniumの初期設定中にエラーが発生しました: {e}")
+    # Seleniumのインポートテスト・ChromeDriverのダウンロードテストを1つのプロセスでまとめて行う
+    print("SeleniumのインポートとChromeDriverのセットアップをテストしています...")
+    probe = run_probe(driver=True)
+    if probe is None:
+        print("❌ Seleniumの初期設定の確認を実行できませんでした。")
         return False
+    
+    if not probe["selenium"]["ok"]:
+        print("❌ Seleniumのインポートに失敗しました。")
+        for module, error in probe["selenium"]["errors"].items():
+            print(f"   {module}: {error}")
+        print("   以下のコマンドを手動で実行してみてください:")
+        print("   pip install selenium webdriver-manager")
+        return False
+    print("Seleniumのインポートに成功しました")
+    
+    if not probe["driver"]["ok"]:
+        print("❌ ChromeDriverのセットアップに失敗しました。")
+        print("   詳細なエラーメッセージ:")
+        print(f"   {probe['driver']['error']}")
+        print("\n   以下の点を確認してください:")
+        print("   - インターネット接続が正常か")
+        print("   - Google Chromeが最新バージョンか")
+        print("   - ファイアウォールがダウンロードをブロックしていないか")
+        return False
+    
+    print(f"ChromeDriverのセットアップに成功しました: {probe['driver']['path']}")
+    print("✅ Seleniumの初期設定が完了しました。")
+    return True
 
 def create_test_script():
     """Seleniumのテスト用スクリプトを作成"""
@@ -521,59 +448,80 @@ def run_security_check():
         print(f"❌ セキュリティチェック実行中にエラーが発生しました: {e}")
         return False
 
-def main():
+def ask_security_check():
+    """セキュリティチェックを実行するか確認して実行"""
+    print("\nセキュリティチェックを実行しますか？ (y/n): ", end="")
+    choice = input().strip().lower()
+    if choice != 'y':
+        return False
+    return run_security_check()
+
+def startup_script_path():
+    """起動用スクリプトのパス"""
+    return "start_web_dakoku.bat" if platform.system() == "Windows" else "start_web_dakoku.sh"
+
+def build_steps(probe):
+    """セットアップのステップのグラフ
+
+    各ステップの入力（指紋に含める値）が前回と同じで、作成したファイルも
+    変わっていなければ、そのステップは実行されません。
+    """
+    interpreter = lambda: [sys.executable, platform.python_version()]
+    requirements = lambda: file_hash("requirements.txt")
+    chrome = lambda: [probe["chrome"]["path"], probe["chrome"]["version"]]
+    return [
+        Step("Python", check_python_version, inputs=interpreter,
+             failure_message="Pythonのバージョンが要件を満たしていないため、セットアップを中止します。"),
+        Step("pip", check_pip, args=(probe,), depends=["Python"], inputs=lambda: probe["pip"]["version"],
+             failure_message="pipが正常に動作していないため、セットアップを中止します。"),
+        Step("Chrome", check_chrome, args=(probe,), inputs=chrome,
+             failure_message="Google Chromeが見つからないため、セットアップを中止します。\n"
+                             "   Google Chromeをインストールした後、このスクリプトを再実行してください。"),
+        # インストール後の site-packages の状態を記録し、パッケージが変わったら実行し直す
+        Step("パッケージ", install_dependencies, args=(probe,), depends=["pip"],
+             inputs=lambda: [interpreter(), requirements(), installed_fingerprint()],
+             failure_message="依存パッケージのインストールに失敗したため、セットアップを中止します。"),
+        Step("Selenium", setup_selenium, depends=["パッケージ", "Chrome"], inputs=lambda: [interpreter(), chrome()],
+             outputs=lambda: [ProbeCache(PROBE_CACHE_PATH).latest_driver()],
+             failure_message="Seleniumの初期設定に失敗したため、セットアップを中止します。"),
+        Step("テスト用スクリプト", create_test_script, outputs=lambda: ["test_selenium.py"],
+             failure_message="テスト用スクリプトの作成に失敗したため、セットアップを中止します。"),
+        Step("テスト", run_test_script, depends=["Selenium", "テスト用スクリプト"],
+             outputs=lambda: [os.path.join("screenshots", "selenium_test.png")],
+             failure_message="テストに失敗したため、セットアップを中止します。"),
+        Step("起動用スクリプト", create_startup_script, inputs=platform.system,
+             outputs=lambda: [startup_script_path()], required=False),
+        Step("初心者向けガイド", create_beginner_guide, outputs=lambda: ["BEGINNER_GUIDE.md"], required=False),
+        # 入力を求めるため、他のステップが終わってからメインスレッドで実行する。
+        # 脆弱性の情報は毎日更新されるため、パッケージが変わらなくても日付が変われば実行し直す
+        # （check_dependencies.py は前回の結果を使うため、2回目以降は短時間で終わる）
+        Step("セキュリティチェック", ask_security_check, depends=["パッケージ", "テスト"],
+             inputs=lambda: [requirements(), installed_fingerprint(), time.strftime("%Y-%m-%d")],
+             outputs=lambda: ["security_report.json"], required=False, exclusive=True),
+    ]
+
+def main(argv=None):
     """メイン処理"""
+    parser = argparse.ArgumentParser(description="Web打刻ツールの初心者向けセットアップ")
+    parser.add_argument("--force", action="store_true", help="前回の結果を使わず、すべてのステップを実行する")
+    args = parser.parse_args(argv)
+    
     print_header("Web打刻ツール - 初心者向けセットアップ")
     
     print("このスクリプトは、Seleniumを全く使ったことがない方でも")
     print("簡単にWeb打刻ツールをセットアップできるようにするためのものです。")
     print("\n各ステップを順番に実行していきます。")
+    print("前回から変更のないステップは実行せず、中断した場合は次回続きから再開します。")
     
-    # 環境チェック
-    if not check_python_version():
-        print("\n❌ Pythonのバージョンが要件を満たしていないため、セットアップを中止します。")
-        return False
-    
-    if not check_pip():
-        print("\n❌ pipが正常に動作していないため、セットアップを中止します。")
-        return False
-    
-    if not check_chrome():
-        print("\n❌ Google Chromeが見つからないため、セットアップを中止します。")
-        print("   Google Chromeをインストールした後、このスクリプトを再実行してください。")
-        return False
-    
-    # 依存パッケージのインストール
-    if not install_dependencies():
-        print("\n❌ 依存パッケージのインストールに失敗したため、セットアップを中止します。")
+    # pip・パッケージ・Chromeの状態を1つのプロセスでまとめて確認する
+    probe = run_probe()
+    if probe is None:
+        print("\n❌ 環境の確認を実行できなかったため、セットアップを中止します。")
         return False
     
-    # Seleniumの初期設定
-    if not setup_selenium():
-        print("\n❌ Seleniumの初期設定に失敗したため、セットアップを中止します。")
+    if not SetupPipeline(build_steps(probe)).run(force=args.force):
         return False
     
-    # テスト用スクリプトの作成と実行
-    if not create_test_script():
-        print("\n❌ テスト用スクリプトの作成に失敗したため、セットアップを中止します。")
-        return False
-    
-    if not run_test_script():
-        print("\n❌ テストに失敗したため、セットアップを中止します。")
-        return False
-    
-    # 起動用スクリプトの作成
-    create_startup_script()
-    
-    # 初心者向けガイドの作成
-    create_beginner_guide()
-    
-    # セキュリティチェック
-    print("\nセキュリティチェックを実行しますか？ (y/n): ", end="")
-    choice = input().strip().lower()
-    if choice == 'y':
-        run_security_check()
-    
     # セットアップ完了
     print_header("セットアップ完了")
     print("Web打刻ツールのセットアップが完了しました！")
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+セットアップ手順の実行管理
+セットアップの各ステップを依存関係のあるグラフとして実行します。
+
+- 各ステップは入力の指紋（requirements.txt のハッシュ・Pythonのパス・Chromeのバージョンなど、
+  ステップ自身の処理内容と依存するステップの指紋を含む）と、作成したファイルのハッシュを記録します。
+  指紋が前回と同じで作成したファイルも変わっていなければ、そのステップは実行しません。
+- 依存関係のないステップは並列に実行します（表示が混ざらないよう、出力はステップごとにまとめて表示します）。
+- 記録はステップが終わるたびに保存するため、途中で中断しても次回は終わっていないステップから再開します。
+"""
+
+import os
+import sys
+import json
+import time
+import marshal
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+logger = logging.getLogger(__name__)
+
+STATE_PATH = ".setup_state.json"
+STATE_VERSION = 1
+MAX_WORKERS = 4
+
+
+def file_hash(path):
+    """ファイルのハッシュ（存在しない場合はNone）"""
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def code_hash(func):
+    """関数の処理内容のハッシュ（処理や埋め込んだ文字列を変えると変わる）"""
+    code = getattr(func, "__code__", None)
+    if code is None:
+        return getattr(func, "__qualname__", repr(func))
+    return hashlib.sha256(marshal.dumps(code)).hexdigest()
+
+
+class Step:
+    """セットアップの1ステップ
+
+    func は成功したらTrueを返す関数、inputs は指紋に含める値を返す関数、
+    outputs は作成するファイルのパスの一覧を返す関数です。
+    exclusive のステップ（入力を求めるものなど）は、他のステップが動いていないときに
+    メインスレッドで実行します。required のステップが失敗するとセットアップを中止します。
+    """
+
+    def __init__(self, name, func, args=(), depends=(), inputs=None, outputs=None,
+                 required=True, exclusive=False, failure_message=None):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.depends = tuple(depends)
+        self.inputs = inputs
+        self.outputs = outputs
+        self.required = required
+        self.exclusive = exclusive
+        self.failure_message = failure_message
+
+    def output_hashes(self):
+        paths = self.outputs() if self.outputs else []
+        return {path: file_hash(path) for path in paths if path}
+
+
+class _ThreadOutput:
+    """スレッドごとに出力をためておく標準出力"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._local = threading.local()
+
+    def capture(self):
+        self._local.buffer = []
+
+    def release(self):
+        buffer = getattr(self._local, "buffer", None)
+        self._local.buffer = None
+        return "".join(buffer or ())
+
+    def write(self, text):
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            return self.stream.write(text)
+        buffer.append(text)
+        return len(text)
+
+    def flush(self):
+        if getattr(self._local, "buffer", None) is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class SetupPipeline:
+    """ステップのグラフを実行"""
+
+    def __init__(self, steps, state_path=STATE_PATH, max_workers=MAX_WORKERS):
+        self.steps = {step.name: step for step in steps}
+        self.state_path = state_path
+        self.max_workers = max_workers
+        self.state = self._load_state()
+        self.fingerprints = {}
+        self.results = {}
+        self._lock = threading.Lock()
+        for step in steps:
+            for dependency in step.depends:
+                if dependency not in self.steps:
+                    raise ValueError(f"{step.name}の依存先 {dependency} がありません")
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("version") == STATE_VERSION:
+                return state
+        except (OSError, ValueError):
+            pass
+        return {"version": STATE_VERSION, "steps": {}, "running": []}
+
+    def _save_state(self):
+        temp_path = f"{self.state_path}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self.state, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, self.state_path)
+        except OSError as e:
+            logger.warning(f"セットアップの進行状況を保存できませんでした: {e}")
+
+    def fingerprint(self, step):
+        """ステップの指紋（処理内容・入力・依存するステップの指紋）"""
+        parts = {
+            "code": code_hash(step.func),
+            "inputs": step.inputs() if step.inputs else None,
+            "depends": [self.fingerprints.get(name) for name in step.depends],
+        }
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def is_up_to_date(self, step):
+        """前回から変わっていないステップか"""
+        record = self.state["steps"].get(step.name)
+        if not record or record["fingerprint"] != self.fingerprint(step):
+            return False
+        return record["outputs"] == step.output_hashes()
+
+    def _mark_running(self, name, running):
+        with self._lock:
+            names = self.state.setdefault("running", [])
+            if running and name not in names:
+                names.append(name)
+            elif not running and name in names:
+                names.remove(name)
+            self._save_state()
+
+    def _record(self, step):
+        # 実行後の入力で指紋を取り直す（インストールのように入力自体を変えるステップのため）
+        fingerprint = self.fingerprint(step)
+        with self._lock:
+            self.fingerprints[step.name] = fingerprint
+            self.state["steps"][step.name] = {
+                "fingerprint": fingerprint,
+                "outputs": step.output_hashes(),
+                "completed": time.strftime("%Y-%m-%d %H:%M:%S"),
+            }
+        self._mark_running(step.name, False)
+
+    def _execute(self, step, output=None):
+        """ステップを実行し、(成功したか, ためておいた出力) を返す"""
+        if output is not None:
+            output.capture()
+        self._mark_running(step.name, True)
+        try:
+            success = bool(step.func(*step.args))
+        except Exception as e:
+            logger.exception(f"{step.name}の実行中にエラーが発生しました")
+            print(f"❌ 予期せぬエラーが発生しました: {e}")
+            success = False
+        if success:
+            self._record(step)
+        else:
+            with self._lock:
+                self.state["steps"].pop(step.name, None)
+            self._mark_running(step.name, False)
+        return success, output.release() if output is not None else ""
+
+    def _finish(self, step, success, text):
+        if text:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+        self.results[step.name] = success
+        if not success and step.required and step.failure_message:
+            print(f"\n❌ {step.failure_message}")
+
+    def run(self, force=False):
+        """すべてのステップを実行し、必須のステップがすべて成功したらTrueを返す"""
+        if self.state.get("running"):
+            print(f"前回中断したセットアップを再開します（中断したステップ: {', '.join(self.state['running'])}）")
+            self.state["running"] = []
+        if force:
+            self.state["steps"] = {}
+
+        pending = dict(self.steps)
+        running = {}
+        failed = False
+        original_stdout = sys.stdout
+        output = _ThreadOutput(original_stdout)
+        sys.stdout = output
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            while pending or running:
+                progressed = False
+                for name, step in list(pending.items()):
+                    if failed and step.required:
+                        # 必須のステップが失敗したら、新しいステップは始めない
+                        del pending[name]
+                        continue
+                    active = {running_step.name for running_step in running.values()}
+                    if any(dependency in pending or dependency in active for dependency in step.depends):
+                        continue
+                    if any(not self.results.get(dependency) for dependency in step.depends):
+                        # 依存するステップが失敗した
+                        del pending[name]
+                        self.results[name] = False
+                        progressed = True
+                        continue
+                    if step.exclusive and running:
+                        continue
+                    del pending[name]
+                    progressed = True
+                    if self.is_up_to_date(step):
+                        self.fingerprints[name] = self.state["steps"][name]["fingerprint"]
+                        self.results[name] = True
+                        print(f"\n[スキップ] {name}: 前回から変更がないため実行しません")
+                        continue
+                    if step.exclusive:
+                        success, text = self._execute(step)
+                        self._finish(step, success, text)
+                        failed |= not success and step.required
+                    else:
+                        running[executor.submit(self._execute, step, output)] = step
+                if progressed:
+                    continue
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    step = running.pop(future)
+                    success, text = future.result()
+                    self._finish(step, success, text)
+                    failed |= not success and step.required
+        except BaseException:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        finally:
+            sys.stdout = original_stdout
+        executor.shutdown(wait=True)
+        self._save_state()
+        return not failed and all(self.results.get(name) for name, step in self.steps.items() if step.required)
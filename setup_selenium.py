@@ -16,6 +16,9 @@ import shutil
 import urllib.request
 from pathlib import Path
 
+from environment_probe import run_probe
+import wheelhouse
+
 # ロガーの設定
 logging.basicConfig(
     level=logging.INFO,
@@ -28,6 +31,15 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# セットアップでインストールするパッケージ
+PACKAGES = [
+    "selenium",
+    "webdriver-manager",
+    "PySide6",
+    "cryptography",
+    "pillow"
+]
+
 def check_python_version():
     """Pythonのバージョンを確認"""
     logger.info(f"Pythonバージョン: {platform.python_version()}")
@@ -37,141 +49,80 @@ def check_python_version():
         return False
     return True
 
-def check_pip():
+def check_pip(probe):
     """pipがインストールされているか確認"""
-    try:
-        subprocess.run([sys.executable, "-m", "pip", "--version"], 
-                      check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        logger.info("pipが正常にインストールされています")
+    if probe["pip"]["ok"]:
+        logger.info(f"pipが正常にインストールされています（バージョン {probe['pip']['version']}）")
         return True
-    except (subprocess.SubprocessError, FileNotFoundError):
-        logger.error("pipがインストールされていないか、正常に動作していません")
-        return False
+    logger.error("pipがインストールされていないか、正常に動作していません")
+    return False
 
-def install_dependencies():
+def install_dependencies(probe):
     """必要なパッケージをインストール"""
-    packages = [
-        "selenium",
-        "webdriver-manager",
-        "PySide6",
-        "cryptography",
-        "pillow"
-    ]
+    packages = [package for package in PACKAGES if not probe["packages"].get(package, {}).get("ok")]
+    if not packages:
+        logger.info("必要なパッケージはすべてインストールされています")
+        return True
     
-    logger.info("必要なパッケージをインストールします...")
+    # wheelhouseがあれば、requirements.txt のパッケージをインターネットに接続せずにインストールする
+    if wheelhouse.available() and wheelhouse.install():
+        logger.info("すべてのパッケージのインストールが完了しました")
+        return True
     
-    for package in packages:
-        try:
-            logger.info(f"{package}をインストールしています...")
-            subprocess.run(
-                [sys.executable, "-m", "pip", "install", package],
-                check=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            logger.info(f"{package}のインストールが完了しました")
-        except subprocess.SubprocessError as e:
-            logger.error(f"{package}のインストールに失敗しました: {e}")
-            return False
+    # 1回のpipの実行でまとめてインストールする
+    logger.info(f"必要なパッケージをインストールします: {', '.join(packages)}")
+    try:
+        subprocess.run(
+            [sys.executable, "-m", "pip", "install", *packages],
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+    except subprocess.SubprocessError as e:
+        logger.error(f"パッケージのインストールに失敗しました: {e}")
+        return False
     
     logger.info("すべてのパッケージのインストールが完了しました")
     return True
 
-def detect_chrome():
+def detect_chrome(probe):
     """Chromeがインストールされているか確認"""
-    system = platform.system()
-    
-    if system == "Windows":
-        chrome_paths = [
-            os.path.join(os.environ.get("PROGRAMFILES", "C:\\Program Files"), "Google\\Chrome\\Application\\chrome.exe"),
-            os.path.join(os.environ.get("PROGRAMFILES(X86)", "C:\\Program Files (x86)"), "Google\\Chrome\\Application\\chrome.exe"),
-            os.path.join(os.environ.get("LOCALAPPDATA", ""), "Google\\Chrome\\Application\\chrome.exe")
-        ]
-        
-        for path in chrome_paths:
-            if os.path.exists(path):
-                logger.info(f"Chromeが見つかりました: {path}")
-                return True, path
-    
-    elif system == "Darwin":  # macOS
-        chrome_path = "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome"
-        if os.path.exists(chrome_path):
-            logger.info(f"Chromeが見つかりました: {chrome_path}")
-            return True, chrome_path
-    
-    elif system == "Linux":
-        chrome_paths = [
-            "/usr/bin/google-chrome",
-            "/usr/bin/chrome",
-            "/usr/bin/chromium",
-            "/usr/bin/chromium-browser"
-        ]
-        
-        for path in chrome_paths:
-            if os.path.exists(path):
-                logger.info(f"Chromeが見つかりました: {path}")
-                return True, path
+    chrome = probe["chrome"]
+    if chrome["found"]:
+        logger.info(f"Chromeが見つかりました: {chrome['path']}")
+        return True, chrome["path"]
     
     logger.warning("Chromeが見つかりませんでした")
     return False, None
 
-def get_chrome_version(chrome_path):
+def get_chrome_version(probe):
     """Chromeのバージョンを取得"""
-    if not chrome_path:
-        return None
-    
-    try:
-        if platform.system() == "Windows":
-            # Windowsの場合はレジストリからバージョンを取得
-            import winreg
-            key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, r"Software\Google\Chrome\BLBeacon")
-            version, _ = winreg.QueryValueEx(key, "version")
-            logger.info(f"Chromeバージョン: {version}")
-            return version
-        else:
-            # macOSとLinuxの場合はコマンドラインからバージョンを取得
-            result = subprocess.run(
-                [chrome_path, "--version"],
-                check=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            version = result.stdout.strip().split()[-1]
-            logger.info(f"Chromeバージョン: {version}")
-            return version
-    except Exception as e:
-        logger.error(f"Chromeバージョンの取得に失敗しました: {e}")
-        return None
-
-def download_chromedriver(version=None):
+    version = probe["chrome"]["version"]
+    if version:
+        logger.info(f"Chromeバージョン: {version}")
+    elif probe["chrome"]["found"]:
+        logger.error("Chromeバージョンの取得に失敗しました")
+    return version
+
+def download_chromedriver():
     """ChromeDriverをダウンロード"""
-    try:
-        # webdriver-managerを使用してChromeDriverをダウンロード
-        from webdriver_manager.chrome import ChromeDriverManager
-        from selenium import webdriver
-        from selenium.webdriver.chrome.service import Service
-        
-        logger.info("ChromeDriverをダウンロードしています...")
-        driver_path = ChromeDriverManager().install()
-        logger.info(f"ChromeDriverのダウンロードが完了しました: {driver_path}")
-        
-        # ChromeDriverが正常に動作するか確認
-        try:
-            from selenium.webdriver.chrome.options import Options
-            options = Options()
-            options.add_argument("--headless=new")
-            service = Service(driver_path)
-            driver = webdriver.Chrome(service=service, options=options)
-            driver.quit()
-            logger.info("ChromeDriverが正常に動作することを確認しました")
-        except Exception as e:
-            logger.warning(f"ChromeDriverのテストに失敗しました: {e}")
-        
-        return True, driver_path
-    except Exception as e:
-        logger.error(f"ChromeDriverのダウンロードに失敗しました: {e}")
+    # ダウンロードと動作確認を1つのプロセスでまとめて行う
+    logger.info("ChromeDriverをダウンロードしています...")
+    probe = run_probe(driver=True, packages=PACKAGES)
+    if probe is None:
+        return False, None
+    
+    driver = probe["driver"]
+    if not driver["path"]:
+        logger.error(f"ChromeDriverのダウンロードに失敗しました: {driver['error']}")
         return False, None
+    
+    logger.info(f"ChromeDriverのダウンロードが完了しました: {driver['path']}")
+    if driver["ok"]:
+        logger.info("ChromeDriverが正常に動作することを確認しました")
+    else:
+        logger.warning(f"ChromeDriverのテストに失敗しました: {driver['error']}")
+    return True, driver["path"]
 
 def create_test_script():
     """テスト用のスクリプトを作成"""
@@ -402,23 +353,29 @@ def main():
         logger.error("Pythonバージョンが要件を満たしていません。Python 3.6以上が必要です。")
         return False
     
+    # pip・パッケージ・Chromeの状態を1つのプロセスでまとめて確認する
+    probe = run_probe(packages=PACKAGES)
+    if probe is None:
+        logger.error("環境の確認を実行できませんでした。")
+        return False
+    
     # pipの確認
-    if not check_pip():
+    if not check_pip(probe):
         logger.error("pipが正常に動作していません。Pythonのインストールを確認してください。")
         return False
     
     # 依存パッケージのインストール
-    if not install_dependencies():
+    if not install_dependencies(probe):
         logger.error("依存パッケージのインストールに失敗しました。")
         return False
     
     # Chromeの検出
-    chrome_installed, chrome_path = detect_chrome()
+    chrome_installed, chrome_path = detect_chrome(probe)
     if not chrome_installed:
         logger.warning("Google Chromeが見つかりませんでした。インストールしてください。")
     else:
         # Chromeバージョンの取得
-        chrome_version = get_chrome_version(chrome_path)
+        chrome_version = get_chrome_version(probe)
     
     # ChromeDriverのダウンロード
     driver_downloaded, driver_path = download_chromedriver()
@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+タイポスクワッティングの検出
+人気のPyPIパッケージ名の一覧に対して、似た文字の正規化とキーボード上の
+隣接キーを考慮したDamerau–Levenshtein距離で近い名前を探します。
+
+候補の検索には削除近傍の索引（各名前から最大2文字を削除した文字列の整列済みの一覧）を
+使います。編集距離が2以下の2つの名前は、それぞれから2文字以内を削除した
+共通の文字列を必ず持つため、索引を引くだけで候補を漏れなく取り出せます。
+隣接キーの打ち間違いは距離0.5と数えますが、索引で探せるのは編集が2回までの名前のため、
+距離が許容範囲内でも編集が3回以上の名前（隣接キーの打ち間違い3〜4回など）は検出しません。
+
+索引は人気のパッケージ名の一覧のハッシュと一緒に保存し、一覧が変わるまで作り直しません。
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+import unicodedata
+from bisect import bisect_left
+from pathlib import Path
+
+from packaging.utils import canonicalize_name
+
+logger = logging.getLogger(__name__)
+
+CORPUS_PATH = Path(__file__).parent / "data" / "popular_pypi_packages.txt"
+TOP_PACKAGES_URL = "https://hugovk.github.io/top-pypi-packages/top-pypi-packages.min.json"
+CORPUS_SIZE = 5000
+# 他のキャッシュ（.browser_cache.json など）と同じく、作業ディレクトリではなくこのスクリプトの隣に置く
+INDEX_PATH = Path(__file__).parent / ".typosquat_index.json"
+INDEX_FORMAT_VERSION = 1
+
+MAX_DISTANCE = 2
+# 隣接キーの打ち間違いのコスト（その他の編集は1）
+ADJACENT_KEY_COST = 0.5
+
+# 見た目が似ている文字の置き換え（小文字化の前に適用するものを含む）
+HOMOGLYPHS_BEFORE_LOWER = {"I": "l"}
+HOMOGLYPHS = {
+    "0": "o", "1": "l",
+    # キリル文字・ギリシャ文字
+    "а": "a", "е": "e", "о": "o", "р": "p", "с": "c", "у": "y", "х": "x",
+    "ѕ": "s", "і": "l", "ј": "j", "ԁ": "d", "ο": "o", "α": "a", "ν": "v", "ι": "l",
+}
+HOMOGLYPH_SEQUENCES = (("rn", "m"), ("vv", "w"), ("cl", "d"))
+
+KEYBOARD_ROWS = ("1234567890-", "qwertyuiop", "asdfghjkl", "zxcvbnm")
+
+
+def _keyboard_neighbors():
+    """QWERTY配列で隣接するキーの組"""
+    positions = {}
+    for row, keys in enumerate(KEYBOARD_ROWS):
+        for column, key in enumerate(keys):
+            positions[key] = (row, column)
+    neighbors = set()
+    for key, (row, column) in positions.items():
+        for other, (other_row, other_column) in positions.items():
+            if key != other and abs(row - other_row) <= 1 and abs(column - other_column) <= 1:
+                neighbors.add((key, other))
+    return neighbors
+
+
+ADJACENT_KEYS = _keyboard_neighbors()
+
+
+def skeleton(name):
+    """比較用に正規化した名前（区切り文字を除き、似た文字を統一）"""
+    name = unicodedata.normalize("NFKC", name)
+    for source, target in HOMOGLYPHS_BEFORE_LOWER.items():
+        name = name.replace(source, target)
+    name = name.lower()
+    name = "".join(HOMOGLYPHS.get(char, char) for char in name)
+    for source, target in HOMOGLYPH_SEQUENCES:
+        name = name.replace(source, target)
+    return "".join(char for char in name if char not in "-_.")
+
+
+def damerau_levenshtein(a, b, adjacent_cost=ADJACENT_KEY_COST):
+    """隣接キーの置換を安く数えるDamerau–Levenshtein距離（隣接文字の入れ替えは1）
+
+    adjacent_cost=1 とすると、編集の回数（重みなしの距離）を返します。
+    """
+    n, m = len(a), len(b)
+    infinity = n + m
+    last_row = {}
+    d = [[infinity] * (m + 2)]
+    d.append([infinity] + list(range(m + 1)))
+    for i in range(1, n + 1):
+        d.append([infinity, i] + [0] * m)
+    for i in range(1, n + 1):
+        a_char = a[i - 1]
+        last_match = 0
+        row, previous = d[i + 1], d[i]
+        for j in range(1, m + 1):
+            b_char = b[j - 1]
+            k = last_row.get(b_char, 0)
+            l = last_match
+            if a_char == b_char:
+                cost = 0
+                last_match = j
+            elif (a_char, b_char) in ADJACENT_KEYS:
+                cost = adjacent_cost
+            else:
+                cost = 1
+            row[j + 1] = min(
+                previous[j] + cost,
+                row[j] + 1,
+                previous[j + 1] + 1,
+                d[k][l] + (i - k - 1) + 1 + (j - l - 1),
+            )
+        last_row[a_char] = i
+    return d[n + 1][m + 1]
+
+
+def _deletions(word, max_deletes=MAX_DISTANCE):
+    """最大 max_deletes 文字を削除した文字列の集合（1文字以上は残す）"""
+    variants = {word}
+    current = {word}
+    for _ in range(max_deletes):
+        current = {
+            variant[:i] + variant[i + 1:]
+            for variant in current if len(variant) > 1
+            for i in range(len(variant))
+        }
+        variants |= current
+    return variants
+
+
+def load_corpus(path=CORPUS_PATH):
+    """人気のパッケージ名の一覧を読み込む（人気順）"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    except OSError as e:
+        logger.error(f"人気のパッケージ名の一覧を読み込めませんでした: {e}")
+        return []
+
+
+def _build_index(skeletons):
+    """削除近傍の索引（削除した文字列の昇順の一覧と、それぞれの元の名前の番号の一覧）"""
+    pairs = sorted((variant, number) for number, word in enumerate(skeletons) for variant in _deletions(word))
+    return [variant for variant, _ in pairs], [number for _, number in pairs]
+
+
+def _load_index(path, source):
+    """保存した索引を読み込む（形式や一覧が異なる場合はNone）"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get("format") != INDEX_FORMAT_VERSION or data.get("source") != source:
+        return None
+    return data["variants"], data["numbers"]
+
+
+def _save_index(path, source, variants, numbers):
+    """索引をJSONとして保存"""
+    temp_path = f"{path}.tmp"
+    try:
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"format": INDEX_FORMAT_VERSION, "source": source, "variants": variants, "numbers": numbers},
+                      f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(temp_path, path)
+    except OSError as e:
+        logger.warning(f"タイポスクワッティングの索引の保存に失敗しました: {e}")
+
+
+class TyposquatDetector:
+    """人気のパッケージ名に似た名前を検出するクラス
+
+    index_path に索引を保存し、次回からは人気のパッケージ名の一覧が同じなら読み込みます
+    （Noneなら保存しません）。
+    """
+
+    def __init__(self, names=None, index_path=INDEX_PATH):
+        names = names if names is not None else load_corpus()
+        self.names = [canonicalize_name(name) for name in names]
+        self.known = set(self.names)
+        self.skeletons = [skeleton(name) for name in self.names]
+        source = hashlib.sha256("\n".join([str(MAX_DISTANCE)] + self.skeletons).encode("utf-8")).hexdigest()
+        index = _load_index(index_path, source) if index_path else None
+        if index is None:
+            index = _build_index(self.skeletons)
+            if index_path:
+                _save_index(index_path, source, *index)
+        self._variants, self._numbers = index
+
+    @staticmethod
+    def threshold(popular_skeleton):
+        """人気のパッケージ名の長さに応じた許容距離（短い名前は1まで）"""
+        return 1 if len(popular_skeleton) <= 5 else MAX_DISTANCE
+
+    def similar(self, name):
+        """似ている人気のパッケージを (距離, 名前) の距離順で返す"""
+        canonical = canonicalize_name(name)
+        word = skeleton(name)
+        candidates = set()
+        for variant in _deletions(word):
+            position = bisect_left(self._variants, variant)
+            while position < len(self._variants) and self._variants[position] == variant:
+                candidates.add(self._numbers[position])
+                position += 1
+
+        matches = []
+        for number in candidates:
+            popular = self.names[number]
+            if popular == canonical:
+                continue
+            popular_skeleton = self.skeletons[number]
+            distance = damerau_levenshtein(word, popular_skeleton)
+            if distance > self.threshold(popular_skeleton):
+                continue
+            # 索引で漏れなく探せるのは編集が2回までの名前のため、それを超えるものは結果を揃えるために除く
+            if damerau_levenshtein(word, popular_skeleton, 1) > MAX_DISTANCE:
+                continue
+            matches.append((distance, number, popular))
+        matches.sort()
+        return [(distance, popular) for distance, _, popular in matches]
+
+    def check(self, name):
+        """タイポスクワッティングの疑いがあれば理由を返す"""
+        canonical = canonicalize_name(name)
+        # 一覧にある人気のパッケージ自体は対象外
+        if canonical in self.known:
+            return None
+        matches = self.similar(name)
+        if not matches:
+            return None
+        distance, popular = matches[0]
+        if distance == 0:
+            detail = "区切り文字または見た目の似た文字だけが異なります"
+        else:
+            detail = f"編集距離 {distance:g}"
+        return {
+            "name": name,
+            "similar_to": popular,
+            "distance": distance,
+            "reason": f"人気のパッケージ '{popular}' に似た名前です (typosquatting, {detail})"
+        }
+
+
+def update_corpus(path=CORPUS_PATH, url=TOP_PACKAGES_URL, limit=CORPUS_SIZE):
+    """人気のパッケージ名の一覧を最新のデータで更新"""
+    import requests
+
+    response = requests.get(url, timeout=30)
+    response.raise_for_status()
+    data = response.json()
+    names = [row["project"] for row in data.get("rows", [])][:limit]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"# 人気のPyPIパッケージ名（ダウンロード数の多い順、上位{limit}件）\n")
+        f.write(f"# 出典: https://github.com/hugovk/top-pypi-packages ({data.get('last_update', '')} 時点)\n")
+        f.write("# 更新: python typosquat.py --update-corpus\n")
+        f.write("\n".join(names) + "\n")
+    logger.info(f"人気のパッケージ名の一覧を更新しました: {len(names)}件")
+    return True
+
+
+def main(argv=None):
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description="タイポスクワッティングの疑いがある名前を検出します")
+    parser.add_argument("names", nargs="*", help="確認するパッケージ名")
+    parser.add_argument("--update-corpus", action="store_true", help="人気のパッケージ名の一覧を更新する")
+    args = parser.parse_args(argv)
+
+    if args.update_corpus:
+        return update_corpus()
+
+    start = time.perf_counter()
+    detector = TyposquatDetector()
+    print(f"索引の作成: {len(detector.names)}件 {time.perf_counter() - start:.2f}秒")
+    for name in args.names:
+        start = time.perf_counter()
+        result = detector.check(name)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{name}: {result['reason'] if result else '問題なし'} ({elapsed:.2f}ミリ秒)")
+    return True
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(0 if main() else 1)
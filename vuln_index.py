@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+脆弱性データベースの索引
+Safety DBをパッケージごとのバージョン区間の索引に一度だけ変換し、
+インストール済みバージョンが影響を受けるかどうかを二分探索で判定します。
+索引はJSONとして保存し、次回からは変換せずに読み込みます。
+"""
+
+import sys
+import json
+import time
+import random
+import hashlib
+import logging
+import argparse
+from bisect import bisect_left
+
+from packaging.specifiers import SpecifierSet, InvalidSpecifier
+from packaging.utils import canonicalize_name
+from packaging.version import Version, InvalidVersion
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT_VERSION = 1
+
+
+def _interval_of(spec):
+    """SpecifierSetを包含するバージョン区間 (下限, 下限を含むか, 上限, 上限を含むか) に変換
+
+    区間は判定の候補を絞るためのもので、実際の判定はSpecifierSetで行うため、
+    SpecifierSetが一致するバージョンをすべて含んでいれば十分です。
+    '!=' は区間を狭めないため無視し、'===' を含む場合は None を返します。
+    """
+    lower, lower_inclusive, upper, upper_inclusive = None, True, None, True
+
+    def raise_lower(version, inclusive):
+        nonlocal lower, lower_inclusive
+        if lower is None or version > lower or (version == lower and not inclusive):
+            lower, lower_inclusive = version, inclusive
+
+    def cut_upper(version, inclusive):
+        nonlocal upper, upper_inclusive
+        if upper is None or version < upper or (version == upper and not inclusive):
+            upper, upper_inclusive = version, inclusive
+
+    def next_prefix(release):
+        # 1.4 -> 1.5.dev0（1.4.* に含まれるどのバージョンよりも大きい最小のバージョン）
+        bumped = list(release[:-1]) + [release[-1] + 1]
+        return Version(".".join(map(str, bumped)) + ".dev0")
+
+    for specifier in spec:
+        operator, value = specifier.operator, specifier.version
+        if operator == "===":
+            return None
+        if operator == "!=":
+            continue
+        if operator == "==" and value.endswith(".*"):
+            release = Version(value[:-2]).release
+            raise_lower(Version(".".join(map(str, release)) + ".dev0"), True)
+            cut_upper(next_prefix(release), False)
+            continue
+
+        version = Version(value)
+        if operator == "==":
+            # ローカルバージョンは索引を公開バージョンで引くため公開部分で扱う
+            version = Version(version.public)
+            raise_lower(version, True)
+            cut_upper(version, True)
+        elif operator == ">=":
+            raise_lower(version, True)
+        elif operator == ">":
+            raise_lower(version, False)
+        elif operator == "<=":
+            cut_upper(version, True)
+        elif operator == "<":
+            cut_upper(version, False)
+        elif operator == "~=":
+            raise_lower(version, True)
+            cut_upper(next_prefix(version.release[:-1]), False)
+    return lower, lower_inclusive, upper, upper_inclusive
+
+
+def _build_package_entry(advisories):
+    """1パッケージ分の索引を作成
+
+    区間の境界となるバージョンを整列し、各境界の点と境界の間の区間ごとに
+    該当しうるアドバイザリの番号を記録します。
+    """
+    intervals = []
+    complex_ids = []
+    for number, advisory in enumerate(advisories):
+        for spec_string in advisory["specs"]:
+            try:
+                interval = _interval_of(SpecifierSet(spec_string))
+            except (InvalidSpecifier, InvalidVersion):
+                interval = None
+            if interval is None:
+                complex_ids.append(number)
+            else:
+                intervals.append((number, interval))
+
+    bounds = sorted({version for _, (lower, _, upper, _) in intervals
+                     for version in (lower, upper) if version is not None})
+    points = [set() for _ in bounds]
+    gaps = [set() for _ in range(len(bounds) + 1)]
+
+    for number, (lower, lower_inclusive, upper, upper_inclusive) in intervals:
+        start = 0 if lower is None else bisect_left(bounds, lower)
+        end = len(bounds) if upper is None else bisect_left(bounds, upper)
+        # 下限の点
+        if lower is not None and lower_inclusive:
+            points[start].add(number)
+        # 上限の点
+        if upper is not None and upper_inclusive:
+            points[end].add(number)
+        # 下限と上限の間の点と区間
+        first_gap = start + 1 if lower is not None else 0
+        for i in range(first_gap, end + 1):
+            gaps[i].add(number)
+        for i in range(first_gap, end):
+            points[i].add(number)
+
+    return {
+        "advisories": advisories,
+        "bounds": [str(version) for version in bounds],
+        "points": [sorted(s) for s in points],
+        "gaps": [sorted(s) for s in gaps],
+        "complex": sorted(set(complex_ids)),
+    }
+
+
+class VulnerabilityIndex:
+    """パッケージごとの脆弱性索引"""
+
+    def __init__(self, packages, source=None):
+        self.packages = packages
+        self.source = source
+        # パッケージごとに、初回の問い合わせ時にVersionとSpecifierSetへ変換して保持する
+        self._compiled = {}
+
+    @staticmethod
+    def fingerprint(safety_db):
+        """Safety DBの内容を識別するための値"""
+        meta = json.dumps(safety_db.get("$meta", {}), sort_keys=True)
+        digest = hashlib.sha256(meta.encode("utf-8"))
+        digest.update(str(len(safety_db)).encode("ascii"))
+        return digest.hexdigest()
+
+    @classmethod
+    def build(cls, safety_db):
+        """Safety DBから索引を作成"""
+        grouped = {}
+        for name, entries in safety_db.items():
+            if name.startswith("$") or not isinstance(entries, list):
+                continue
+            advisories = grouped.setdefault(canonicalize_name(name), [])
+            for entry in entries:
+                specs = entry.get("specs") or ([entry["v"]] if entry.get("v") else [])
+                advisories.append({
+                    "id": entry.get("id", "Unknown"),
+                    "cve": entry.get("cve"),
+                    "advisory": entry.get("advisory", "No description available"),
+                    "specs": [spec for spec in specs if isinstance(spec, str)],
+                })
+        packages = {name: _build_package_entry(advisories) for name, advisories in grouped.items()}
+        return cls(packages, cls.fingerprint(safety_db))
+
+    def save(self, path):
+        """索引をJSONとして保存"""
+        data = {"format": INDEX_FORMAT_VERSION, "source": self.source, "packages": self.packages}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path, source=None):
+        """保存した索引を読み込む（形式や元データが異なる場合はNone）"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("format") != INDEX_FORMAT_VERSION:
+            return None
+        if source is not None and data.get("source") != source:
+            return None
+        return cls(data["packages"], data.get("source"))
+
+    def digest(self, package_name):
+        """パッケージのアドバイザリの内容を識別するための値（該当なしは空文字列）"""
+        entry = self.packages.get(canonicalize_name(package_name))
+        if entry is None:
+            return ""
+        data = json.dumps(entry["advisories"], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def _compile(self, name):
+        compiled = self._compiled.get(name)
+        if compiled is None:
+            entry = self.packages[name]
+            specs = []
+            for advisory in entry["advisories"]:
+                compiled_specs = []
+                for spec_string in advisory["specs"]:
+                    try:
+                        compiled_specs.append(SpecifierSet(spec_string))
+                    except InvalidSpecifier:
+                        logger.warning(f"{name}の脆弱性情報のバージョン指定を解釈できません: {spec_string}")
+                specs.append(compiled_specs)
+            compiled = ([Version(bound) for bound in entry["bounds"]], specs)
+            self._compiled[name] = compiled
+        return compiled
+
+    def affected(self, package_name, version):
+        """指定したバージョンが該当するアドバイザリの一覧を返す"""
+        name = canonicalize_name(package_name)
+        entry = self.packages.get(name)
+        if entry is None:
+            return []
+        try:
+            installed = Version(version)
+        except InvalidVersion:
+            logger.warning(f"{package_name}のバージョンを解釈できません: {version}")
+            return []
+
+        bounds, specs = self._compile(name)
+        public = Version(installed.public)
+        i = bisect_left(bounds, public)
+        if i < len(bounds) and bounds[i] == public:
+            candidates = entry["points"][i]
+        else:
+            candidates = entry["gaps"][i]
+        if entry["complex"]:
+            candidates = sorted(set(candidates).union(entry["complex"]))
+
+        # 候補だけをSpecifierSetで厳密に判定する
+        return [entry["advisories"][number] for number in candidates
+                if any(spec.contains(installed, prereleases=True) for spec in specs[number])]
+
+
+def load_or_build(safety_db, path="safety_db_index.json"):
+    """保存済みの索引が最新なら読み込み、そうでなければ作成して保存"""
+    source = VulnerabilityIndex.fingerprint(safety_db)
+    index = VulnerabilityIndex.load(path, source)
+    if index is not None:
+        logger.info(f"脆弱性データベースの索引を読み込みました: {path}")
+        return index
+
+    index = VulnerabilityIndex.build(safety_db)
+    try:
+        index.save(path)
+        logger.info(f"脆弱性データベースの索引を作成しました: {path}")
+    except OSError as e:
+        logger.warning(f"脆弱性データベースの索引の保存に失敗しました: {e}")
+    return index
+
+
+# 判定の確認用データ（バージョン指定, バージョン, 期待値）
+SELF_TEST_CORPUS = [
+    ("<1.2.3", "1.2.2", True),
+    ("<1.2.3", "1.2.3", False),
+    ("<9.0", "10.0", False),
+    (">=10.0", "9.0", False),
+    (">=10.0", "10.0", True),
+    ("<=2.0", "2.0", True),
+    ("<=2.0", "2.0+local", True),
+    ("<=2.0", "2.0.post1", False),
+    (">2.0", "2.0.post1", False),
+    (">2.0", "2.0.1", True),
+    ("<2.0", "2.0rc1", False),
+    ("<2.0", "1.9rc1", True),
+    ("==1.5", "1.5.0", True),
+    ("==1.5", "1.5+abc", True),
+    ("==1.4.*", "1.4.9", True),
+    ("==1.4.*", "1.5", False),
+    ("~=1.4.2", "1.4.9", True),
+    ("~=1.4.2", "1.5.0", False),
+    ("~=1.4.2", "1.4.1", False),
+    (">=1.0,!=1.5,<2.0", "1.5", False),
+    (">=1.0,!=1.5,<2.0", "1.6", True),
+    (">=2.0,<2.1.1", "2.1.0", True),
+    (">=2.0,<2.1.1", "2.1.1", False),
+    ("===1.0-legacy", "1.0", False),
+]
+
+
+def self_test(packages=2000, advisories_per_package=20, queries=20000):
+    """判定の正しさ（SpecifierSetとの一致）と速度を確認"""
+    failures = 0
+    safety_db = {f"pkg{i}": [{"id": str(i), "specs": [spec]}] for i, (spec, _, _) in enumerate(SELF_TEST_CORPUS)}
+    index = VulnerabilityIndex.build(safety_db)
+    for i, (spec, version, expected) in enumerate(SELF_TEST_CORPUS):
+        actual = bool(index.affected(f"pkg{i}", version))
+        if actual != expected:
+            failures += 1
+            print(f"NG: {version} in {spec}: 期待値 {expected}, 結果 {actual}")
+
+    # 乱数で作成したデータベースでSpecifierSetの総当たりと比較し、速度を測定
+    rng = random.Random(0)
+    def random_version():
+        return ".".join(str(rng.randint(0, 12)) for _ in range(rng.randint(1, 3)))
+    safety_db = {}
+    for i in range(packages):
+        entries = []
+        for j in range(advisories_per_package):
+            low, high = sorted((random_version(), random_version()), key=Version)
+            spec = rng.choice([f"<{high}", f">={low},<{high}", f"=={low}", f">{low},<={high}", f"~={low}.0"])
+            entries.append({"id": f"{i}-{j}", "specs": [spec]})
+        safety_db[f"package-{i}"] = entries
+
+    start = time.perf_counter()
+    index = VulnerabilityIndex.build(safety_db)
+    build_time = time.perf_counter() - start
+
+    names = [rng.choice(list(safety_db)) for _ in range(queries)]
+    versions = [random_version() for _ in range(queries)]
+    for name in set(names):
+        index._compile(name)
+    start = time.perf_counter()
+    results = [index.affected(name, version) for name, version in zip(names, versions)]
+    query_time = time.perf_counter() - start
+
+    for name, version, result in zip(names, versions, results):
+        expected = {entry["id"] for entry in safety_db[name]
+                    if SpecifierSet(entry["specs"][0]).contains(version, prereleases=True)}
+        if {advisory["id"] for advisory in result} != expected:
+            failures += 1
+            print(f"NG: {name}=={version}")
+
+    print(f"索引の作成: {packages * advisories_per_package}件のアドバイザリを{build_time:.2f}秒")
+    print(f"判定: {queries}件を{query_time:.2f}秒 ({query_time / queries * 1e6:.1f}マイクロ秒/件)")
+    print("結果: " + ("OK" if failures == 0 else f"{failures}件の不一致"))
+    return failures == 0
+
+
+def main(argv=None):
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description="脆弱性データベースの索引を操作します")
+    parser.add_argument("--self-test", action="store_true", help="判定の正しさと速度を確認する")
+    parser.add_argument("--build", metavar="SAFETY_DB_JSON", help="Safety DBのJSONから索引を作成する")
+    parser.add_argument("--output", default="safety_db_index.json", help="索引の保存先")
+    args = parser.parse_args(argv)
+
+    if args.self_test:
+        return self_test()
+    if args.build:
+        with open(args.build, "r", encoding="utf-8") as f:
+            safety_db = json.load(f)
+        VulnerabilityIndex.build(safety_db).save(args.output)
+        print(f"索引を作成しました: {args.output}")
+        return True
+    parser.print_help()
+    return True
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(0 if main() else 1)
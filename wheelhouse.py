@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+オフラインインストール用のwheelhouse
+requirements.txt で固定したバージョンのwheelを1つのフォルダ（wheelhouse）にまとめてダウンロードし、
+配布先のプラットフォームごとにハッシュ付きのrequirements（wheelhouse/requirements-<プラットフォーム>.txt）を
+作成します。インストール時はこのPCで使えるものを選びます。
+作成したwheelhouseを各PCにコピーすれば、インターネットに接続せずに数秒でインストールできます
+（pipはwheelhouse以外を参照せず、すべてのファイルをハッシュで照合します）。
+
+    # インターネットに接続できるPCでwheelhouseを作成する（配布先がWindowsの64bit版Python 3.11の場合）
+    python wheelhouse.py build --platform win_amd64 --python-version 3.11
+    # 各PCでwheelhouseからインストールする
+    python wheelhouse.py install
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from environment_probe import parse_requirements
+
+logger = logging.getLogger(__name__)
+
+WHEELHOUSE_DIR = "wheelhouse"
+REQUIREMENTS_PATH = "requirements.txt"
+LOCK_NAME = "requirements-{platform}.txt"
+MANIFEST_NAME = "manifest.json"
+# 同時に実行する pip download の数
+MAX_WORKERS = 4
+
+
+def canonical_name(name):
+    """パッケージ名の正規化（PEP 503）"""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def wheel_name_version(filename):
+    """wheelのファイル名から (正規化したパッケージ名, バージョン)"""
+    parts = filename[:-len(".whl")].split("-")
+    return canonical_name(parts[0]), parts[1]
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def requirements_hash(path=REQUIREMENTS_PATH):
+    try:
+        return file_sha256(path)
+    except OSError:
+        return None
+
+
+def _target_options(platform_tag=None, python_version=None):
+    """配布先の環境を指定する pip download のオプション"""
+    options = ["--only-binary=:all:"]
+    if platform_tag:
+        options += ["--platform", platform_tag, "--implementation", "cp"]
+    if python_version:
+        options += ["--python-version", python_version]
+    return options
+
+
+def _pip(args, python=None):
+    command = [python or sys.executable, "-m", "pip", *args]
+    result = subprocess.run(command, check=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            text=True, encoding="utf-8", errors="replace")
+    return result.returncode == 0, (result.stderr or result.stdout).strip()
+
+
+def _pinned(requirements):
+    """バージョンを == で固定した要件（固定されていないものはエラー）"""
+    pinned = []
+    for name, specifier in requirements:
+        specifier = specifier.split(";", 1)[0].strip()
+        if not specifier.startswith("==") or "," in specifier or "*" in specifier:
+            raise ValueError(f"{name}のバージョンが固定されていません（{specifier or '指定なし'}）")
+        pinned.append((name, specifier[2:].strip()))
+    return pinned
+
+
+def build(requirements_path=REQUIREMENTS_PATH, directory=WHEELHOUSE_DIR, platforms=(None,),
+          python_version=None, max_workers=MAX_WORKERS):
+    """wheelhouseを作成
+
+    以前に作成したwheelを削除してから、各パッケージを依存関係なしで並列にダウンロードし、
+    requirements.txt の依存関係を解決して足りないもの（書かれていない依存パッケージ）を補います。
+    最後にインデックスに接続せず（--no-index）wheelhouseだけで依存関係を解決できるか確認し、
+    そのときに選ばれたwheelだけでプラットフォームごとのロックを作成します
+    （プラットフォームによって必要なパッケージやバージョンが異なるため）。
+    なお pip download は依存関係の環境マーカー（sys_platform など）を作成するPCの環境で判定するため、
+    マーカーで指定された依存パッケージを含めるには、配布先と同じOSで作成してください。
+    """
+    start = time.perf_counter()
+    try:
+        requirements = _pinned(parse_requirements(requirements_path))
+    except ValueError as e:
+        logger.error(f"wheelhouseを作成できません: {e}")
+        return False
+    if not requirements:
+        logger.error(f"{requirements_path}にパッケージがありません")
+        return False
+    os.makedirs(directory, exist_ok=True)
+    # バージョンを上げる前のwheelが残っていると、ロックに古いバージョンも書き込まれてしまう
+    removed = clear_wheels(directory)
+    if removed:
+        logger.info(f"以前に作成したwheelを{removed}個削除しました")
+    platforms = list(platforms) or [None]
+
+    def download(job):
+        (name, version), platform_tag = job
+        ok, message = _pip(["download", "--no-deps", "--disable-pip-version-check", "-d", directory,
+                            *_target_options(platform_tag, python_version), f"{name}=={version}"])
+        if not ok:
+            logger.error(f"{name}=={version}のダウンロードに失敗しました（{platform_tag or 'この環境'}）: {message}")
+        return ok
+
+    jobs = [(requirement, platform_tag) for platform_tag in platforms for requirement in requirements]
+    logger.info(f"{len(jobs)}個のパッケージをダウンロードしています（並列数 {max_workers}）...")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        if not all(list(executor.map(download, jobs))):
+            return False
+
+    locks = {}
+    files = {}
+    for platform_tag in platforms:
+        label = platform_tag or "native"
+        # requirements.txt に書かれていない依存パッケージがあれば、ここでダウンロードされる
+        ok, message = _pip(["download", "--disable-pip-version-check", "-d", directory, "--find-links", directory,
+                            *_target_options(platform_tag, python_version), "-r", requirements_path])
+        if not ok:
+            logger.error(f"依存関係を解決できませんでした（{label}）: {message}")
+            return False
+        # インデックスに接続せず、wheelhouseだけで揃っているかの確認。空のフォルダにコピーさせると、
+        # このプラットフォームで選ばれたwheelの一覧がわかる
+        with tempfile.TemporaryDirectory() as selected:
+            ok, message = _pip(["download", "--no-index", "--disable-pip-version-check", "-d", selected,
+                                "--find-links", directory, *_target_options(platform_tag, python_version),
+                                "-r", requirements_path])
+            if not ok:
+                logger.error(f"wheelhouseだけでは依存関係を解決できません（{label}）: {message}")
+                return False
+            wheels = sorted(filename for filename in os.listdir(selected) if filename.endswith(".whl"))
+        locks[label] = LOCK_NAME.format(platform=label)
+        files.update(write_lock(requirements, directory, wheels, locks[label]))
+
+    manifest = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "requirements_sha256": requirements_hash(requirements_path),
+        "platforms": list(locks),
+        "python_version": python_version,
+        "locks": locks,
+        "files": files,
+    }
+    with open(os.path.join(directory, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    logger.info(f"wheelhouseを作成しました: {directory}（{len(files)}ファイル、"
+                f"{time.perf_counter() - start:.1f}秒）")
+    return True
+
+
+def clear_wheels(directory=WHEELHOUSE_DIR):
+    """wheelhouseのwheel・ロック・マニフェストを削除し、削除したwheelの数を返す"""
+    removed = 0
+    for filename in os.listdir(directory):
+        # requirements.txt は以前の形式のロック
+        if (filename.endswith(".whl") or filename in ("requirements.txt", MANIFEST_NAME)
+                or (filename.startswith("requirements-") and filename.endswith(".txt"))):
+            os.remove(os.path.join(directory, filename))
+            removed += filename.endswith(".whl")
+    return removed
+
+
+def write_lock(requirements, directory, filenames, lock_name):
+    """filenames のwheelのハッシュを付けたrequirementsを作成し、{ファイル名: ハッシュ} を返す"""
+    wheels = {}
+    hashes = {}
+    for filename in filenames:
+        digest = file_sha256(os.path.join(directory, filename))
+        hashes[filename] = digest
+        wheels.setdefault(wheel_name_version(filename), []).append(digest)
+
+    lines = ["# wheelhouse.py build で作成（このフォルダのwheelだけでインストールします）"]
+    written = set()
+    for name, version in requirements:
+        key = (canonical_name(name), version)
+        lines.append(_lock_line(name, version, wheels.get(key, [])))
+        written.add(key)
+    # requirements.txt に書かれていない依存パッケージ
+    for (name, version), digests in sorted(wheels.items()):
+        if (name, version) not in written:
+            lines.append(_lock_line(name, version, digests))
+    with open(os.path.join(directory, lock_name), "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return hashes
+
+
+def _lock_line(name, version, digests):
+    return " \\\n    ".join([f"{name}=={version}"] + [f"--hash=sha256:{digest}" for digest in sorted(set(digests))])
+
+
+def _manifest(directory=WHEELHOUSE_DIR):
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def status(directory=WHEELHOUSE_DIR, requirements_path=REQUIREMENTS_PATH):
+    """wheelhouseの状態: "missing"（ない）・"stale"（requirements.txt が変わった）・"ready"（使える）"""
+    manifest = _manifest(directory)
+    if manifest is None:
+        return "missing"
+    # プラットフォームごとのロックがない以前の形式も作り直す
+    locks = manifest.get("locks")
+    if not locks or manifest.get("requirements_sha256") != requirements_hash(requirements_path):
+        return "stale"
+    if not all(os.path.exists(os.path.join(directory, lock)) for lock in locks.values()):
+        return "missing"
+    return "ready"
+
+
+def select_lock(directory=WHEELHOUSE_DIR, python=None):
+    """このPC（python）にインストールできるロックのパス（ない場合はNone）
+
+    プラットフォームが1つならそのロックを、複数ならpipの --dry-run で解決できた最初のロックを使います。
+    """
+    locks = list(_manifest(directory)["locks"].values())
+    if len(locks) == 1:
+        return os.path.join(directory, locks[0])
+    for lock in locks:
+        path = os.path.join(directory, lock)
+        ok, _ = _pip(["install", "--dry-run", "--no-index", "--find-links", directory, "--require-hashes",
+                      "--disable-pip-version-check", "-r", path], python)
+        if ok:
+            return path
+    return None
+
+
+def available(directory=WHEELHOUSE_DIR, requirements_path=REQUIREMENTS_PATH):
+    """今の requirements.txt で使えるwheelhouseがあるか"""
+    state = status(directory, requirements_path)
+    if state == "stale":
+        logger.warning(f"{directory}は requirements.txt の変更前に作成されたため使用しません"
+                       "（python wheelhouse.py build で作り直してください）")
+    return state == "ready"
+
+
+def install(directory=WHEELHOUSE_DIR, python=None, requirements_path=REQUIREMENTS_PATH):
+    """wheelhouseだけを使ってインストール（インデックスには接続しない）"""
+    if not available(directory, requirements_path):
+        logger.error(f"使用できるwheelhouseがありません: {directory}")
+        return False
+    start = time.perf_counter()
+    lock = select_lock(directory, python)
+    if lock is None:
+        logger.error(f"{directory}にはこのPC用のwheelがありません（配布先のプラットフォームを指定して作り直してください）")
+        return False
+    ok, message = _pip(["install", "--no-index", "--find-links", directory, "--require-hashes",
+                        "--disable-pip-version-check", "-r", lock], python)
+    if not ok:
+        logger.error(f"wheelhouseからのインストールに失敗しました: {message}")
+        return False
+    logger.info(f"wheelhouseからインストールしました（{time.perf_counter() - start:.1f}秒）")
+    return True
+
+
+def main(argv=None):
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description="オフラインインストール用のwheelhouseを作成・使用します")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="wheelhouseを作成する（インターネット接続が必要）")
+    build_parser.add_argument("--platform", action="append", dest="platforms",
+                              help="配布先のプラットフォーム（例: win_amd64、manylinux2014_x86_64）。複数指定できます")
+    build_parser.add_argument("--python-version", help="配布先のPythonのバージョン（例: 3.11）")
+    build_parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="並列にダウンロードする数")
+    install_parser = subparsers.add_parser("install", help="wheelhouseからインストールする（オフライン）")
+    install_parser.add_argument("--python", help="インストール先のPython（既定はこのPython）")
+    for subparser in (build_parser, install_parser):
+        subparser.add_argument("--requirements", default=REQUIREMENTS_PATH, help="requirements.txt のパス")
+        subparser.add_argument("--directory", default=WHEELHOUSE_DIR, help="wheelhouseのフォルダ")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        return build(args.requirements, args.directory, args.platforms or [None], args.python_version, args.workers)
+    return install(args.directory, args.python, args.requirements)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,391 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+勤務時間の集計スクリプト
+打刻履歴（構造化ログまたはCSV）から日ごとの勤務時間・残業時間・遅刻・
+退勤打刻漏れを集計し、週次・月次の集計結果をCSVに出力します。
+numpyがインストールされていれば、集計をnumpyの配列演算で行います（数百万件でも1秒未満）。
+"""
+
+import sys
+import csv
+import json
+import logging
+import argparse
+from array import array
+from bisect import bisect_left
+from itertools import repeat
+from operator import rshift, and_
+from datetime import datetime, date
+
+try:
+    import numpy as np
+except ImportError:
+    # numpyがなければ標準ライブラリだけで集計する
+    np = None
+
+logger = logging.getLogger(__name__)
+
+CLOCK_IN = 0
+CLOCK_OUT = 1
+
+# 打刻を1つの整数に詰めるときのビット位置
+DAY_SHIFT = 40
+ACCOUNT_SHIFT = 17
+SECONDS_MASK = (1 << ACCOUNT_SHIFT) - 1
+ACCOUNT_MASK = (1 << (DAY_SHIFT - ACCOUNT_SHIFT)) - 1
+GROUP_DAY_SHIFT = DAY_SHIFT - ACCOUNT_SHIFT
+MISSING = SECONDS_MASK
+
+# 打刻履歴として扱うフェーズ名
+PUNCH_PHASES = {"clock_in": CLOCK_IN, "clock_out": CLOCK_OUT}
+
+DAILY_FIELDS = [
+    "account", "date", "clock_in", "clock_out", "worked_minutes",
+    "overtime_minutes", "late", "missing_clock_out"
+]
+ROLLUP_FIELDS = [
+    "account", "period", "days", "worked_minutes", "overtime_minutes",
+    "late_count", "missing_clock_out_count"
+]
+
+
+class PunchHistory:
+    """打刻履歴を整数の配列で保持するクラス
+
+    1件の打刻を (日付の序数 << 40 | アカウント番号 << 17 | 0時からの秒数) の
+    1つの整数に詰めて、出勤・退勤ごとの array に格納します。集計は整列済みの
+    列に対して一括処理します（numpyがあればnumpyの配列、なければmap/zip/dict）。
+    """
+
+    def __init__(self):
+        self.accounts = []
+        self._account_index = {}
+        self.clock_ins = array('q')
+        self.clock_outs = array('q')
+        self._sorted_ins = []
+        self._sorted_outs = []
+        self._sorted = False
+
+    def __len__(self):
+        return len(self.clock_ins) + len(self.clock_outs)
+
+    def add(self, account, timestamp, kind):
+        """打刻を1件追加"""
+        index = self._account_index.get(account)
+        if index is None:
+            index = len(self.accounts)
+            self._account_index[account] = index
+            self.accounts.append(account)
+        seconds = timestamp.hour * 3600 + timestamp.minute * 60 + timestamp.second
+        key = (timestamp.toordinal() << DAY_SHIFT) | (index << ACCOUNT_SHIFT) | seconds
+        (self.clock_ins if kind == CLOCK_IN else self.clock_outs).append(key)
+        self._sorted = False
+
+    def sorted_columns(self):
+        """日付順に整列した出勤・退勤の列を返す（numpyがあればnumpyの配列、結果はキャッシュする）"""
+        if not self._sorted:
+            if np is not None:
+                self._sorted_ins = np.array(self.clock_ins, dtype=np.int64)
+                self._sorted_outs = np.array(self.clock_outs, dtype=np.int64)
+                self._sorted_ins.sort()
+                self._sorted_outs.sort()
+            else:
+                self._sorted_ins = sorted(self.clock_ins)
+                self._sorted_outs = sorted(self.clock_outs)
+            self._sorted = True
+        return self._sorted_ins, self._sorted_outs
+
+
+def load_punch_log(path="web_dakoku.jsonl", history=None):
+    """構造化ログ（JSON Lines）から成功した打刻を読み込む"""
+    history = history if history is not None else PunchHistory()
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                # 打刻以外の行はJSONとして解釈する前に読み飛ばす
+                if '"phase"' not in line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                kind = PUNCH_PHASES.get(entry.get("phase"))
+                if kind is None or entry.get("result") != "success":
+                    continue
+                history.add(entry.get("account", ""), datetime.fromisoformat(entry["time"]), kind)
+    except OSError as e:
+        logger.error(f"打刻履歴の読み込みに失敗しました: {e}")
+    return history
+
+
+def load_punch_csv(path, history=None):
+    """CSV（account,timestamp,action）から打刻を読み込む"""
+    history = history if history is not None else PunchHistory()
+    try:
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                kind = PUNCH_PHASES.get(row.get("action", "").strip())
+                if kind is None:
+                    continue
+                history.add(row.get("account", ""), datetime.fromisoformat(row["timestamp"].strip()), kind)
+    except (OSError, KeyError, ValueError) as e:
+        logger.error(f"打刻CSVの読み込みに失敗しました: {e}")
+    return history
+
+
+def _parse_clock(value):
+    """"HH:MM" 形式を0時からの秒数に変換"""
+    hours, minutes = map(int, value.split(":"))
+    return hours * 3600 + minutes * 60
+
+
+def _format_clock(seconds):
+    """0時からの秒数を "HH:MM" 形式に変換（打刻がない場合は空文字）"""
+    if seconds == MISSING:
+        return ""
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}"
+
+
+def _slice_range(column, start_day, end_day):
+    """整列済みの列から日付範囲に含まれる部分を二分探索で取り出す"""
+    if np is not None:
+        lo = column.searchsorted(start_day << DAY_SHIFT) if start_day is not None else 0
+        hi = column.searchsorted((end_day + 1) << DAY_SHIFT) if end_day is not None else len(column)
+        return column[lo:hi]
+    lo = bisect_left(column, start_day << DAY_SHIFT) if start_day is not None else 0
+    hi = bisect_left(column, (end_day + 1) << DAY_SHIFT) if end_day is not None else len(column)
+    return column[lo:hi]
+
+
+class DailyTable:
+    """日次集計の結果を列ごとのリストで保持するクラス
+
+    groups は (日付の序数 << 23 | アカウント番号) の昇順です。各列はリスト（numpyがあればnumpyの配列）で、
+    打刻がない日の clock_ins・clock_outs は MISSING です。
+    CSV出力などで1行ずつ必要な場合は rows() を使用します。
+    """
+
+    def __init__(self, accounts, groups, clock_ins, clock_outs, worked, overtime, late, missing):
+        self.accounts = accounts
+        self.groups = groups
+        self.clock_ins = clock_ins
+        self.clock_outs = clock_outs
+        self.worked = worked
+        self.overtime = overtime
+        self.late = late
+        self.missing = missing
+
+    def __len__(self):
+        return len(self.groups)
+
+    def rows(self):
+        """1日1行の辞書を順に返す"""
+        day_names = {}
+        columns = (self.groups, self.clock_ins, self.clock_outs, self.worked, self.overtime, self.late, self.missing)
+        for group, clock_in, clock_out, worked, overtime, late, missing in zip(*map(_as_list, columns)):
+            day = group >> GROUP_DAY_SHIFT
+            day_name = day_names.get(day)
+            if day_name is None:
+                day_name = day_names[day] = date.fromordinal(day).isoformat()
+            yield {
+                "account": self.accounts[group & ACCOUNT_MASK],
+                "date": day_name,
+                "clock_in": _format_clock(clock_in),
+                "clock_out": _format_clock(clock_out),
+                "worked_minutes": worked,
+                "overtime_minutes": overtime,
+                "late": bool(late),
+                "missing_clock_out": bool(missing)
+            }
+
+
+def _as_list(column):
+    return column if isinstance(column, list) else column.tolist()
+
+
+def _first_of_groups(column, last=False):
+    """整列済みの打刻から (日付, アカウント) ごとの最初（last=Trueなら最後）の打刻の (グループ, 秒数)"""
+    groups = column >> ACCOUNT_SHIFT
+    if len(groups) == 0:
+        return groups, groups
+    changed = groups[1:] != groups[:-1]
+    boundary = np.append(changed, True) if last else np.insert(changed, 0, True)
+    return groups[boundary], column[boundary] & SECONDS_MASK
+
+
+def _compute_daily_numpy(ins, outs, overtime_threshold, late_seconds, break_minutes, break_after):
+    in_groups, in_values = _first_of_groups(ins)
+    out_groups, out_values = _first_of_groups(outs, last=True)
+    # どちらも整列済みなので、連結して安定ソート（マージになる）してから隣と比べて重複を除く
+    groups = np.concatenate((in_groups, out_groups))
+    groups.sort(kind="stable")
+    if len(groups):
+        groups = groups[np.insert(groups[1:] != groups[:-1], 0, True)]
+    in_seconds = np.full(len(groups), MISSING, dtype=np.int64)
+    in_seconds[groups.searchsorted(in_groups)] = in_values
+    out_seconds = np.full(len(groups), MISSING, dtype=np.int64)
+    out_seconds[groups.searchsorted(out_groups)] = out_values
+
+    has_in = in_seconds != MISSING
+    missing = has_in & ((out_seconds == MISSING) | (out_seconds < in_seconds))
+    spans = np.where(missing | ~has_in, 0, (out_seconds - in_seconds) // 60)
+    worked = np.where(spans >= break_after, spans - break_minutes, spans)
+    overtime = np.maximum(worked - overtime_threshold, 0)
+    late = has_in & (in_seconds > late_seconds)
+    return groups, in_seconds, out_seconds, worked, overtime, late, missing
+
+
+def compute_daily(history, start=None, end=None, overtime_threshold=480,
+                  late_after="09:30", break_minutes=60, break_after=360):
+    """日ごとの勤務時間を集計してDailyTableを返す
+
+    overtime_threshold: 1日の所定労働時間（分）。これを超えた分を残業とする
+    late_after: この時刻より後の出勤打刻を遅刻とする
+    break_minutes: 拘束時間が break_after 分以上の日に差し引く休憩時間（分）
+    """
+    clock_ins, clock_outs = history.sorted_columns()
+    start_day = start.toordinal() if start else None
+    end_day = end.toordinal() if end else None
+    ins = _slice_range(clock_ins, start_day, end_day)
+    outs = _slice_range(clock_outs, start_day, end_day)
+    late_seconds = _parse_clock(late_after)
+    if np is not None:
+        return DailyTable(history.accounts, *_compute_daily_numpy(
+            ins, outs, overtime_threshold, late_seconds, break_minutes, break_after))
+
+    # (日付, アカウント) ごとに最初の出勤と最後の退勤を求める。
+    # 出勤は降順に書き込んで最小値、退勤は昇順に書き込んで最大値を残す
+    first_in = dict(zip(map(rshift, reversed(ins), repeat(ACCOUNT_SHIFT)), reversed(ins)))
+    last_out = dict(zip(map(rshift, outs, repeat(ACCOUNT_SHIFT)), outs))
+    groups = sorted(first_in.keys() | last_out.keys())
+
+    # 打刻がない場合は MISSING（1日の秒数より大きい値）になる
+    in_seconds = list(map(and_, map(first_in.get, groups, repeat(MISSING)), repeat(SECONDS_MASK)))
+    out_seconds = list(map(and_, map(last_out.get, groups, repeat(MISSING)), repeat(SECONDS_MASK)))
+
+    missing = [i != MISSING and (o == MISSING or o < i) for i, o in zip(in_seconds, out_seconds)]
+    spans = [0 if m or i == MISSING else (o - i) // 60
+             for i, o, m in zip(in_seconds, out_seconds, missing)]
+    worked = [span - break_minutes if span >= break_after else span for span in spans]
+    overtime = [w - overtime_threshold if w > overtime_threshold else 0 for w in worked]
+    late = [late_seconds < i != MISSING for i in in_seconds]
+    return DailyTable(history.accounts, groups, in_seconds, out_seconds, worked, overtime, late, missing)
+
+
+def _rollup_numpy(table, period_of_day):
+    """_rollup のnumpy版（(アカウント, 期間) の番号を作り、bincountで合計する）"""
+    groups = table.groups
+    days, day_index = np.unique(groups >> GROUP_DAY_SHIFT, return_inverse=True)
+    day_periods = [period_of_day(date.fromordinal(day)) for day in days.tolist()]
+    periods = sorted(set(day_periods))
+    period_ids = {period: number for number, period in enumerate(periods)}
+    # アカウント名の順位と期間の番号から作るキーの順が、そのまま結果の並び順になる
+    names = sorted(range(len(table.accounts)), key=table.accounts.__getitem__)
+    rank = np.empty(len(names), dtype=np.int64)
+    rank[names] = np.arange(len(names))
+    period_of_row = np.array([period_ids[period] for period in day_periods], dtype=np.int64)[day_index]
+    keys, inverse, counts = np.unique(rank[groups & ACCOUNT_MASK] * len(periods) + period_of_row,
+                                      return_inverse=True, return_counts=True)
+    totals = [np.bincount(inverse, weights=column, minlength=len(keys)).astype(np.int64).tolist()
+              for column in (table.worked, table.overtime, table.late, table.missing)]
+
+    accounts = map(list(map(table.accounts.__getitem__, names)).__getitem__, (keys // len(periods)).tolist())
+    period_names = map(periods.__getitem__, (keys % len(periods)).tolist())
+    return [{"account": account, "period": period, "days": days, "worked_minutes": worked,
+             "overtime_minutes": overtime, "late_count": late, "missing_clock_out_count": missing}
+            for account, period, days, worked, overtime, late, missing
+            in zip(accounts, period_names, counts.tolist(), *totals)]
+
+
+def _rollup(table, period_of_day):
+    """日次集計を (アカウント, 期間) ごとにまとめる"""
+    if np is not None:
+        return _rollup_numpy(table, period_of_day)
+    period_names = {}
+    totals = {}
+    for group, worked, overtime, late, missing in zip(
+            table.groups, table.worked, table.overtime, table.late, table.missing):
+        day = group >> GROUP_DAY_SHIFT
+        period = period_names.get(day)
+        if period is None:
+            period = period_names[day] = period_of_day(date.fromordinal(day))
+        key = (group & ACCOUNT_MASK, period)
+        total = totals.get(key)
+        if total is None:
+            totals[key] = [1, worked, overtime, int(late), int(missing)]
+        else:
+            total[0] += 1
+            total[1] += worked
+            total[2] += overtime
+            total[3] += late
+            total[4] += missing
+
+    rows = []
+    for (account_id, period), (days, worked, overtime, late, missing) in totals.items():
+        rows.append({
+            "account": table.accounts[account_id], "period": period, "days": days,
+            "worked_minutes": worked, "overtime_minutes": overtime,
+            "late_count": late, "missing_clock_out_count": missing
+        })
+    rows.sort(key=lambda row: (row["account"], row["period"]))
+    return rows
+
+
+def weekly_rollup(table):
+    """ISO週ごとの集計"""
+    def week_of(day):
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    return _rollup(table, week_of)
+
+
+def monthly_rollup(table):
+    """月ごとの集計"""
+    return _rollup(table, lambda day: f"{day.year}-{day.month:02d}")
+
+
+def export_csv(rows, filename, fields):
+    """集計結果をCSVとして保存"""
+    try:
+        with open(filename, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(rows)
+        logger.info(f"集計結果を保存しました: {filename}")
+        return True
+    except Exception as e:
+        logger.error(f"集計結果の保存に失敗しました: {e}")
+        return False
+
+
+def main(argv=None):
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description="打刻履歴から勤務時間を集計します")
+    parser.add_argument("--log", default="web_dakoku.jsonl", help="構造化ログファイル")
+    parser.add_argument("--csv", action="append", default=[], help="追加で読み込む打刻CSV")
+    parser.add_argument("--from", dest="start", type=date.fromisoformat, help="集計開始日 (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="end", type=date.fromisoformat, help="集計終了日 (YYYY-MM-DD)")
+    parser.add_argument("--threshold", type=int, default=480, help="所定労働時間（分）")
+    parser.add_argument("--late-after", default="09:30", help="遅刻とする出勤時刻 (HH:MM)")
+    parser.add_argument("--break-minutes", type=int, default=60, help="休憩時間（分）")
+    parser.add_argument("--period", choices=["daily", "weekly", "monthly"], default="monthly")
+    parser.add_argument("--output", default="work_hours.csv", help="出力CSVファイル")
+    args = parser.parse_args(argv)
+
+    history = load_punch_log(args.log)
+    for path in args.csv:
+        load_punch_csv(path, history)
+    logger.info(f"{len(history)}件の打刻を読み込みました")
+
+    daily = compute_daily(history, args.start, args.end, args.threshold,
+                          args.late_after, args.break_minutes)
+    if args.period == "daily":
+        return export_csv(daily.rows(), args.output, DAILY_FIELDS)
+    rows = weekly_rollup(daily) if args.period == "weekly" else monthly_rollup(daily)
+    return export_csv(rows, args.output, ROLLUP_FIELDS)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(0 if main() else 1)
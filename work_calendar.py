@@ -0,0 +1,341 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+休日カレンダー
+週末・国民の祝日（振替休日・国民の休日を含む）・会社の休日・個人の休暇を、
+年ごとのビット列（1年の何日目かをビットの位置とした整数）にまとめます。
+打刻ルールのスケジュールはこのビット列で休日を飛ばすため、休日には確認ダイアログも
+自動打刻も行われません。
+
+国民の祝日は「国民の祝日に関する法律」に従ってこのPCで計算します（2000〜2099年）。
+会社の休日や休暇は ICS（カレンダーの書き出し）か CSV から読み込みます:
+
+    date,end,type,name
+    2024-08-13,2024-08-16,holiday,夏季休業
+    2024-09-02,,leave,有給休暇
+    2024-11-09,,workday,出勤日（土曜）
+
+type は holiday（休日）・leave（休暇）・workday（休日でも出勤する日）で、省略時は holiday です。
+"""
+
+import os
+import sys
+import csv
+import json
+import logging
+import argparse
+from datetime import date, datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+FIRST_YEAR = 2000
+LAST_YEAR = 2099
+WEEKEND = (5, 6)
+OFF_TYPES = ("holiday", "leave")
+WORKDAY = "workday"
+WEEKDAY_NAMES = "月火水木金土日"
+
+
+def _nth_monday(year, month, nth):
+    first = date(year, month, 1)
+    return first + timedelta(days=(7 - first.weekday()) % 7 + 7 * (nth - 1))
+
+
+def _equinox_day(year, base):
+    """春分・秋分の日（1980〜2099年の近似式）"""
+    return int(base + 0.242194 * (year - 1980) - (year - 1980) // 4)
+
+
+def national_holidays(year):
+    """国民の祝日・国民の休日・振替休日 {日付: 名前}"""
+    if not FIRST_YEAR <= year <= LAST_YEAR:
+        raise ValueError(f"国民の祝日は{FIRST_YEAR}〜{LAST_YEAR}年に対応しています: {year}")
+    holidays = {
+        date(year, 1, 1): "元日",
+        _nth_monday(year, 1, 2): "成人の日",
+        date(year, 2, 11): "建国記念の日",
+        date(year, 3, _equinox_day(year, 20.8431)): "春分の日",
+        date(year, 5, 3): "憲法記念日",
+        date(year, 5, 5): "こどもの日",
+        _nth_monday(year, 9, 3) if year >= 2003 else date(year, 9, 15): "敬老の日",
+        date(year, 9, _equinox_day(year, 23.2488)): "秋分の日",
+        date(year, 11, 3): "文化の日",
+        date(year, 11, 23): "勤労感謝の日",
+    }
+    if year >= 2020:
+        holidays[date(year, 2, 23)] = "天皇誕生日"
+    elif year <= 2018:
+        holidays[date(year, 12, 23)] = "天皇誕生日"
+    if year >= 2007:
+        holidays[date(year, 4, 29)] = "昭和の日"
+        holidays[date(year, 5, 4)] = "みどりの日"
+    else:
+        holidays[date(year, 4, 29)] = "みどりの日"
+
+    # 東京オリンピック・パラリンピックの年は海の日・山の日・スポーツの日が移動した
+    special = {
+        2020: {"海の日": date(2020, 7, 23), "スポーツの日": date(2020, 7, 24), "山の日": date(2020, 8, 10)},
+        2021: {"海の日": date(2021, 7, 22), "スポーツの日": date(2021, 7, 23), "山の日": date(2021, 8, 8)},
+    }.get(year, {})
+    holidays[special.get("海の日") or (_nth_monday(year, 7, 3) if year >= 2003 else date(year, 7, 20))] = "海の日"
+    if year >= 2016:
+        holidays[special.get("山の日") or date(year, 8, 11)] = "山の日"
+    holidays[special.get("スポーツの日") or _nth_monday(year, 10, 2)] = "スポーツの日" if year >= 2020 else "体育の日"
+    if year == 2019:
+        holidays[date(2019, 5, 1)] = "天皇の即位の日"
+        holidays[date(2019, 10, 22)] = "即位礼正殿の儀の行われる日"
+
+    # 国民の休日（祝日に挟まれた平日）
+    for day in sorted(holidays):
+        between = day + timedelta(days=1)
+        if between not in holidays and between + timedelta(days=1) in holidays and between.weekday() != 6:
+            holidays[between] = "国民の休日"
+
+    # 振替休日（日曜日の祝日の後の、最初の祝日でない日。2006年までは翌日の月曜日のみ）
+    for day in sorted(holidays):
+        if day.weekday() != 6 or holidays[day] == "国民の休日":
+            continue
+        substitute = day + timedelta(days=1)
+        if year >= 2007:
+            while substitute in holidays:
+                substitute += timedelta(days=1)
+        if substitute not in holidays and substitute.year == year:
+            holidays[substitute] = "振替休日"
+    return holidays
+
+
+def _parse_date(text):
+    text = text.strip()
+    if "T" in text:
+        text = text.split("T", 1)[0]
+    return date.fromisoformat(text) if "-" in text else datetime.strptime(text, "%Y%m%d").date()
+
+
+def _date_range(start, end):
+    """start から end まで（end を含む）の日付"""
+    day = start
+    while day <= end:
+        yield day
+        day += timedelta(days=1)
+
+
+def read_ics(path):
+    """ICSファイルの終日・複数日の予定を [(日付, "holiday", 名前)] として読み込む
+
+    繰り返しの予定（RRULE）は最初の1回だけを使います。
+    """
+    with open(path, "r", encoding="utf-8-sig") as f:
+        lines = []
+        for line in f.read().splitlines():
+            # 折り返された行を元に戻す
+            if line[:1] in (" ", "\t") and lines:
+                lines[-1] += line[1:]
+            else:
+                lines.append(line)
+
+    entries = []
+    event = None
+    for line in lines:
+        name, _, value = line.partition(":")
+        key = name.split(";", 1)[0].upper()
+        if key == "BEGIN" and value.upper() == "VEVENT":
+            event = {}
+        elif key == "END" and value.upper() == "VEVENT" and event is not None:
+            if "DTSTART" not in event:
+                logger.warning(f"開始日のない予定を無視します: {event.get('SUMMARY', '')}")
+            else:
+                if "RRULE" in event:
+                    logger.warning(f"繰り返しの予定は最初の1回だけを使います: {event.get('SUMMARY', '')}")
+                try:
+                    start = _parse_date(event["DTSTART"])
+                    end = start
+                    if "DTEND" in event:
+                        # 終了日時は含まない（終日の予定なら翌日、0時ちょうどに終わる予定ならその日）
+                        raw_end = event["DTEND"].strip()
+                        end = _parse_date(raw_end)
+                        if "T" not in raw_end or raw_end.split("T", 1)[1].startswith("000000"):
+                            end -= timedelta(days=1)
+                        end = max(start, end)
+                except ValueError as e:
+                    logger.warning(f"日付の形式が正しくない予定を無視します: {event.get('SUMMARY', '')}（{e}）")
+                else:
+                    entries += [(day, "holiday", event.get("SUMMARY", "休日")) for day in _date_range(start, end)]
+            event = None
+        elif event is not None and key in ("DTSTART", "DTEND", "SUMMARY", "RRULE"):
+            event[key] = value
+    return entries
+
+
+def read_csv(path):
+    """CSVファイル（date,end,type,name）を [(日付, 種類, 名前)] として読み込む"""
+    entries = []
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        for number, row in enumerate(csv.DictReader(f), start=2):
+            try:
+                start = _parse_date(row["date"])
+                end = _parse_date(row["end"]) if row.get("end") else start
+                kind = (row.get("type") or "holiday").strip().lower()
+                if kind not in OFF_TYPES and kind != WORKDAY:
+                    raise ValueError(f"type は holiday・leave・workday のいずれかです: {kind}")
+            except (KeyError, ValueError, AttributeError) as e:
+                logger.warning(f"{path}の{number}行目を無視します: {e}")
+                continue
+            name = (row.get("name") or "").strip() or {"leave": "休暇", WORKDAY: "出勤日"}.get(kind, "休日")
+            entries += [(day, kind, name) for day in _date_range(start, end)]
+    return entries
+
+
+def read_calendar_file(path):
+    """ICS・CSVファイルの読み込み"""
+    if str(path).lower().endswith(".ics"):
+        return read_ics(path)
+    return read_csv(path)
+
+
+class WorkCalendar:
+    """休日カレンダー（年ごとの休日のビット列）"""
+
+    def __init__(self, files=(), weekend=WEEKEND, national=True):
+        self.files = [str(path) for path in files]
+        self.weekend = tuple(weekend)
+        self.national = national
+        self._file_keys = None
+        self._entries = []
+        self._years = {}
+        self._names = {}
+        self.refresh()
+
+    def _stat_key(self):
+        keys = []
+        for path in self.files:
+            try:
+                stat = os.stat(path)
+                keys.append((path, stat.st_size, stat.st_mtime_ns))
+            except OSError:
+                keys.append((path, None, None))
+        return keys
+
+    def refresh(self):
+        """読み込むファイルが変わっていたら読み込み直す（変わっていればTrue）"""
+        keys = self._stat_key()
+        if keys == self._file_keys:
+            return False
+        self._file_keys = keys
+        entries = []
+        for path, size, _ in keys:
+            if size is None:
+                logger.warning(f"休日カレンダーのファイルが見つかりません: {path}")
+                continue
+            try:
+                entries += read_calendar_file(path)
+            except (OSError, UnicodeDecodeError) as e:
+                logger.warning(f"休日カレンダーのファイルを読み込めませんでした: {path}（{e}）")
+        self._entries = entries
+        self._years = {}
+        self._names = {}
+        return True
+
+    def _build_year(self, year):
+        """その年の休日のビット列（1月1日が0ビット目）と休日の名前"""
+        first = date(year, 1, 1)
+        days = (date(year + 1, 1, 1) - first).days
+        bits = 0
+        names = {}
+        for offset in range(days):
+            if (first + timedelta(days=offset)).weekday() in self.weekend:
+                bits |= 1 << offset
+        if self.national:
+            try:
+                for day, name in national_holidays(year).items():
+                    bits |= 1 << (day - first).days
+                    names[day] = name
+            except ValueError as e:
+                logger.warning(str(e))
+        # 出勤日は休日の後に反映する（休日の指定より優先する）
+        for day, kind, name in sorted(self._entries, key=lambda entry: entry[1] == WORKDAY):
+            if day.year != year:
+                continue
+            if kind == WORKDAY:
+                bits &= ~(1 << (day - first).days)
+            else:
+                bits |= 1 << (day - first).days
+            names[day] = name
+        self._years[year] = bits
+        self._names[year] = names
+        return bits
+
+    def year_bits(self, year):
+        bits = self._years.get(year)
+        if bits is None:
+            bits = self._build_year(year)
+        return bits
+
+    def is_off_day(self, day):
+        """休日か"""
+        if isinstance(day, datetime):
+            day = day.date()
+        return bool(self.year_bits(day.year) >> (day - date(day.year, 1, 1)).days & 1)
+
+    def day_name(self, day):
+        """祝日・休日・休暇の名前（週末や平日は空文字）"""
+        self.year_bits(day.year)
+        return self._names[day.year].get(day, "")
+
+    def next_work_day(self, day, limit=366):
+        """その日以降で最初の出勤日（limit日以内になければNone）"""
+        for _ in range(limit):
+            if not self.is_off_day(day):
+                return day
+            day += timedelta(days=1)
+        return None
+
+    def off_days(self, year):
+        """その年の休日の一覧"""
+        bits = self.year_bits(year)
+        first = date(year, 1, 1)
+        return [first + timedelta(days=offset) for offset in range(bits.bit_length()) if bits >> offset & 1]
+
+
+def calendar_from_config(config):
+    """設定（advanced.calendar）から休日カレンダーを作成
+
+    {"weekend": [5, 6], "national_holidays": true, "files": ["holidays.ics", "leave.csv"]}
+    """
+    settings = config.get("advanced", {}).get("calendar", {})
+    return WorkCalendar(settings.get("files", []), settings.get("weekend", WEEKEND),
+                        settings.get("national_holidays", True))
+
+
+def main(argv=None):
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description="休日カレンダーの休日を表示します")
+    parser.add_argument("--year", type=int, default=date.today().year, help="表示する年")
+    parser.add_argument("--config", help="設定（JSON、advanced.calendar を使用）")
+    parser.add_argument("--file", action="append", default=[], help="読み込むICS・CSVファイル（複数指定できます）")
+    parser.add_argument("--all", action="store_true", help="週末も表示する")
+    args = parser.parse_args(argv)
+
+    config = {}
+    if args.config:
+        try:
+            with open(args.config, "r", encoding="utf-8") as f:
+                config = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"設定を読み込めませんでした: {e}")
+            return False
+    calendar = calendar_from_config(config)
+    if args.file:
+        calendar = WorkCalendar(calendar.files + args.file, calendar.weekend, calendar.national)
+
+    off_days = calendar.off_days(args.year)
+    print(f"{args.year}年の休日: {len(off_days)}日")
+    for day in off_days:
+        name = calendar.day_name(day)
+        if name or args.all:
+            print(f"  {day:%Y-%m-%d}（{WEEKDAY_NAMES[day.weekday()]}） {name or '週末'}")
+    return True
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(0 if main() else 1)